@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+# Compare the storage backends on the same workload: batched candle writes,
+# as the fetchers do, then range reads, as the transforms do. The candles
+# are written to a 'benchmark' exchange and deleted at the end.
+#
+# Usage: benchmark_storage.py [backend ...]    mongo and sqlite by default
+
+from orbbit.common.common import *
+
+import sys
+import time
+import tempfile
+
+
+
+candles    = 100000
+batch_size = 500
+reads      = 1000
+read_size  = 300
+
+timeframe = '1m'
+timeframe_millis = timeframe_to_millis(timeframe)
+
+backends = {'mongo':  lambda: mongo_storage(),
+            'sqlite': lambda: sqlite_storage(os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite')),
+           }
+
+names = sys.argv[1:] or list(backends.keys())
+
+start = 1500000000000
+new_documents = [candle_to_document([start + i * timeframe_millis, 100.0 + i % 7, 110.0, 90.0, 105.0, 1.0 + i % 3], timeframe) for i in range(candles)]
+read_starts = np.random.RandomState(8061).randint(0, candles - read_size, reads)
+
+for name in names:
+    backend = backends[name]()
+
+    began = time.time()
+    for i in range(0, candles, batch_size):
+        backend.write_ohlcv('benchmark', 'BTC/USDT', timeframe_millis, new_documents[i:i + batch_size])
+    write_seconds = time.time() - began
+
+    began = time.time()
+    read = 0
+    for read_start in read_starts:
+        from_millis = start + int(read_start) * timeframe_millis
+        read += len(backend.read_ohlcv('benchmark', 'BTC/USDT', timeframe, timeframe_millis, from_millis, from_millis + (read_size - 1) * timeframe_millis))
+    read_seconds = time.time() - began
+
+    backend.delete_ohlcv('benchmark', 'BTC/USDT', timeframe, timeframe_millis, start, start + candles * timeframe_millis)
+
+    print(name.ljust(8) + ' write ' + str(int(candles / write_seconds)).rjust(9) + ' candles/s'
+                        + '   read ' + str(int(read / read_seconds)).rjust(9) + ' candles/s'
+                        + ' (' + str(round(1000 * read_seconds / reads, 3)) + ' ms per ' + str(read_size) + ' candles)')
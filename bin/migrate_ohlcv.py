@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+
+# Convert the stored candles to compact bucket documents, a batch at a time.
+# Safe to run while the DataManager is fetching, and to run again if stopped.
+#
+# Usage: migrate_ohlcv.py [exchange_id symbol]    all the collections by default
+
+import orbbit as orb
+
+import sys
+
+
+
+if orb.DM.storage.name != 'mongo':
+    print('Nothing to migrate, the ' + orb.DM.storage.name + ' storage backend has a single layout.')
+    sys.exit()
+
+if len(sys.argv) > 2:
+    streams = [(sys.argv[1], sys.argv[2])]
+else:
+    streams = []
+    for collection_name in orb.DM.datamanager_db.list_collection_names():
+        if '_' in collection_name and orb.DM.datamanager_db[collection_name].find_one({'_id': {'$type': 'string'}, 'timeframe': {'$exists': True}}):
+            exchange_id, symbol_db = collection_name.split('_', 1)
+            streams.append((exchange_id, symbol_db.replace('_', '/')))
+
+for exchange_id, symbol in streams:
+    migrated = orb.DM.migrate_ohlcv(exchange_id, symbol)
+    print('Migrated ' + symbol + ' @ ' + exchange_id + ': ' + str(migrated))
@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+
+# Fetch worker: runs a share of the fetchers registered in the database.
+# Start as many as needed, in this or other hosts, they split the symbols
+# between them and take over the ones of workers that stop. The candles
+# they fetch reach the subscribers of the API process through the candle relay.
+#
+# Usage: start_fetch_worker.py [worker_id]
+#
+# Give each worker of a host its own worker_id, and the same one across
+# restarts, its spill file and checkpoints are kept under that id.
+
+import os
+import sys
+import time
+import signal
+
+
+
+if len(sys.argv) > 1:
+    os.environ['ORBBIT_WORKER_ID'] = sys.argv[1]
+
+import orbbit as orb
+
+# exit through atexit on SIGTERM too, so that the leases are released
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+orb.DM.start_fetch_worker()
+
+while True:
+    time.sleep(60)
@@ -2,9 +2,13 @@
 
 # Subscriber example:
 #   1- Tell the API which data stream you want to subscribe to.
-#   2- Listen for new data timely delivered in the returned IP, PORT
+#   2- Connect to the returned IP, PORT and subscribe to the stream_id.
+#      More streams can be subscribed to over the same connection.
+#   3- Listen for new data timely delivered, one framed message at a time
+#      (see orbbit/common/subscription_protocol.py).
 
 import orbbit as orb
+from   orbbit.common.subscription_protocol import *
 
 import socket
 import sys
@@ -33,20 +37,19 @@ response_dict = r.json()
 print(response_dict)
 
 #%% keep only the (IP, PORT) part of the response, the socket expects a tuple.
-subs = list( response_dict.values() )[0]
+stream_id, subs = list( response_dict.items() )[0]
 ip_port_tuple = tuple(subs)
 
 #%% connect socket
 time.sleep(5)
 try:
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    client = subscription_client(*ip_port_tuple) # compact binary messages if available, see SUBSCRIPTION_ENCODINGS
 except socket.error:
-    print('Failed to create socket')
+    print('Failed to connect')
     sys.exit()
 
-time.sleep(5)
-s.connect( ip_port_tuple )
-print('Connected')
+client.subscribe(stream_id)
+print('Connected, messages encoded as ' + client.encoding)
 
 #%% get new data as soon as it is generated
 date8061 = []
@@ -56,9 +59,12 @@ ema_slow = []
 beep_time = 0.5
 beeps = 6
 
-while 1:
-    reply = s.recv(4096) # waits here until new data is received
-    reply_dict = json.loads(reply.decode('ascii')) # turn string into data structure
+for message in client.messages(): # waits here until new data is received
+    if message['type'] != 'data':
+        print(message)
+        continue
+
+    reply_dict = message['data']
     print('Live new data:')
     print(reply_dict)
 
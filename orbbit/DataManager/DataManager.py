@@ -6,16 +6,31 @@ import math
 import time
 import threading
 import queue
+import collections
+import atexit
 import socket
+import concurrent.futures
 from   flask      import Flask, jsonify, abort, make_response, request
 from   flask_cors import CORS
 import asyncio
-import ccxt.async as ccxt
+import ccxt.async_support as ccxt_async
 import pymongo
 import json
 
 from   orbbit.common.common import *
 from   orbbit.DataManager.data_transform.data_transform import *
+from   orbbit.DataManager.gap_index.gap_index import *
+from   orbbit.DataManager.rollup.rollup import *
+from   orbbit.DataManager.timing_wheel.timing_wheel import *
+from   orbbit.DataManager.stream_ingest.stream_ingest import *
+from   orbbit.DataManager.fetch_lease.fetch_lease import *
+from   orbbit.DataManager.latency.latency import *
+from   orbbit.DataManager.ohlcv_cache.ohlcv_cache import *
+from   orbbit.DataManager.write_behind.write_behind import *
+from   orbbit.DataManager.transform_graph.transform_graph import *
+from   orbbit.DataManager.indicator_series.indicator_series import *
+from   orbbit.DataManager.subscription_server.subscription_server import *
+from   orbbit.DataManager.candle_relay.candle_relay import *
 
 
 #%%##########################################################################
@@ -38,9 +53,118 @@ print('ORBBIT DataManager on IP ' + ORBBIT_HOST)
 DATAMANAGER_API_IP = '0.0.0.0'
 DATAMANAGER_API_PORT = 5000
 
-# Subscriptions
-SUBS_PORT_BASE = 5100
-SUBS_PORT_LIMIT = 6000
+# Subscriptions, one port for every stream (see subscription_server)
+SUBS_PORT = 5100
+
+
+#%%--------------------------------------------------------------------------
+# FETCH ENGINE
+#----------------------------------------------------------------------------
+
+# Max requests in flight at the same time for each exchange
+FETCH_CONCURRENCY_DEFAULT = 4
+FETCH_CONCURRENCY = {'hitbtc2': 4,
+                     'bittrex': 2,
+                     'binance': 8,
+                     'kraken':  2,
+                    }
+
+# Seconds to wait before retrying a failed exchange query
+FETCH_RETRY_INTERVAL = 1
+
+# Milliseconds after a candle closes before asking the exchange for it
+FETCH_SETTLE_DELAY_DEFAULT = 2000
+FETCH_SETTLE_DELAY = {'hitbtc2': 2000,
+                      'bittrex': 5000,
+                      'binance': 1000,
+                      'kraken':  5000,
+                     }
+
+# Milliseconds between polls while a closed candle is not available yet
+FETCH_REPOLL_INTERVAL = 2000
+
+# Milliseconds after its close to stop waiting for the next candle to show
+# up, and take the last one as closed (e.g. no trades)
+FETCH_SETTLE_TIMEOUT = 10000
+
+# Resolution of the timing wheel that wakes up the streams, in milliseconds
+FETCH_WHEEL_TICK = 100
+
+# Milliseconds between database writes of the open candle of a push feed
+FEED_FLUSH_INTERVAL = 1000
+
+# Threads that run the (blocking) database writes for the fetch engine
+FETCH_DB_WORKERS = 4
+
+
+#%%--------------------------------------------------------------------------
+# TIMEFRAME ROLL-UP
+#----------------------------------------------------------------------------
+
+# Higher timeframes are built from the candles of the base one instead of
+# being fetched from the exchange.
+ROLLUP_ENABLED = True
+ROLLUP_BASE_TIMEFRAME = '1m'
+
+# Base candles read at a time to roll up the history of a higher timeframe
+ROLLUP_HISTORY_BATCH = 10000
+
+
+#%%--------------------------------------------------------------------------
+# OHLCV CACHE
+#----------------------------------------------------------------------------
+
+# Recent candles of each stream run by this process are kept in memory,
+# reads of that range do not reach the database.
+OHLCV_CACHE_ENABLED = True
+
+# Candles kept per stream
+OHLCV_CACHE_DEPTH_DEFAULT = 1000
+OHLCV_CACHE_DEPTH = {'1m': 1440,
+                    }
+
+
+#%%--------------------------------------------------------------------------
+# OHLCV ARCHIVE
+#----------------------------------------------------------------------------
+
+# Candles older than their archive age are moved from the database to
+# columnar files (see ohlcv_archive), for the streams run by this process.
+OHLCV_ARCHIVE_ENABLED = True
+
+# Milliseconds, None for the timeframes that are not archived. The 1m
+# candles are rolled up and deleted by retention (see OHLCV_RETENTION) long
+# before they would be archived, for them retention replaces archiving.
+OHLCV_ARCHIVE_AGE_DEFAULT = 90 * 24 * 60 * 60 * 1000
+OHLCV_ARCHIVE_AGE = {'1m': None,
+                    }
+
+# Seconds between archive rounds
+OHLCV_ARCHIVE_INTERVAL = 3600
+
+# The archived candles are only deleted from the database if no process in
+# another host reads them: a local database (sqlite), or an archive on shared
+# storage (see OHLCV_ARCHIVE_SHARED). Else they are copied, and the archive
+# only speeds up the reads of this host.
+OHLCV_ARCHIVE_DELETE = OHLCV_ARCHIVE_SHARED or STORAGE_BACKEND == 'sqlite'
+
+
+#%%--------------------------------------------------------------------------
+# OHLCV RETENTION
+#----------------------------------------------------------------------------
+
+# Candles older than their retention age are rolled up into a coarser
+# timeframe and deleted, for the streams run by this process. Retention runs
+# first: a timeframe with retention is not archived (see OHLCV_ARCHIVE_AGE),
+# its candles are deleted before reaching the archive age.
+OHLCV_RETENTION_ENABLED = True
+
+# {'timeframe': (milliseconds, rolled up timeframe), ... }
+OHLCV_RETENTION = {'1m': (14 * 24 * 60 * 60 * 1000, '1h'),
+                  }
+
+# Seconds between retention rounds
+OHLCV_RETENTION_INTERVAL = 3600
 
 
 
@@ -53,6 +177,35 @@ fetching_symbols = get_database_info('datamanager', 'fetching_symbols')
 
 
 
+def check_ohlcv_indexes(fetching_symbols):
+    """ Create the missing indexes of the fetched streams, and report the
+    ones whose range queries are not served by an index.
+
+    Returns:
+        problems (list) of str, see storage_backend.check_ohlcv.
+
+    """
+    problems = []
+    now = int(current_millis())
+    for exchange_id in fetching_symbols:
+        for symbol in fetching_symbols[exchange_id]:
+            for timeframe in fetching_symbols[exchange_id][symbol]:
+                timeframe_millis = timeframe_to_millis(timeframe)
+                try:
+                    problems += storage.check_ohlcv(exchange_id, symbol, timeframe, timeframe_millis, now - 1000 * timeframe_millis, now)
+                except STORAGE_ERRORS as ex:
+                    problems.append(exchange_id + '_' + symbol + ' ' + timeframe + ' query plan failed: ' + str(ex))
+
+    for problem in problems:
+        print('ERR index ' + problem)
+
+    return problems
+
+
+ohlcv_index_problems = check_ohlcv_indexes(fetching_symbols)
+
+
+
 
 #%%##########################################################################
 #                              EXCHANGES SETUP                              #
@@ -64,6 +217,16 @@ exchanges = {new_exchange: exchange_id_to_exchange(new_exchange) for new_exchang
 
 
 
+def exchange_id_to_async_exchange(exchange_id):
+    """ Same as exchange_id_to_exchange, for the asyncio fetch engine.
+    """
+    if exchange_id in typical_exchanges:
+        return getattr(ccxt_async, exchange_id)({'verbose': False})
+    else:
+        return -1
+
+
+
 
 #############################################################################
 #                             DATAMANAGER TASKS                             #
@@ -76,6 +239,9 @@ exchanges = {new_exchange: exchange_id_to_exchange(new_exchange) for new_exchang
 def start_fetch():
     """ Start all the fetchers which are registered in the database.
 
+    Every symbol/timeframe becomes a task of the fetch engine. Timeframes that
+    can be rolled up are built from ROLLUP_BASE_TIMEFRAME candles instead.
+
     Args:
 
     Returns:
@@ -83,161 +249,904 @@ def start_fetch():
 
     """
 
+    start_fetch_engine()
+
     fetching_symbols = get_database_info('datamanager', 'fetching_symbols')
     for exchange_id in fetching_symbols:
         for symbol in fetching_symbols[exchange_id]:
             for timeframe in fetching_symbols[exchange_id][symbol]:
                 params = {'symbol': symbol, 'exchange': exchange_id, 'timeframe': timeframe}
-                new_fetch_thread_ohlcv = fetch_thread_ohlcv(params)
-                new_fetch_thread_ohlcv.start()
+                ohlcv_fetch_engine.add_stream(params)
 
     return jsonify({'fetching_symbols': get_database_info('datamanager', 'fetching_symbols')})
 
 
 
-class fetch_thread_ohlcv(threading.Thread):
-    """ Thread that fetches data for a given symbol/timeframe.
+def start_fetch_engine():
+    """ Start the fetch engine event loop if it is not running yet.
+    """
+    if not ohlcv_fetch_engine.is_alive():
+        ohlcv_fetch_engine.start()
+        ohlcv_fetch_engine.started.wait()
 
-    On start, it will try to fill missing data points.
 
-    Args:
-        params (dict)
-            symbol (str)
-            timeframe (str)
 
-    """
+class fetch_engine(threading.Thread):
+    """ Event loop that fetches data for every symbol/timeframe.
 
-    def __init__(self, params):
-        threading.Thread.__init__(self)
-        self.params = params
+    Each stream is an asyncio task instead of an OS thread, so one loop can
+    serve thousands of them. Requests to each exchange are capped by
+    FETCH_CONCURRENCY. Candles are written by the write-behind queue
+    (ohlcv_writer), and the blocking database reads run in a small thread
+    pool, so the loop never waits for the database.
+
+    Streams sleep in a timing wheel until their candle closes (plus the
+    FETCH_SETTLE_DELAY of the exchange), and only poll again sooner while
+    the closed candle is not available yet.
+
+    On stream start, it will try to fill missing data points.
 
+    Streams of timeframes that can be rolled up are not fetched, they are
+    built from the ROLLUP_BASE_TIMEFRAME stream of the same symbol, which is
+    started if needed.
 
-        self.exchange_id = params['exchange']
-        self.exchange = exchanges[self.exchange_id]
+    """
 
-        self.stream_id = res_params_to_stream_id('ohlcv', params)
-        self.symbol_db = self.params['symbol'].replace('/', '_')
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True)
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
 
-        self.fetch_interval = int(timeframe_to_millis(self.params['timeframe'])*0.9)
-        self.retry_on_xchng_err_interval = 1
+        self.db_executor = concurrent.futures.ThreadPoolExecutor(max_workers=FETCH_DB_WORKERS)
 
-        self.last_fetch = 0
+        self.exchanges = {}  # dict {'exchange_id': ccxt_async exchange, ... }
+        self.semaphores = {} # dict {'exchange_id': asyncio.Semaphore, ... }
+        self.tasks = {}      # dict {'stream_id': asyncio.Task, ... }
+        self.params = {}     # dict {'stream_id': params, ... }
+        self.filled = {}     # dict {'stream_id': asyncio.Event set after the first fill, ... }
+        self.rollups = {}    # dict {'base_stream_id': {'timeframe': candle_rollup, ... }, ... }
+        self.last_sent = {}  # dict {'stream_id': date8061 of the last candle published, ... }
+        self.feed_stats = {} # dict {'stream_id': {'messages': n, 'last_lag': millis, ... }, ... }
+        self.caches = {}     # dict {'stream_id': ohlcv_ring, ... }
 
-        collection_name = self.exchange_id + '_' + self.symbol_db
-        self.collection = datamanager_db[collection_name]
+        self.wheel = timing_wheel(FETCH_WHEEL_TICK, start_millis=current_millis())
 
 
     def run(self):
-        # print('Started fetcher for ' + self.params['symbol'] + ' ' + self.params['timeframe'])
+        asyncio.set_event_loop(self.loop)
+        check_ohlcv_tiers()
+        self.loop.create_task(self.run_timing_wheel())
+        if OHLCV_ARCHIVE_ENABLED:
+            self.loop.create_task(self.archive_streams())
+        if OHLCV_RETENTION_ENABLED:
+            self.loop.create_task(self.retain_streams())
+        self.loop.call_soon(self.started.set)
+        self.loop.run_forever()
+
+
+    async def run_timing_wheel(self):
+        while True:
+            for waiter in self.wheel.advance(current_millis()):
+                if not waiter.done():
+                    waiter.set_result(None)
+            await asyncio.sleep(FETCH_WHEEL_TICK / 1000)
+
+
+    async def archive_streams(self):
+        """ Every OHLCV_ARCHIVE_INTERVAL, move the old candles of the streams
+        run by this process to the archive.
+        """
+        while True:
+            await asyncio.sleep(OHLCV_ARCHIVE_INTERVAL)
+
+            for stream_id, params in list(self.params.items()):
+                timeframe = params['timeframe']
+                archive_age = OHLCV_ARCHIVE_AGE.get(timeframe, OHLCV_ARCHIVE_AGE_DEFAULT)
+                if archive_age is None:
+                    continue
+
+                before_millis = current_millis() - archive_age
+                try:
+                    archived = await self.run_db(archive_ohlcv, params['symbol'], params['exchange'], timeframe, before_millis, 100, OHLCV_ARCHIVE_DELETE)
+                    if archived: print('Archived ' + str(archived) + ' candles of ' + stream_id)
+                except (OSError,) + STORAGE_ERRORS as ex:
+                    print('ERR archive ' + stream_id + ': ' + repr(ex))
+
+
+    async def retain_streams(self):
+        """ Every OHLCV_RETENTION_INTERVAL, downsample the old candles of the
+        streams run by this process, see downsample_ohlcv.
+
+        One batch is run at a time, so the live writes keep their share of
+        the database workers.
+        """
+        while True:
+            await asyncio.sleep(OHLCV_RETENTION_INTERVAL)
+
+            for stream_id, params in list(self.params.items()):
+                timeframe = params['timeframe']
+                if not timeframe in OHLCV_RETENTION:
+                    continue
+
+                retention_millis, rollup_timeframe = OHLCV_RETENTION[timeframe]
+                before_millis = current_millis() - retention_millis
+                try:
+                    pruned = 0
+                    while stream_id in self.params:
+                        batch = await self.run_db(downsample_ohlcv, params['symbol'], params['exchange'], timeframe, rollup_timeframe, before_millis)
+                        if batch is None:
+                            break
+                        pruned += batch
+                    if pruned: print('Downsampled ' + str(pruned) + ' candles of ' + stream_id + ' to ' + rollup_timeframe)
+                except STORAGE_ERRORS as ex:
+                    print('ERR retention ' + stream_id + ': ' + repr(ex))
+
+
+    async def sleep_until(self, deadline_millis):
+        """ Wait until deadline_millis (rounded up to FETCH_WHEEL_TICK).
+        """
+        waiter = self.loop.create_future()
+        self.wheel.schedule(deadline_millis, waiter)
+        await waiter
+
+
+    def add_stream(self, params):
+        """ Start fetching a symbol/timeframe. Can be called from any thread.
+
+        Args:
+            params (dict)
+                symbol (str)
+                exchange (str)
+                timeframe (str)
+
+        Returns:
+            stream_id (str) of the 'ohlcv' stream.
+
+        """
+        stream_id = res_params_to_stream_id('ohlcv', params)
+        self.loop.call_soon_threadsafe(self._add_stream, stream_id, dict(params))
+        return stream_id
+
+
+    def _add_stream(self, stream_id, params):
+        if stream_id in self.tasks:
+            return
+
+        if is_rollup_timeframe(params['timeframe']):
+            base_params = dict(params, timeframe=ROLLUP_BASE_TIMEFRAME)
+            base_stream_id = res_params_to_stream_id('ohlcv', base_params)
+            self._add_stream(base_stream_id, base_params)
+            stream_task = self.rollup_ohlcv(params, base_stream_id)
+        else:
+            self.filled[stream_id] = asyncio.Event()
+            stream_task = self.fetch_ohlcv(params)
+
+        self.params[stream_id] = params
+        self.tasks[stream_id] = self.loop.create_task(stream_task)
+        self.tasks[stream_id].add_done_callback(self._stream_done)
+
+
+    def add_feed(self, params, host, port):
+        """ Build a stream from a push feed instead of polling the exchange.
+        Can be called from any thread.
+
+        Args:
+            params (dict) see add_stream
+            host, port: feed address, e.g. a replay_server
+
+        Returns:
+            stream_id (str) of the 'ohlcv' stream.
+
+        """
+        stream_id = res_params_to_stream_id('ohlcv', params)
+        self.loop.call_soon_threadsafe(self._add_feed, stream_id, dict(params), host, port)
+        return stream_id
+
+
+    def _add_feed(self, stream_id, params, host, port):
+        if stream_id in self.tasks:
+            self.tasks[stream_id].cancel()
+
+        self.filled.setdefault(stream_id, asyncio.Event()).set()
+        self.params[stream_id] = params
+        self.tasks[stream_id] = self.loop.create_task(self.ingest_ohlcv(params, host, port))
+        self.tasks[stream_id].add_done_callback(self._stream_done)
+
+
+    def remove_streams(self, exchange_id, symbol):
+        """ Stop every stream of symbol @ exchange_id. Can be called from any thread.
+        """
+        self.loop.call_soon_threadsafe(self._remove_streams, exchange_id, symbol)
+
+
+    def _remove_streams(self, exchange_id, symbol):
+        for stream_id, params in list(self.params.items()):
+            if params['exchange'] == exchange_id and params['symbol'] == symbol:
+                self.tasks.pop(stream_id).cancel()
+                del self.params[stream_id]
+                self.filled.pop(stream_id, None)
+                self.rollups.pop(stream_id, None)
+                self.last_sent.pop(stream_id, None)
+                self.caches.pop(stream_id, None)
+
+
+    def _stream_done(self, task):
+        if not task.cancelled() and task.exception():
+            print('ERR fetch engine task stopped: ' + repr(task.exception()))
+
+
+    def get_exchange(self, exchange_id):
+        """ Async exchanges are created inside the loop, one per exchange_id.
+        """
+        if not exchange_id in self.exchanges:
+            self.exchanges[exchange_id] = exchange_id_to_async_exchange(exchange_id)
+            self.semaphores[exchange_id] = asyncio.Semaphore(FETCH_CONCURRENCY.get(exchange_id, FETCH_CONCURRENCY_DEFAULT))
+        return self.exchanges[exchange_id]
+
+
+    async def run_db(self, func, *args):
+        return await self.loop.run_in_executor(self.db_executor, func, *args)
+
+
+    async def flush_writes(self, sequence):
+        """ Wait for the queued candles up to 'sequence' (see queue_ohlcv_documents),
+        outside of the database workers, that do not wait for the writer.
+
+        Returns:
+            True if they are in the database.
+
+        """
+        if sequence is None:
+            return True
+        return await self.loop.run_in_executor(None, ohlcv_writer.flush, sequence)
+
+
+    async def load_cache(self, params):
+        """ Start the ohlcv cache of a stream with its stored candles.
+
+        The ring is registered before reading the database, so the candles
+        written meanwhile are not lost.
+        """
+        if not OHLCV_CACHE_ENABLED:
+            return
+
+        timeframe = params['timeframe']
+        timeframe_millis = timeframe_to_millis(timeframe)
+        stream_id = res_params_to_stream_id('ohlcv', params)
+
+        ring = ohlcv_ring(timeframe_millis, OHLCV_CACHE_DEPTH.get(timeframe, OHLCV_CACHE_DEPTH_DEFAULT))
+        self.caches[stream_id] = ring
+
+        now = current_millis()
+        from_millis = candle_bucket(now, timeframe_millis) - (ring.depth - 1) * timeframe_millis
+        ohlcv = await self.run_db(get_db_candles, params['symbol'], params['exchange'], timeframe, from_millis - 1, now + 10e3)
+        ring.load(ohlcv, from_millis)
+
+
+    async def exchange_fetch_ohlcv(self, exchange, symbol, timeframe, since, limit=None, priority=PRIORITY_LIVE):
+        """ fetch_ohlcv under the exchange rate governor and concurrency cap,
+        retried until it succeeds.
+        """
+        governor = get_rate_governor(exchange)
+        while True:
+            await governor.acquire_async(priority)
+            async with self.semaphores[exchange.id]:
+                try:
+                    return await exchange.fetch_ohlcv(symbol_os(symbol, exchange.id), timeframe, since, limit)
+                except RATE_LIMIT_ERRORS:
+                    governor.backoff()
+                except Exception:
+                    print('ERR ' + exchange.id + ' query for ' + symbol +' '+ timeframe)
+            await asyncio.sleep(FETCH_RETRY_INTERVAL)
+
+
+    async def fill_ohlcv(self, symbol, exchange_id, timeframe, from_millis=0):
+        """ Attempt to fill gaps in the database by fetching many candles at once.
+        It is limited by how back in time the exchange API provides data.
+
+        Only the gaps found by update_gap_index are requested.
+
+        Returns:
+            filled: candles fetched for the gaps.
+
+        """
+        exchange = self.get_exchange(exchange_id)
+        data_limit = min([1000, exchange.rateLimit]) - 1
+
+        gaps = await self.run_db(update_gap_index, symbol, exchange_id, timeframe, from_millis)
+
+        filled = 0
+        sequence = None
+        for since, limit in gap_requests(gaps, timeframe_to_millis(timeframe), data_limit):
+            ohlcv = await self.exchange_fetch_ohlcv(exchange, symbol, timeframe, since, limit, PRIORITY_BACKFILL)
+            new_documents = [candle_to_document(candle, timeframe) for candle in filter_missing(ohlcv, gaps)]
+            sequence = queue_ohlcv_documents(exchange_id, symbol, new_documents) or sequence
+            filled += len(new_documents)
+
+        # the gap index reads the database, and so do the roll-ups once filled
+        written = await self.flush_writes(sequence)
+
+        if gaps and written:
+            await self.run_db(mark_unfillable_gaps, symbol, exchange_id, timeframe, from_millis)
+
+        return filled
+
+
+    async def fetch_ohlcv(self, params):
+        symbol      = params['symbol']
+        exchange_id = params['exchange']
+        timeframe   = params['timeframe']
+
+        exchange = self.get_exchange(exchange_id)
+        stream_id = res_params_to_stream_id('ohlcv', params)
+
+        timeframe_millis = timeframe_to_millis(timeframe)
+        settle_delay = FETCH_SETTLE_DELAY.get(exchange_id, FETCH_SETTLE_DELAY_DEFAULT)
+
+        final_until = 0
 
         # first, try to fill missing data
         now = current_millis()
-        nxt_fetch = now - (now % timeframe_to_millis(self.params['timeframe']))
+        nxt_fetch = now - (now % timeframe_millis)
 
-        data_limit = min([1000, self.exchange.rateLimit]) - 1
-        fill_from = int(now - timeframe_to_millis(self.params['timeframe']) * data_limit)
+        data_limit = min([1000, exchange.rateLimit]) - 1
+        fill_from = int(now - timeframe_millis * data_limit)
 
-        filled = fill_ohlcv(self.params['symbol'], self.params['exchange'], self.params['timeframe'], fill_from)
-        if filled: print('Filled ' + str(filled) + ' missing entries in ' + self.params['symbol'] +' @ '+ self.params['exchange'] +' '+ self.params['timeframe'])
+        filled = await self.fill_ohlcv(symbol, exchange_id, timeframe, fill_from)
+        if filled: print('Filled ' + str(filled) + ' missing entries in ' + symbol +' @ '+ exchange_id +' '+ timeframe)
+        self.filled[stream_id].set()
+        await self.load_cache(params)
 
         # keep asking for candles
-        while 1:
-            fetch_from_API_success = 0
-            while not(fetch_from_API_success):
-                try:
-                    # print('Exchange query for ' + self.params['symbol'] +' '+ self.params['timeframe'])
-                    ohlcv = self.exchange.fetch_ohlcv(symbol_os(self.params['symbol'], self.exchange_id), self.params['timeframe'], int(nxt_fetch))
-                    fetch_from_API_success = 1
-                except:
-                    print('ERR ' + self.exchange_id + ' query for ' + self.params['symbol'] +' '+ self.params['timeframe'])
-                    time.sleep(self.retry_on_xchng_err_interval)
+        while True:
+            call_start = current_millis()
+            ohlcv = await self.exchange_fetch_ohlcv(exchange, symbol, timeframe, int(nxt_fetch))
+
+            now = current_millis()
+            stream_latency.record(stream_id, 'exchange_call', now - call_start)
+            current_candle = candle_bucket(now, timeframe_millis)
 
             if ohlcv:
-                for candle in ohlcv:
-                    new_document = candle_to_document(candle, self.params['timeframe'])
+                newest = max([candle[0] for candle in ohlcv])
 
-                    # send to subscribers
-                    new_data = {'date8061': new_document['date8061'], 'ohlcv': new_document['ohlcv']}
-                    send_to_subscribers(self.stream_id, new_data)
+                # candles before the newest one are closed, the newest one too
+                # if the next candle did not show up in time
+                final_until = max(final_until, newest)
+                if now >= newest + timeframe_millis + FETCH_SETTLE_TIMEOUT:
+                    final_until = newest + timeframe_millis
 
-                    # save in database
-                    try:
-                        self.collection.insert_one(new_document)
-                    except pymongo.errors.DuplicateKeyError as e:
-                        # print("Duplicate value, skipping.")
-                        pass
+                await self.new_candles(params, ohlcv, final_until, now)
 
-                    if new_document['date8061'] > self.last_fetch:
-                        self.last_fetch = new_document['date8061']
+                # the newest candle may still be open, ask for it again
+                nxt_fetch = newest
 
-                nxt_fetch = self.last_fetch + timeframe_to_millis(self.params['timeframe'])
-                time.sleep( self.fetch_interval / 1000 )
+            # wait for the current candle to close, or poll again soon if the
+            # previous one is not available yet
+            if final_until >= current_candle or now >= current_candle + FETCH_SETTLE_TIMEOUT:
+                await self.sleep_until(current_candle + timeframe_millis + settle_delay)
+            else:
+                await self.sleep_until(now + FETCH_REPOLL_INTERVAL)
 
 
+    async def ingest_ohlcv(self, params, host, port):
+        """ Build the candles of a stream from a push feed (see stream_ingest).
 
-def fill_ohlcv(symbol, exchange_id, timeframe, from_millis=0):
-    """ Attempt to fill gaps in the DataManager database by fetching many data at once.
-        It is limited by how back in time the exchange API provides data.
+        The open candle is written at most every FEED_FLUSH_INTERVAL, closed
+        candles right away.
+        """
+        symbol = params['symbol']
+        stream_id = res_params_to_stream_id('ohlcv', params)
+
+        stats = self.feed_stats.setdefault(stream_id, {'messages': 0, 'last_lag': 0, 'max_lag': 0})
+        await self.load_cache(params)
+
+        while True:
+            builder = feed_candle_builder(timeframe_to_millis(params['timeframe']))
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                writer.write(feed_message({'type': 'subscribe', 'symbol': symbol, 'timeframe': params['timeframe']}))
+                print('Feed for ' + stream_id + ' connected to ' + host + ':' + str(port))
+
+                last_flush = 0
+                message = await read_feed_message(reader)
+                while message is not None:
+                    if message.get('type') == 'error':
+                        print('ERR feed for ' + stream_id + ': ' + str(message.get('error')))
+
+                    builder.add_message(message)
+
+                    stats['messages'] += 1
+                    if 'sent' in message:
+                        stats['last_lag'] = current_millis() - message['sent']
+                        stats['max_lag'] = max(stats['max_lag'], stats['last_lag'])
+
+                    if builder.closed or current_millis() - last_flush >= FEED_FLUSH_INTERVAL:
+                        await self.new_candles(params, *builder.pop())
+                        last_flush = current_millis()
+
+                    message = await read_feed_message(reader)
+
+                writer.close()
+                print('Feed for ' + stream_id + ' closed')
+
+            except (OSError, ValueError) as ex:
+                print('ERR feed for ' + stream_id + ': ' + repr(ex))
+
+            # the open candle is only stored, it is published once the feed
+            # is back and it closes
+            await self.new_candles(params, *builder.pop())
+            await asyncio.sleep(FETCH_RETRY_INTERVAL)
+
+
+    async def new_candles(self, params, ohlcv, final_until, received=None):
+        """ Publish, store and roll up new candles of a stream, polled or pushed.
+
+        Args:
+            params (dict) of the stream
+            ohlcv (list) candles as output by ccxt, the last one may be open
+            final_until (int) millis, candles that end before are closed
+            received (int) millis, when the candles got here. Now by default.
+
+        """
+        if not ohlcv:
+            return
+
+        timeframe = params['timeframe']
+        timeframe_millis = timeframe_to_millis(timeframe)
+        stream_id = res_params_to_stream_id('ohlcv', params)
+
+        if received is None:
+            received = current_millis()
+
+        new_documents = [candle_to_document(candle, timeframe) for candle in ohlcv]
+
+        # send to subscribers once each candle is closed
+        closes = []
+        for new_document in new_documents:
+            if self.last_sent.get(stream_id, 0) < new_document['date8061'] and new_document['date8061'] + timeframe_millis <= final_until:
+                new_data = {'date8061': new_document['date8061'], 'ohlcv': new_document['ohlcv']}
+                publish_fetched(stream_id, new_data)
+                self.last_sent[stream_id] = new_document['date8061']
+
+                closes.append(new_document['date8061'] + timeframe_millis)
+                stream_latency.record_close(stream_id, 'fetched', closes[-1], received)
+                stream_latency.record_close(stream_id, 'enqueued', closes[-1])
+
+        # save in database, the open candle is updated until it closes
+        queue_ohlcv_documents(params['exchange'], params['symbol'], new_documents, lambda: record_closes(stream_id, 'stored', closes))
+
+        if stream_id in self.caches:
+            self.caches[stream_id].update(ohlcv)
+
+        if stream_id in self.rollups:
+            await self.update_rollups(params, ohlcv, final_until)
+
+
+    async def rollup_ohlcv(self, params, base_stream_id):
+        """ Build the candles of params['timeframe'] from the base stream.
+
+        First, every stored base candle is rolled up to fill the history,
+        and the open candle is started with the base candles it already has.
+        Then every poll of the base stream updates it, see update_rollups.
+        """
+        symbol      = params['symbol']
+        exchange_id = params['exchange']
+        timeframe   = params['timeframe']
+
+        timeframe_millis = timeframe_to_millis(timeframe)
+
+        rollup = candle_rollup(timeframe_millis)
+        self.rollups.setdefault(base_stream_id, {})[timeframe] = rollup
+
+        await self.filled[base_stream_id].wait()
+
+        now = current_millis()
+        open_bucket = candle_bucket(now, timeframe_millis)
+
+        # the open candle is left to the rollup, with the parts it did not get yet
+        for candle in await self.run_db(get_db_candles, symbol, exchange_id, ROLLUP_BASE_TIMEFRAME, open_bucket - 1, now + 10e3):
+            rollup.update(candle, overwrite=False)
+
+        # history, from the oldest stored base candle
+        base_millis = timeframe_to_millis(ROLLUP_BASE_TIMEFRAME)
+        oldest = await self.run_db(storage.oldest_ohlcv, exchange_id, symbol, ROLLUP_BASE_TIMEFRAME, base_millis)
+        from_millis = open_bucket if oldest is None else candle_bucket(oldest, timeframe_millis)
+
+        batch_millis = max(1, (ROLLUP_HISTORY_BATCH * base_millis) // timeframe_millis) * timeframe_millis
+        rolled = 0
+        sequence = None
+        while from_millis < open_bucket:
+            to_millis = min(from_millis + batch_millis, open_bucket)
+            base_candles = await self.run_db(get_db_candles, symbol, exchange_id, ROLLUP_BASE_TIMEFRAME, from_millis - 1, to_millis)
+            history = rollup_candles(base_candles, timeframe_millis)
+
+            # the oldest one is partial if the base candles before were pruned
+            if rolled == 0 and history and base_candles[0][0] > history[0][0]:
+                history = history[1:]
+
+            new_documents = [candle_to_document(candle, timeframe) for candle in history]
+            sequence = queue_ohlcv_documents(exchange_id, symbol, new_documents) or sequence
+            rolled += len(new_documents)
+            from_millis = to_millis
+
+        await self.flush_writes(sequence)
+        if rolled: print('Rolled up ' + str(rolled) + ' candles in ' + symbol +' @ '+ exchange_id +' '+ timeframe)
+
+        await self.load_cache(params)
+
+
+    async def update_rollups(self, base_params, ohlcv, final_until):
+        """ Feed new base candles to the higher timeframes built from them.
+
+        Args:
+            base_params (dict) of the base stream
+            ohlcv (list) candles from the last poll
+            final_until (int) millis, base candles that end before are closed
+
+        """
+        base_stream_id = res_params_to_stream_id('ohlcv', base_params)
+
+        for timeframe, rollup in list(self.rollups[base_stream_id].items()):
+            stream_id = res_params_to_stream_id('ohlcv', dict(base_params, timeframe=timeframe))
+
+            for candle in ohlcv:
+                rollup.update(candle)
+
+            closed = rollup.pop_closed(final_until)
+            new_documents = [candle_to_document(candle, timeframe) for candle in closed]
+
+            for new_document in new_documents:
+                new_data = {'date8061': new_document['date8061'], 'ohlcv': new_document['ohlcv']}
+                publish_fetched(stream_id, new_data)
+                stream_latency.record_close(stream_id, 'enqueued', new_document['date8061'] + rollup.timeframe_millis)
+
+            closes = [new_document['date8061'] + rollup.timeframe_millis for new_document in new_documents]
+
+            current = rollup.current()
+            if current:
+                new_documents.append(candle_to_document(current, timeframe))
+
+            queue_ohlcv_documents(base_params['exchange'], base_params['symbol'], new_documents, lambda stream_id=stream_id, closes=closes: record_closes(stream_id, 'stored', closes))
+
+            if stream_id in self.caches:
+                self.caches[stream_id].update(closed + ([current] if current else []))
+
+
+
+ohlcv_fetch_engine = fetch_engine()
+
+# latency of each stage of the pipeline, from candle close to subscriber
+stream_latency = pipeline_latency()
+
+# candle writes of the fetchers, see write_behind
+ohlcv_writer = write_behind(storage.write_ohlcv, STORAGE_UNAVAILABLE_ERRORS)
+ohlcv_writer.start()
+
+
+
+def record_closes(stream_id, stage, closes):
+    for close_millis in closes:
+        stream_latency.record_close(stream_id, stage, close_millis)
+
+
+
+#%%--------------------------------------------------------------------------
+# FETCH WORKERS
+#----------------------------------------------------------------------------
+
+def fetch_units(fetching_symbols):
+    """ Lease units, one per symbol @ exchange so that the rolled up
+    timeframes run in the same worker as their base stream.
+
+    Returns:
+        units (dict) {'unit': (exchange_id, symbol), ... }
+
+    """
+    units = {}
+    for exchange_id in fetching_symbols:
+        for symbol in fetching_symbols[exchange_id]:
+            units[exchange_id + '_' + symbol] = (exchange_id, symbol)
+    return units
+
+
+
+class fetch_worker_thread(threading.Thread):
+    """ Run the share of fetching_symbols leased to this process.
+
+    Any number of workers, in one or many hosts, split the fetchers between
+    them through the 'datamanager' database (see fetch_leases), and take
+    over the ones of dead workers. The candles they publish reach the
+    subscribers of the other processes through the candle relay.
 
     Args:
-        symbol, timeframe, from_millis: See fetch_thread_ohlcv.
+        worker_id (str) unique among workers, host and pid by default.
+
+    """
+
+    def __init__(self, worker_id=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.leases = fetch_leases(datamanager_db, worker_id)
+        self.running = set()
+        self.last_round = current_millis()
+
+        self.stopped = threading.Event()
+        self.round_lock = threading.Lock()
+
+
+    def stop(self):
+        """ Give up every lease now, so the other workers take over without
+        waiting for them to expire. Called when the process exits.
+        """
+        with self.round_lock:
+            self.stopped.set()
+            try:
+                self.leases.release_all()
+                print('Fetch worker ' + self.leases.worker_id + ' stopped, leases released.')
+            except pymongo.errors.PyMongoError as ex:
+                print('ERR fetch worker ' + self.leases.worker_id + ' stop: ' + repr(ex))
+
+
+    def run(self):
+        print('Fetch worker ' + self.leases.worker_id + ' started.')
+        while not self.stopped.is_set():
+            with self.round_lock:
+                if not self.stopped.is_set():
+                    self.lease_round()
+            self.stopped.wait(LEASE_RENEW_INTERVAL)
+
+
+    def lease_round(self):
+        """ Renew the leases, then start and stop the streams of the units won and lost.
+        """
+        try:
+            fetching_symbols = get_database_info('datamanager', 'fetching_symbols')
+            units = fetch_units(fetching_symbols)
+
+            owned = self.leases.balance(sorted(units), int(current_millis()))
+            self.last_round = current_millis()
+
+            for unit in self.running - owned:
+                ohlcv_fetch_engine.remove_streams(*units.get(unit, unit.split('_', 1)))
+
+            # every round, timeframes may have been added to a running unit
+            for unit in owned:
+                exchange_id, symbol = units[unit]
+                for timeframe in fetching_symbols[exchange_id][symbol]:
+                    ohlcv_fetch_engine.add_stream({'symbol': symbol, 'exchange': exchange_id, 'timeframe': timeframe})
+
+            if owned != self.running:
+                print('Fetch worker ' + self.leases.worker_id + ' runs ' + str(len(owned)) + ' of ' + str(len(units)) + ' symbols.')
+            self.running = owned
+
+        except pymongo.errors.PyMongoError as ex:
+            print('ERR fetch worker ' + self.leases.worker_id + ': ' + repr(ex))
+
+            # without the database our leases expire, let the others take over
+            if current_millis() - self.last_round > LEASE_TTL:
+                for unit in self.running:
+                    ohlcv_fetch_engine.remove_streams(*unit.split('_', 1))
+                self.running = set()
+
+
+
+fetch_worker = None
+
+def start_fetch_worker(worker_id=None):
+    """ Fetch only the symbols leased to this process, see fetch_worker_thread.
 
     Returns:
-        filled: gaps successfully filled.
-        missing: gaps that could not be filled.
+        worker_id (str), None if the storage backend is not MongoDB.
+
+    """
+    global fetch_worker
+
+    if storage.name != 'mongo':
+        print('ERR fetch workers share their leases in MongoDB, not available with the ' + storage.name + ' storage backend.')
+        return None
+
+    start_fetch_engine()
+    if fetch_worker is None:
+        fetch_worker = fetch_worker_thread(worker_id or ORBBIT_WORKER_ID)
+        fetch_worker.start()
+        atexit.register(fetch_worker.stop)
+
+    return fetch_worker.leases.worker_id
+
+
+
+def get_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis):
+    """ Same as get_db_ohlcv, the recent part of the range is read from the
+    ohlcv cache of the stream if it is run by this process.
 
     Example:
-        symbol = 'BTC/USDT'
-        exchange_id = 'binance'
-        timeframe = '1m'
-        from_millis = current_millis() - timeframe_to_millis(timeframe) * 1000
-        fill_ohlcv(symbol, exchange_id, timeframe, from_millis)
+        ohlcv = get_ohlcv('BTC/USDT', 'hitbtc2', '1m', current_millis() - 100 * 60e3, current_millis())
 
     """
-    retry_on_xchng_err_interval = 1
+    stream_id = res_params_to_stream_id('ohlcv', {'symbol': symbol, 'exchange': exchange_id, 'timeframe': timeframe})
+    ring = ohlcv_fetch_engine.caches.get(stream_id)
+    oldest = ring.oldest() if ring else None
 
-    exchange = exchanges[exchange_id]
-    data_limit = min([1000, exchange.rateLimit]) - 1
+    if oldest is None or to_millis <= oldest:
+        return get_db_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis)
 
-    symbol_db = symbol.replace('/', '_')
-    collection_name = exchange_id + '_' + symbol_db
-    collection = datamanager_db[collection_name]
+    documents = get_db_ohlcv(symbol, exchange_id, timeframe, from_millis, oldest) if from_millis < oldest else []
 
+    date8061, values = ring.read(from_millis, to_millis)
+    inside = (date8061 > from_millis) & (date8061 < to_millis)
+    return documents + ring_to_documents(date8061[inside], values[inside], timeframe)
 
-    # calculate number of requests needed
-    fill_parts = math.ceil(((current_millis() - from_millis) / timeframe_to_millis(timeframe)) / data_limit)
 
-    from_parts = [from_millis + i * data_limit for i in range(fill_parts)]
 
-    filled = 0
+def is_rollup_timeframe(timeframe):
+    """ Whether 'timeframe' candles are built from ROLLUP_BASE_TIMEFRAME candles.
 
-    for from_part in from_parts:
-        fetch_from_API_success = 0
-        while not fetch_from_API_success:
-            try:
-                # print('Filling ' + symbol + ' ' + timeframe + ' from ' + str(from_part))
-                ohlcv = exchange.fetch_ohlcv(symbol_os(symbol, exchange_id), timeframe, since=from_part, limit=data_limit)
-                fetch_from_API_success = 1
-            except:
-                print('ERR Exchange - Fill OHLCV ' + symbol + ' @ ' + exchange_id + ' ' + timeframe + ' from ' + str(from_part) + ' n ' + str(data_limit))
-                time.sleep(retry_on_xchng_err_interval)
+    Weeks and months are always fetched, they do not start at a multiple of
+    their length since epoch.
+    """
+    if not ROLLUP_ENABLED or timeframe == ROLLUP_BASE_TIMEFRAME or timeframe[-1] in ('w', 'M'):
+        return False
+
+    timeframe_millis = timeframe_to_millis(timeframe)
+    base_millis = timeframe_to_millis(ROLLUP_BASE_TIMEFRAME)
+    return timeframe_millis > base_millis and timeframe_millis % base_millis == 0
+
+
+
+def upsert_ohlcv_documents(exchange_id, symbol, new_documents):
+    """ Write many candle documents in one batch, replacing the stored
+    candles, see storage_backend.write_ohlcv.
+
+    Candles are only final once closed, so the last one stored is refreshed
+    with every poll.
+
+    Args:
+        new_documents (list) as output by candle_to_document, all of the same timeframe
+
+    Returns:
+        Number of candles written.
+
+    """
+    if not new_documents:
+        return 0
+
+    return storage.write_ohlcv(exchange_id, symbol, timeframe_to_millis(new_documents[0]['timeframe']), new_documents)
 
-        new_documents = [candle_to_document(candle, timeframe) for candle in ohlcv]
 
-        inserted = 0
-        while not inserted:
-          try:
-              insertion_result = collection.insert_many(new_documents, ordered = False )
-              filled += len(insertion_result.inserted_ids)
-              inserted = 1
-          except pymongo.errors.BulkWriteError as ex:
-              filled += ex.details['nInserted']
-              inserted = 1
-          except pymongo.errors.AutoReconnect as ex:
-              pass
 
-    # \todo chech for holes in data
-    return filled
+def queue_ohlcv_documents(exchange_id, symbol, new_documents, on_written=None):
+    """ Same as upsert_ohlcv_documents, without waiting for the database,
+    see write_behind.put. Use ohlcv_writer.flush(sequence) before reading them back.
+
+    Returns:
+        sequence of the write, None if there are no documents.
+
+    """
+    if not new_documents:
+        return None
+
+    return ohlcv_writer.put(exchange_id, symbol, timeframe_to_millis(new_documents[0]['timeframe']), new_documents, on_written)
+
+
+
+def check_ohlcv_tiers():
+    """ Warn about the timeframes whose candles retention deletes before
+    they reach their archive age, they would never be archived.
+    """
+    if not (OHLCV_ARCHIVE_ENABLED and OHLCV_RETENTION_ENABLED):
+        return
+
+    for timeframe, (retention_millis, rollup_timeframe) in OHLCV_RETENTION.items():
+        archive_age = OHLCV_ARCHIVE_AGE.get(timeframe, OHLCV_ARCHIVE_AGE_DEFAULT)
+        if archive_age is not None and retention_millis <= archive_age:
+            print('WARNING ' + timeframe + ' candles are deleted by retention after ' + str(retention_millis) + ' ms, '
+                  + 'before their archive age of ' + str(archive_age) + ' ms, they are never archived. '
+                  + 'Set OHLCV_ARCHIVE_AGE[\'' + timeframe + '\'] to None.')
+
+
+
+def downsample_ohlcv(symbol, exchange_id, timeframe, rollup_timeframe, before_millis, batch_buckets=1):
+    """ Roll up the oldest batch of 'timeframe' candles older than
+    before_millis into 'rollup_timeframe' candles, then delete them.
+
+    Rolled up candles are only written where there is none stored, the
+    ones fetched from the exchange are kept. before_millis is rounded down to
+    a bucket start (see ohlcv_storage), so only whole buckets are deleted.
+    Call again until it returns None, see fetch_engine.retain_streams.
+
+    Example:
+        while downsample_ohlcv('BTC/USDT', 'bittrex', '1m', '1h', current_millis() - 14 * 24 * 3600e3) is not None:
+            pass
+    Args:
+        batch_buckets (int) buckets downsampled at a time
+    Returns:
+        pruned (int) candles deleted, None once there are no candles older than before_millis.
+
+    """
+    timeframe_millis = timeframe_to_millis(timeframe)
+    rollup_millis = timeframe_to_millis(rollup_timeframe)
+    bucket_millis = timeframe_millis * OHLCV_BUCKET_CANDLES
+
+    # a batch must hold whole rolled up candles
+    if bucket_millis % rollup_millis != 0 or rollup_millis <= timeframe_millis:
+        print('ERR retention ' + timeframe + ' candles can not be rolled up into ' + rollup_timeframe)
+        return None
+
+    cutoff = bucket_start(before_millis, timeframe_millis)
+
+    oldest = storage.oldest_ohlcv(exchange_id, symbol, timeframe, timeframe_millis)
+    if oldest is None or oldest >= cutoff:
+        return None
+
+    batch_from = bucket_start(oldest, timeframe_millis)
+    batch_to = min(batch_from + batch_buckets * bucket_millis, cutoff) - 1
+
+    ohlcv = [document_to_candle(document) for document in storage.read_ohlcv(exchange_id, symbol, timeframe, timeframe_millis, batch_from, batch_to)]
+
+    stored = {document['date8061'] for document in storage.read_ohlcv(exchange_id, symbol, rollup_timeframe, rollup_millis, batch_from, batch_to)}
+    rolled = [candle for candle in rollup_candles(ohlcv, rollup_millis) if not candle[0] in stored]
+    upsert_ohlcv_documents(exchange_id, symbol, [candle_to_document(candle, rollup_timeframe) for candle in rolled])
+
+    storage.delete_ohlcv(exchange_id, symbol, timeframe, timeframe_millis, batch_from, batch_to)
+
+    return len(ohlcv)
+
+
+
+#%%--------------------------------------------------------------------------
+# GAP INDEX
+#----------------------------------------------------------------------------
+
+ohlcv_gap_index = {}  # dict {'stream_id': [[first_missing, last_missing], ...], ... }
+ohlcv_unfillable = {} # dict {'stream_id': gaps the exchange has no data for, ... }
+
+def update_gap_index(symbol, exchange_id, timeframe, from_millis, to_millis=None):
+    """ Scan the stored candles and record the missing ones in ohlcv_gap_index.
+
+    Gaps already known to be unfillable are left out.
+
+    Args:
+        symbol, exchange_id, timeframe
+        from_millis, to_millis: range to check. Until the current candle by default.
+
+    Returns:
+        gaps (list) [[first_missing, last_missing], ...]
+
+    """
+
+    timeframe_millis = timeframe_to_millis(timeframe)
+    if to_millis is None:
+        now = current_millis()
+        to_millis = now - (now % timeframe_millis)
+
+    stream_id = res_params_to_stream_id('ohlcv', {'symbol': symbol, 'exchange': exchange_id, 'timeframe': timeframe})
+
+    date8061 = get_db_ohlcv_dates(symbol, exchange_id, timeframe, from_millis, to_millis)
+    gaps = find_gaps(date8061, timeframe_millis, from_millis, to_millis)
+    gaps = subtract_ranges(gaps, ohlcv_unfillable.get(stream_id, []), timeframe_millis)
+
+    ohlcv_gap_index[stream_id] = gaps
+    return gaps
+
+
+
+def mark_unfillable_gaps(symbol, exchange_id, timeframe, from_millis):
+    """ After a fill, the gaps left before the current candle are periods the
+    exchange has no candles for (no trades, before listing...). Remember them
+    so that they are not requested again.
+    """
+
+    stream_id = res_params_to_stream_id('ohlcv', {'symbol': symbol, 'exchange': exchange_id, 'timeframe': timeframe})
+
+    timeframe_millis = timeframe_to_millis(timeframe)
+    now = current_millis()
+    to_millis = now - (now % timeframe_millis)
+
+    gaps = update_gap_index(symbol, exchange_id, timeframe, from_millis, to_millis)
+    unfillable = [gap for gap in gaps if gap[1] < to_millis]
+
+    if unfillable:
+        ohlcv_unfillable.setdefault(stream_id, []).extend(unfillable)
+        ohlcv_gap_index[stream_id] = [gap for gap in gaps if gap[1] >= to_millis]
 
 
 
@@ -246,10 +1155,227 @@ def fill_ohlcv(symbol, exchange_id, timeframe, from_millis=0):
 #                              DATA TRANSFORM                               #
 #############################################################################
 
-class transform_thread_macd(threading.Thread):
-    """ Calculate MACD.
+# Extra candles read to warm up an indicator, on top of its period
+TRANSFORM_WARMUP_CANDLES = 6
+
+# Seconds between checkpoints of the indicator state. Indicators restored
+# from a checkpoint only replay the candles after it, see checkpoint_store.
+TRANSFORM_CHECKPOINT_INTERVAL = 60
+
+# Last candles of each source kept to catch up the nodes that were being
+# built (reading their history) when the candles arrived
+TRANSFORM_CATCH_UP_CANDLES = 16
+
+
+
+class tagged_queue():
+    """ Subscriber queue of the transform engine for one source stream, its
+    data is put in the engine queue along with the stream_id.
+    """
+
+    def __init__(self, queue, stream_id):
+        self.queue = queue
+        self.stream_id = stream_id
+
+
+    def put(self, data):
+        self.queue.put( (self.stream_id, data) )
+
+
+
+class transform_engine(threading.Thread):
+    """ Calculate every transformed stream in one thread.
+
+    The streams are built from the nodes of a transform_graph. Adding a
+    stream only creates the nodes that are not in the graph yet, so each
+    stream, and each indicator shared by several streams (e.g. the same EMA
+    in two MACDs), is calculated once per candle, and each stream is sent
+    once to its subscribers.
+
+    The nodes of a new stream are built (and warmed up) without holding the
+    graph, so the other streams keep ticking meanwhile. Once added, they
+    catch up with the candles that arrived while they were being built.
+
+    Example:
+        start_transform_engine()
+        ohlcv_transform_engine.add_stream('macd', {'symbol': 'BTC/USDT', 'exchange': 'hitbtc2', 'timeframe': '1m', 'ema_fast': 12, 'ema_slow': 26})
+
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True)
+        self.graph = transform_graph()
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+
+        self.outputs = {} # dict {'stream_id': (node_id, timeframe_millis), ... }
+        self.sources = set()
+        self.recent = {}  # dict {source: deque of its last candles, ... }
+
+        self.checkpoints = checkpoint_store()
+        self.last_checkpoint = time.time()
+
+
+    def add_stream(self, stream_resource, stream_parameters):
+        """ Start calculating a transformed stream, if it is not running yet.
+
+        Returns:
+            stream_id (str), None if it can not be calculated (e.g. not enough history).
+
+        """
+        stream_id = res_params_to_stream_id(stream_resource, stream_parameters)
+
+        with self.lock:
+            if stream_id in self.outputs:
+                return stream_id
+
+        built = [] # nodes made for this stream, not in the graph yet
+        try:
+            if stream_resource == 'macd':
+                node = macd_node(self, stream_parameters, built)
+            else:
+                raise ValueError('Stream resource not valid.')
+        except ValueError as ex:
+            print('ERR transform ' + stream_id + ': ' + str(ex))
+            return None
+
+        with self.lock:
+            # another subscriber may have added it meanwhile, its nodes are kept
+            if stream_id in self.outputs:
+                return stream_id
+
+            added = {new_node.node_id for new_node in built if self.graph.add(new_node) is new_node}
+            for source in set().union(*[self.graph.sources(node_id) for node_id in added]):
+                for candle in self.recent.get(source, []):
+                    self.graph.tick(source, candle, only=added)
+
+            self.outputs[stream_id] = (node.node_id, timeframe_to_millis(stream_parameters['timeframe']))
+            print('Transform ' + stream_id + ' added, ' + str(len(self.graph.nodes)) + ' nodes in the graph.')
+
+        return stream_id
+
+
+    def node(self, node_id, inputs, make_update, built):
+        """ The node 'node_id' of the graph, else built with make_update
+        (see transform_graph.node) and appended to 'built', without holding
+        the graph.
+        """
+        with self.lock:
+            if node_id in self.graph.nodes:
+                return self.graph.nodes[node_id]
+
+        for node in built:
+            if node.node_id == node_id:
+                return node
+
+        node = build_node(node_id, inputs, make_update)
+        built.append(node)
+        return node
+
+
+    def source(self, ohlcv_params):
+        """ Subscribe to an ohlcv stream, before reading its history so that
+        no candle is missed in between.
+
+        Returns:
+            stream_id (str) of the ohlcv stream, the source id in the graph.
+
+        """
+        stream_id = res_params_to_stream_id('ohlcv', ohlcv_params)
+        with self.lock:
+            if not stream_id in self.sources:
+                subscriber_queues.setdefault(stream_id, []).append(tagged_queue(self.queue, stream_id))
+                self.sources.add(stream_id)
+                self.recent[stream_id] = collections.deque(maxlen=TRANSFORM_CATCH_UP_CANDLES)
+        return stream_id
+
+
+    def run(self):
+        while True:
+            source, candle = self.queue.get()
+
+            with self.lock:
+                self.recent[source].append(candle)
+                updated = set(self.graph.tick(source, candle))
+                outputs = [(stream_id, self.graph.nodes[node_id].value, timeframe_millis)
+                           for stream_id, (node_id, timeframe_millis) in self.outputs.items() if node_id in updated]
+
+            for stream_id, new_data, timeframe_millis in outputs:
+                stream_latency.record_close(stream_id, 'transformed', candle['date8061'] + timeframe_millis)
+                send_to_subscribers(stream_id, new_data)
+
+            if time.time() - self.last_checkpoint >= TRANSFORM_CHECKPOINT_INTERVAL:
+                self.save_checkpoints()
+
+            self.queue.task_done()
+
+
+    def save_checkpoints(self):
+        with self.lock:
+            checkpoints = self.graph.checkpoints()
+        try:
+            self.checkpoints.save(checkpoints)
+        except (OSError, TypeError, ValueError) as ex:
+            print('ERR transform checkpoints: ' + repr(ex))
+        self.last_checkpoint = time.time()
 
-    Difference between two EMA with different sample number.
+
+
+ohlcv_transform_engine = transform_engine()
+
+def start_transform_engine():
+    """ Start the transform engine thread if it is not running yet.
+    """
+    if not ohlcv_transform_engine.is_alive():
+        ohlcv_transform_engine.start()
+
+
+
+def ohlcv_history(ohlcv_params, n_candles):
+    """ Last n_candles closed stored candles of a stream, to warm up indicators.
+
+    The open candle is left out, the nodes would skip its closed version.
+    """
+    timeframe_millis = timeframe_to_millis(ohlcv_params['timeframe'])
+    to_millis = candle_bucket(current_millis(), timeframe_millis) # limits excluded
+    from_millis = to_millis - n_candles * timeframe_millis - 1
+
+    ohlcv_cursor = get_ohlcv(ohlcv_params['symbol'], ohlcv_params['exchange'], ohlcv_params['timeframe'], int(from_millis), int(to_millis))
+    return cursor_to_list(ohlcv_cursor)
+
+
+
+def ema_node(engine, ohlcv_params, n_periods, built):
+    """ EMA of the 'close' price, node 'ema_<n_periods>_<ohlcv stream_id>'.
+
+    Restored from its checkpoint if there is one, then only the candles after
+    it are replayed. Else warmed up with the last n_periods candles.
+    See transform_engine.node for 'built'.
+    """
+    source = engine.source(ohlcv_params)
+    node_id = 'ema_' + str(n_periods) + '_' + source
+
+    def make_update():
+        ema = EMA_stream(n_periods)
+        checkpoint = engine.checkpoints.get(node_id)
+
+        if checkpoint:
+            # closed candles only, as the warm-up
+            open_candle = candle_bucket(current_millis(), timeframe_to_millis(ohlcv_params['timeframe']))
+            ohlcv = cursor_to_list(get_ohlcv(ohlcv_params['symbol'], ohlcv_params['exchange'], ohlcv_params['timeframe'], checkpoint['date8061'], open_candle))
+        else:
+            ohlcv = ohlcv_history(ohlcv_params, n_periods + TRANSFORM_WARMUP_CANDLES)
+            if len(ohlcv) < n_periods:
+                raise ValueError('Data for EMA ' + str(n_periods) + ' not available.')
+
+        return catch_up(ema, lambda candle: float(ema.update(candle['ohlcv']['close'])), checkpoint, ohlcv)
+
+    return engine.node(node_id, [source], make_update, built)
+
+
+
+def macd_node(engine, parameters, built):
+    """ MACD stream, difference between two EMA with different sample number.
 
     Args:
         exchange_id (str)
@@ -265,89 +1391,88 @@ class transform_thread_macd(threading.Thread):
         rising (1 / 0)
 
     """
+    ohlcv_params = {'symbol': parameters['symbol'], 'exchange': parameters['exchange'], 'timeframe': parameters['timeframe']}
+    source = engine.source(ohlcv_params)
 
-    def __init__(self, stream_parameters):
-        threading.Thread.__init__(self)
-        parameters = stream_parameters
+    ema_fast = ema_node(engine, ohlcv_params, parameters['ema_fast'], built)
+    ema_slow = ema_node(engine, ohlcv_params, parameters['ema_slow'], built)
 
-        self.symbol      = parameters['symbol']
-        self.exchange_id = parameters['exchange']
-        self.timeframe   = parameters['timeframe']
-        self.ema_fast    = parameters['ema_fast']
-        self.ema_slow    = parameters['ema_slow']
+    def make_update():
+        # the EMAs may already be in the graph, ticking
+        with engine.lock:
+            state = {'macd_prev': ema_fast.value - ema_slow.value}
+            date8061 = min(ema_fast.date8061, ema_slow.date8061)
 
-        self.stream_id = res_params_to_stream_id('macd', parameters)
+        def update(candle, ema_fast_val, ema_slow_val):
+            macd = ema_fast_val - ema_slow_val
 
-        # subscribe to fetcher
-        ohlcv_params = {'symbol': self.symbol, 'exchange': self.exchange_id, 'timeframe': self.timeframe}
-        stream_id_ohlcv = res_params_to_stream_id('ohlcv', ohlcv_params)
+            cross = 1 if (state['macd_prev'] > 0) != (macd > 0) else 0
+            rising = 1 if (macd > 0) else 0
+            state['macd_prev'] = macd
 
-        self.ohlcv_queue = new_subscriber_queue(stream_id_ohlcv)
+            return {
+                    'date8061': candle['date8061'],
+                    'macd':     {
+                                 'macd': macd,
+                                 'ema_fast': ema_fast_val,
+                                 'ema_slow': ema_slow_val,
+                                 'cross': cross,
+                                 'rising': rising,
+                                },
+                    'ohlcv':    candle['ohlcv']
+                   }
 
+        # nothing to checkpoint, the previous MACD comes from the EMAs
+        return update, None, date8061, None
 
-    def run(self):
-        # get enough previous values to calculate each EMA
-        from_millis = current_millis() - (self.ema_slow + 6) * timeframe_to_millis(self.timeframe)
-        to_millis = current_millis() + 10e3
+    return engine.node(res_params_to_stream_id('macd', parameters), [source, ema_fast.node_id, ema_slow.node_id], make_update, built)
 
-        ohlcv_cursor = get_db_ohlcv(self.symbol, self.exchange_id, self.timeframe, int(from_millis), int(to_millis))
-        ohlcv = cursor_to_list(ohlcv_cursor)
-
-
-        if len(ohlcv) < self.ema_slow:
-            raise ValueError('Data for MACD not available.')
-        else:
-            # EMA will be calculated with 'close' price
-            close = [ row['ohlcv']['close'] for row in ohlcv]
 
 
-        history_vals = close[-self.ema_slow :]
-        ema_fast_val = EMA_history(self.ema_fast, history_vals[-self.ema_fast :])[-1]
-        ema_slow_val = EMA_history(self.ema_slow, history_vals)[-1]
+indicator_series_locks = {} # dict {route: threading.Lock, ... } one per series
+indicator_series_locks_lock = threading.Lock()
 
-        macd_prev = ema_fast_val - ema_slow_val
+def indicator_series_lock(route):
+    """ Lock of the series in 'route', held while it is extended.
+    """
+    with indicator_series_locks_lock:
+        if not route in indicator_series_locks:
+            indicator_series_locks[route] = threading.Lock()
+        return indicator_series_locks[route]
 
 
-        while True:
-            # new fetcher data
-            new_ohlcv = self.ohlcv_queue.get()
-            new_close = new_ohlcv['ohlcv']['close']
-            new_date8061 = new_ohlcv['date8061']
 
-            # calc EMA and MACD
-            ema_fast_val_previous = ema_fast_val
-            ema_slow_val_previous = ema_slow_val
+def ema_series(symbol, exchange_id, timeframe, n_periods):
+    """ Stored EMA of the 'close' price, extended with the candles closed
+    since it was last read.
 
-            ema_fast_val = EMA_tick(self.ema_fast, new_close, ema_fast_val_previous)
-            ema_slow_val = EMA_tick(self.ema_slow, new_close, ema_slow_val_previous)
+    The EMA starts at the first stored candle of the stream, only the new
+    candles are computed, continuing from the saved EMA state.
 
-            macd = ema_fast_val - ema_slow_val
+    Example:
+        date8061, ema = ema_series('BTC/USDT', 'hitbtc2', '1m', 12).read(from_millis, to_millis)
 
-            if (macd_prev > 0) != (macd > 0):
-                cross = 1
-            else:
-                cross = 0
+    """
+    series = indicator_series(series_route(exchange_id, symbol, timeframe, 'ema_' + str(n_periods)))
 
-            rising = 1 if (macd > 0) else 0
+    timeframe_millis = timeframe_to_millis(timeframe)
+    now = current_millis()
+    last_closed = now - (now % timeframe_millis) - timeframe_millis
 
+    with indicator_series_lock(series.route):
+        newest = series.newest()
+        from_millis = 0 if newest is None else newest + 1
+        if from_millis > last_closed:
+            return series
 
-            macd_dict = {
-                         'date8061': new_date8061,
-                         'macd':     {
-                                      'macd': macd,
-                                      'ema_fast': ema_fast_val,
-                                      'ema_slow': ema_slow_val,
-                                      'cross': cross,
-                                      'rising': rising,
-                                     },
-                         'ohlcv':    new_ohlcv['ohlcv']
-                        }
+        columns = get_ohlcv_arrays(symbol, exchange_id, timeframe, from_millis, last_closed)
 
-            macd_prev = macd
-            self.ohlcv_queue.task_done()
+        ema = EMA_stream(n_periods)
+        if newest is not None:
+            ema.restore(series.state())
+        series.append(columns['date8061'], ema.extend(columns['close']), ema.state())
 
-            # send to subscribers
-            send_to_subscribers(self.stream_id, macd_dict)
+    return series
 
 
 
@@ -389,7 +1514,41 @@ def datamanager_status():
 
     """
 
-    return jsonify({'fetching_symbols': get_database_info('datamanager', 'fetching_symbols')})
+    return jsonify({'fetching_symbols': get_database_info('datamanager', 'fetching_symbols'),
+                    'rate_governors': {exchange_id: rate_governors[exchange_id].status() for exchange_id in rate_governors},
+                    'feeds': ohlcv_fetch_engine.feed_stats,
+                    'index_problems': ohlcv_index_problems,
+                    'writes': ohlcv_writer.status(),
+                    'subscriptions': subscriptions.status(),
+                    'relay': relay.status() if relay is not None else None,
+                    'latency': {stream_id: {stage: status['p90'] for stage, status in stages.items()} for stream_id, stages in stream_latency.status().items()},
+                   })
+
+
+
+#----------------------------------------------------------------------------
+#   Route /datamanager/latency
+#----------------------------------------------------------------------------
+
+@datamanager_flask_app.route('/datamanager/latency', methods=['POST'])
+def latency_status():
+    """ Latency histograms of the data pipeline.
+
+    Every stage is measured from the close of each candle: exchange answer
+    received (fetched), put in the subscriber queues (enqueued), written to
+    the database (stored), transform output (transformed) and sent to each
+    subscriber (sent). 'exchange_call' is the duration of the exchange query.
+
+    Args:
+        stream_id (str) optional, only this stream.
+
+    Returns:
+        {'stream_id': {'stage': {'count', 'mean', 'max', 'last', 'p50', 'p90', 'p99', 'buckets', 'slower'}, ... }, ... }
+        in milliseconds.
+
+    """
+    stream_id = request.json.get('stream_id') if request.is_json and request.json else None
+    return jsonify(stream_latency.status(stream_id))
 
 
 
@@ -415,6 +1574,14 @@ def fetch_commands(command):
 
         add: add new symbol/timeframe fetcher and start it.
 
+        worker: like start, but only for the symbols leased to this process,
+                sharing them with the other fetch workers.
+
+        feed: build a symbol/timeframe from a push feed (host, port) instead
+              of polling. Not stored in fetching_symbols.
+
+        gaps: missing candles found in the database, per stream.
+
     Returns:
         Symbols/timeframes being fetched.
 
@@ -436,14 +1603,38 @@ def fetch_commands(command):
         fetching_symbols, is_new = add_fetching_symbol(exchange_id, symbol, timeframe)
 
         if is_new:
-            new_symbol_fetcher = fetch_thread_ohlcv(params)
-            new_symbol_fetcher.start()
+            start_fetch_engine()
+            ohlcv_fetch_engine.add_stream(params)
 
 
         return jsonify({'fetching_symbols': fetching_symbols})
 
 
 
+
+    # Command <worker>
+    elif command == 'worker':
+        worker_id = start_fetch_worker()
+        return jsonify({'worker_id': worker_id})
+
+
+    # Command <feed>
+    elif command == 'feed':
+        params      = request.json['params']
+        host        = request.json.get('host', REPLAY_HOST)
+        port        = request.json.get('port', REPLAY_PORT)
+
+        start_fetch_engine()
+        stream_id = ohlcv_fetch_engine.add_feed(params, host, port)
+
+        return jsonify({stream_id: (host, port)})
+
+
+    # Command <gaps>
+    elif command == 'gaps':
+        return jsonify({'gaps': ohlcv_gap_index})
+
+
     else:
         return jsonify({'error': 'Invalid command.'})
 
@@ -510,7 +1701,7 @@ def get_commands():
             to_millis = current_millis() + 10e3
 
 
-        ohlcv_cursor = get_db_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis)
+        ohlcv_cursor = get_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis)
 
         ohlcv = cursor_to_list(ohlcv_cursor)
 
@@ -540,19 +1731,13 @@ def get_commands():
             to_millis = current_millis() + 10e3
 
 
-        ohlcv_cursor = get_db_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis)
+        # closed candles only, the EMA starts at the first stored candle whatever the range
+        date8061, ema = ema_series(symbol, exchange_id, timeframe, ema_samples).read(from_millis, to_millis)
 
-        ohlcv = cursor_to_list(ohlcv_cursor)
-
-        if ohlcv == []:
+        if len(date8061) == 0:
             return jsonify({'error': 'Data not available.'})
         else:
-            # EMA will be calculated with 'close' price
-            date8061 = [ row['date8061'] for row in ohlcv]
-            close = [ row['ohlcv']['close'] for row in ohlcv]
-            ema = EMA_history(ema_samples, close)
-
-            ema_dict = [{'date8061': date8061[i], 'ema': ema[i]} for i in range(len(ema))]
+            ema_dict = [{'date8061': date, 'ema': value} for date, value in zip(date8061.tolist(), ema.tolist())]
 
             return jsonify(ema_dict)
 
@@ -566,7 +1751,7 @@ def get_commands():
         # if not symbol in symbols:
         #     return jsonify({'error': 'Symbol not in exchange.'})
         # else:
-        ticker = exchange.fetch_ticker(symbol_os(symbol, exchange_id))['last']
+        ticker = governed_call(exchange, 'fetch_ticker', symbol_os(symbol, exchange_id))['last']
         return jsonify({'ticker': ticker})
 
 
@@ -606,20 +1791,15 @@ def subscribe():
 #   Route /datamanager/subscribe/<command>
 #----------------------------------------------------------------------------
 
-SUBS_CLIENTS_WAITING_MAX = 10
-
-active_subscription_services = {} #dict {'stream_id_a': (HOST, PORT), 'stream_id_b': [(...
-
-transform_data_threads = []
-subscription_threads = {} # dict {'stream_id_a': thread, ... }
-subscriber_queues = {} # dict {'stream_id_a': [list of queues], ... }
-subscribers = [] # list of threads
+active_subscription_services = {} # dict {'stream_id_a': (HOST, PORT), ... }, the same endpoint for every stream
+subscription_streams = {} # dict {'stream_id_a': (stream_resource, stream_parameters), ... }
+subscriber_queues = {} # dict {'stream_id_a': [list of queues], ... }, in-process subscribers
 
 def send_to_subscribers(stream_id, data):
     """ Sends new data to all subscribed processes.
 
-    Note: When instantiating a new subscriber, a new queue must be added to the
-    'subscriber_queues' list and passed to the subscriber thread.
+    Note: In-process subscribers get it through the queues made by
+    new_subscriber_queue, the others through the subscription server.
 
     Args:
         stream_id (str) unique stream identifier
@@ -633,6 +1813,31 @@ def send_to_subscribers(stream_id, data):
         for subs_queue in subscriber_queues[stream_id]:
             subs_queue.put( data )
 
+    subscriptions.publish(stream_id, data)
+
+
+
+# closed candles of the fetch workers, to the subscribers of the other processes
+relay = candle_relay(datamanager_db, send_to_subscribers) if datamanager_db is not None else None
+
+def publish_fetched(stream_id, data):
+    """ send_to_subscribers for the candles of the fetch engine. Those of a
+    fetch worker are also sent to the subscribers of the other processes.
+    """
+    send_to_subscribers(stream_id, data)
+
+    if fetch_worker is not None:
+        relay.publish(stream_id, data)
+
+
+
+def start_relay():
+    """ Deliver the candles of the fetch workers to the subscribers of this
+    process, if it is not running yet.
+    """
+    if relay is not None:
+        relay.start_tailing()
+
 
 
 @datamanager_flask_app.route('/datamanager/subscribe/<string:command>', methods=['POST'])
@@ -640,7 +1845,8 @@ def subscribe_commands(command):
     """ Manage subscriptions to live data.
 
     Once a request is received, it returns the IP, PORT tuple where the
-    server is serving new data for the desired stream.
+    server is serving new data for the desired stream. Then connect and
+    send {'type': 'subscribe', 'stream_id': stream_id}, see subscription_server.
 
     Args:
 
@@ -655,90 +1861,86 @@ def subscribe_commands(command):
         stream_resource = request.json['res']
         stream_parameters = request.json['params']
 
-        stream_id   = res_params_to_stream_id(stream_resource, stream_parameters)
-        if stream_id == -1:
+        stream_id = start_subscription_stream(stream_resource, stream_parameters)
+        if stream_id is None:
             return jsonify({'error': 'Invalid stream_resource.'})
 
-        if stream_id in active_subscription_services:
-            return jsonify({stream_id: active_subscription_services[stream_id]})
-        else:
-            port = SUBS_PORT_BASE
-
-            available = 0
-            while available == 0:
-                available = 1
-                for used_type, used_tuple in active_subscription_services.items():
-                    if port == used_tuple[1]:
-                        available = 0
-                        port += 1
-                        break
-
-            active_subscription_services[stream_id] = (ORBBIT_HOST, port)
-
-            subscription_threads[stream_id] = subscription_thread(stream_resource, stream_parameters, ORBBIT_HOST, port)
-            subscription_threads[stream_id].start()
-
-            return jsonify({stream_id: (ORBBIT_HOST, port)})
+        start_subscription_server()
+        return jsonify({stream_id: active_subscription_services[stream_id]})
 
     else:
         return jsonify({'error': 'Command not found.'})
 
 
 
-class subscription_thread(threading.Thread):
-    """ Subscription socket server.
+def start_subscription_stream(stream_resource, stream_parameters):
+    """ Start what makes the data of a stream, if it is not running yet.
 
-    One server is created per stream_id, to serve all clients subscribed to it (subscribers).
+    Returns:
+        stream_id (str), None if the resource is not valid.
 
-    Args:
+    """
+    stream_id = res_params_to_stream_id(stream_resource, stream_parameters)
+    start_relay()
+
+    if stream_resource in valid_subscribtion_resources['fetched']:
+        # fetchers update the subscribers when they get new data
+        pass
+    elif stream_resource in valid_subscribtion_resources['transformed']:
+        # the transform engine subscribes to the fetchers and updates the
+        # subscribers, once per stream whatever their number. It is tried
+        # again on each subscription if the stream could not start before.
+        start_transform_engine()
+        ohlcv_transform_engine.add_stream(stream_resource, stream_parameters)
+    else:
+        return None
 
-    Returns:
+    active_subscription_services[stream_id] = (ORBBIT_HOST, SUBS_PORT)
+    subscription_streams[stream_id] = (stream_resource, stream_parameters)
+    return stream_id
 
+
+
+def subscribe_message(message):
+    """ stream_id of a subscribe message of the subscription server.
     """
-    def __init__(self, stream_resource, stream_parameters, host, port):
-        threading.Thread.__init__(self)
-        self.stream_resource = stream_resource
-        self.stream_parameters = stream_parameters
-        self.host = host
-        self.port = port
+    if 'stream_id' in message:
+        stream_id = message['stream_id']
+        if not stream_id in subscription_streams:
+            return None
+        stream_resource, stream_parameters = subscription_streams[stream_id]
+    else:
+        stream_resource, stream_parameters = message.get('res'), message.get('params')
 
-        self.stream_id = res_params_to_stream_id(self.stream_resource, self.stream_parameters)
+    try:
+        return start_subscription_stream(stream_resource, stream_parameters)
+    except (KeyError, TypeError, AttributeError):
+        return None # parameters missing
 
-    def run(self):
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            s.bind( (self.host, self.port) )
-        except socket.error as msg:
-            return jsonify({'error': 'Bind failed. Error Code : ' + str(msg[0]) + ' Message ' + msg[1]})
 
-        # Accept new subscribers for this stream_id
-        s.listen(SUBS_CLIENTS_WAITING_MAX)
 
-        while True:
-            conn, addr = s.accept()
-            print('Subscribtion ' + self.stream_id + ' requested by ' + addr[0] + ':' + str(addr[1]))
+def subscription_sent(stream_id, data):
+    if 'date8061' in data and stream_id in subscription_streams:
+        timeframe_millis = timeframe_to_millis(subscription_streams[stream_id][1]['timeframe'])
+        stream_latency.record_close(stream_id, 'sent', data['date8061'] + timeframe_millis)
 
-            new_subs_q = new_subscriber_queue(self.stream_id)
-            new_subscriber_thread(new_subs_q, conn)
 
-            if self.stream_resource in valid_subscribtion_resources['fetched']:
-                # fetchers update the queue when they get new data
-                pass
-            elif self.stream_resource in valid_subscribtion_resources['transformed']:
-                # start the data transformation thread, it will subscribe to one or more fetchers
-                # and update the transformed data queue.
-                if self.stream_resource == 'macd':
-                    new_transform_thread( transform_thread_macd(self.stream_parameters) )
 
-            else:
-                return jsonify({'error': 'Stream resource not valid.'})
+subscriptions = subscription_server(ORBBIT_HOST, SUBS_PORT, subscribe_message, subscription_sent)
 
+def start_subscription_server():
+    """ Start the subscription server if it is not running yet.
+    """
+    if not subscriptions.is_alive() and not subscriptions.started.is_set():
+        subscriptions.start()
+        subscriptions.started.wait()
 
 
 
 def new_subscriber_queue(stream_id):
     """ Return a new queue where new 'stream_id' data can be fed and retrieved.
     """
+    start_relay()
     new_queue = queue.Queue()
 
     if stream_id in subscriber_queues:
@@ -749,45 +1951,6 @@ def new_subscriber_queue(stream_id):
     return new_queue
 
 
-def new_subscriber_thread(new_queue, conn):
-    """ Create thread that sends new data in the queue through the conn.
-    """
-    subscribers.append( subscriber_thread(new_queue, conn) )
-    subscribers[-1].start()
-
-
-def new_transform_thread(new_trhead):
-    """ Create thread that sends new data in the queue through the conn.
-    """
-    transform_data_threads.append( new_trhead )
-    transform_data_threads[-1].start()
-
-
-class subscriber_thread(threading.Thread):
-    """ Subscriber socket server.
-
-    One is created per subscriber to send them new data as soon as it is made
-    available trough it's queue.
-
-    Args:
-
-    Returns:
-
-    """
-
-    def __init__(self, queue, conn):
-        threading.Thread.__init__(self)
-        self.queue = queue
-        self.conn = conn
-
-    def run(self):
-        print('New subscriber thread.')
-        while True:
-            new_data = self.queue.get()
-            self.conn.sendall( json.dumps(new_data).encode('ascii') )
-            self.queue.task_done()
-
-
 
 
 
@@ -822,6 +1985,7 @@ def start_API():
 
     print("Starting DataManager API Server.")
     thread_DataManager_API.start()
+    start_subscription_server()
 
 
 #----------------------------------------------------------------------------
@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+
+import os
+import time
+import queue
+import socket
+import datetime
+import threading
+import collections
+import pymongo
+import bson
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Bytes of the capped collection, the oldest relayed candles are dropped
+CANDLE_RELAY_SIZE = 64 * 1024 * 1024
+
+# Seconds before tailing again once the cursor is closed, or the database fails
+CANDLE_RELAY_RETRY_INTERVAL = 1
+
+# Seconds read again when tailing again, for the candles inserted meanwhile
+# by hosts with their clock behind
+CANDLE_RELAY_OVERLAP = 60
+
+# Relayed candles remembered, not to deliver one twice after tailing again
+CANDLE_RELAY_SEEN = 100000
+
+
+
+
+#%%##########################################################################
+#                               CANDLE RELAY                                #
+#############################################################################
+
+class candle_relay():
+    """ Candles published by one process, delivered in every other one.
+
+    Fetch workers (see fetch_worker_thread) publish the closed candles they
+    get to the capped collection 'relayed_candles'. Every process with
+    subscribers tails it and delivers the candles of the other processes to
+    its own subscribers and transform engine.
+
+    publish() only queues the candle, it is inserted by a thread of its own.
+
+    Args:
+        database (pymongo.database.Database)
+        deliver (function) deliver(stream_id, data) of a candle of another process
+
+    Example:
+        relay = candle_relay(datamanager_db, send_to_subscribers)
+        relay.start_tailing()
+        relay.publish('ohlcv_hitbtc2_BTC/USDT_1m', new_data)
+
+    """
+
+    def __init__(self, database, deliver, size=CANDLE_RELAY_SIZE):
+        self.database = database
+        self.deliver = deliver
+        self.size = size
+        self.origin = socket.gethostname() + '_' + str(os.getpid())
+
+        self.collection = None
+        self.queue = queue.Queue()
+        self.threads_lock = threading.Lock()
+        self.publishing = None
+        self.tailing = None
+
+        self.seen = collections.OrderedDict()
+        self.published = 0
+        self.delivered = 0
+        self.last_error = None
+
+
+    def relay_collection(self):
+        if self.collection is None:
+            try:
+                self.database.create_collection('relayed_candles', capped=True, size=self.size)
+            except pymongo.errors.CollectionInvalid:
+                pass # created by another process
+            self.collection = self.database['relayed_candles']
+        return self.collection
+
+
+    def publish(self, stream_id, data):
+        """ Send a candle to the other processes.
+        """
+        with self.threads_lock:
+            if self.publishing is None:
+                self.publishing = threading.Thread(target=self.run_publisher, daemon=True)
+                self.publishing.start()
+
+        self.queue.put({'origin': self.origin, 'stream_id': stream_id, 'data': data})
+
+
+    def start_tailing(self):
+        """ Start delivering the candles of the other processes, if it is not running yet.
+        """
+        with self.threads_lock:
+            if self.tailing is None:
+                self.tailing = threading.Thread(target=self.run_tail, daemon=True)
+                self.tailing.start()
+
+
+    def run_publisher(self):
+        while True:
+            documents = [self.queue.get()]
+            while True:
+                try:
+                    documents.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.relay_collection().insert_many(documents, ordered=True)
+                self.published += len(documents)
+            except pymongo.errors.PyMongoError as ex:
+                self.last_error = repr(ex)
+                print('ERR candle relay, ' + str(len(documents)) + ' candles not relayed: ' + self.last_error)
+
+
+    def run_tail(self):
+        # only the candles published from now on
+        since = datetime.datetime.now(datetime.timezone.utc)
+
+        while True:
+            try:
+                cursor = self.relay_collection().find({'_id': {'$gte': bson.ObjectId.from_datetime(since)}},
+                                                      cursor_type=pymongo.CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    for document in cursor:
+                        since = max(since, document['_id'].generation_time - datetime.timedelta(seconds=CANDLE_RELAY_OVERLAP))
+                        self.receive(document)
+
+            except pymongo.errors.PyMongoError as ex:
+                self.last_error = repr(ex)
+                print('ERR candle relay: ' + self.last_error)
+
+            time.sleep(CANDLE_RELAY_RETRY_INTERVAL)
+
+
+    def receive(self, document):
+        if document['_id'] in self.seen:
+            return
+        self.seen[document['_id']] = None
+        if len(self.seen) > CANDLE_RELAY_SEEN:
+            self.seen.popitem(last=False)
+
+        if document['origin'] != self.origin:
+            try:
+                self.deliver(document['stream_id'], document['data'])
+                self.delivered += 1
+            except Exception as ex:
+                print('ERR candle relay, delivering ' + str(document.get('stream_id')) + ': ' + repr(ex))
+
+
+    def status(self):
+        return {'origin': self.origin,
+                'published': self.published,
+                'delivered': self.delivered,
+                'queued': self.queue.qsize(),
+                'tailing': self.tailing is not None,
+                'last_error': self.last_error,
+               }
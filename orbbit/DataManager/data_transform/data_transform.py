@@ -1,10 +1,237 @@
+#!/usr/bin/python3
 
-# import numpy as np
+import math
+import collections
 
+import numpy as np
 
-#############################################################################
+
+#%%##########################################################################
 #                                INDICATORS                                 #
 #############################################################################
+# Every indicator has a batch form, *_history, that takes whole histories
+# (lists or np.array) and returns np.array aligned with them, np.nan where
+# there are not enough values yet. And a stream form, *_stream, that takes
+# one candle at a time and carries its state.
+#
+# Both forms do the same floating point operations in the same order, so
+# feeding a history to a stream gives exactly the values of the batch form.
+#
+# The state of a stream can be saved with state(), a JSON-like dict, and
+# loaded back with restore() to go on from there bit for bit.
+
+#%%--------------------------------------------------------------------------
+# EXPONENTIAL SMOOTHING
+#----------------------------------------------------------------------------
+# s[i] = s[i-1] + alpha * (v[i] - s[i-1]), with s[0] = v[0].
+#
+# Within a block of k values after the state s:
+#
+#   s[k] = d^k * (s + sum_j alpha * d^-j * v[j])       d = 1 - alpha
+#
+# so a block is a cumsum instead of a loop. Blocks are kept short enough for
+# d^-j to stay below SMOOTHING_MAX_GAIN, which bounds the rounding error.
+
+SMOOTHING_MAX_GAIN = 2.0 ** 20
+
+
+def smoothing_coefficients(alpha):
+    """ Weights (alpha * d^-j) and powers (d^j) of a block, j = 1..block.
+    alpha must be below 1.
+    """
+    decay = 1.0 - alpha
+    block = max(1, int(math.log(SMOOTHING_MAX_GAIN) / -math.log(decay)))
+    j = np.arange(1, block + 1)
+    return alpha * decay ** -j, decay ** j
+
+
+
+def smoothed_history(alpha, values):
+    """ Exponential smoothing of a complete history.
+
+    Args:
+        alpha (float) weight of the newest value, 0 < alpha <= 1
+        values (list or np.array)
+
+    Returns:
+        smoothed (np.array) same length as values
+
+    """
+    return smoothing_stream(alpha).extend(values)
+
+
+
+class smoothing_stream():
+    """ Stream form of smoothed_history.
+    """
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.weights, self.powers = smoothing_coefficients(alpha) if alpha < 1 else (np.ones(1), np.ones(1))
+
+        self.value = None    # last output
+        self.base = None     # output before the current block
+        self.total = 0.0     # weighted sum within the current block
+        self.position = 0    # values in the current block
+
+
+    def update(self, value):
+        if self.value is None or self.alpha >= 1:
+            self.value = self.base = np.float64(value)
+            return self.value
+
+        self.total += value * self.weights[self.position]
+        self.value = self.powers[self.position] * (self.base + self.total)
+        self.position += 1
+
+        if self.position == len(self.weights):
+            self.base = self.value
+            self.total = 0.0
+            self.position = 0
+
+        return self.value
+
+
+    def extend(self, values):
+        """ update() for many values at once, a block at a time.
+
+        Returns:
+            smoothed (np.array) the outputs of update(), bit for bit
+
+        """
+        values = np.asarray(values, dtype=np.float64)
+        smoothed = np.empty(len(values))
+        if len(values) == 0:
+            return smoothed
+
+        if self.alpha >= 1:
+            smoothed[:] = values
+            self.value = self.base = smoothed[-1]
+            return smoothed
+
+        # the first value and the rest of the current block, one at a time
+        i = 0
+        while i < len(values) and (self.value is None or self.position != 0):
+            smoothed[i] = self.update(values[i])
+            i += 1
+
+        rest = values[i:]
+        if len(rest) == 0:
+            return smoothed
+
+        # one block per row, the padding only affects values past the end
+        block = len(self.weights)
+        blocks = -(-len(rest) // block)
+        padded = np.zeros(blocks * block)
+        padded[:len(rest)] = rest
+        sums = np.cumsum(padded.reshape(blocks, block) * self.weights, axis=1)
+
+        # only the state between blocks is sequential
+        bases = []
+        base = self.base
+        for block_sum in sums[:, -1].tolist():
+            bases.append(base)
+            base = self.powers[-1] * (base + block_sum)
+
+        smoothed[i:] = (self.powers * (np.array(bases)[:, None] + sums)).ravel()[:len(rest)]
+
+        last = len(rest) - (blocks - 1) * block # values in the last block
+        self.value = smoothed[-1]
+        if last == block:
+            self.base, self.total, self.position = self.value, 0.0, 0
+        else:
+            self.base, self.total, self.position = np.float64(bases[-1]), float(sums[-1, last - 1]), last
+        return smoothed
+
+
+    def state(self):
+        return {'value': optional_float(self.value),
+                'base': optional_float(self.base),
+                'total': float(self.total),
+                'position': self.position,
+               }
+
+
+    def restore(self, state):
+        self.value = optional_float64(state['value'])
+        self.base = optional_float64(state['base'])
+        self.total = state['total']
+        self.position = state['position']
+
+
+
+def optional_float(value):
+    return None if value is None else float(value)
+
+
+def optional_float64(value):
+    return None if value is None else np.float64(value)
+
+
+
+#%%--------------------------------------------------------------------------
+# ROLLING WINDOWS
+#----------------------------------------------------------------------------
+
+def rolling_sum(values, n_periods):
+    """ Sum of every window of n_periods values, added oldest first.
+
+    The sum of a window does not depend on the values around it, so the
+    stream forms get the same result from their last window alone.
+
+    Returns:
+        sums (np.array) of len(values) - n_periods + 1 windows
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    count = max(len(values) - n_periods + 1, 0)
+
+    total = np.zeros(count)
+    for j in range(n_periods):
+        total += values[j:j + count]
+    return total
+
+
+
+def window_aligned(n_periods, values, length):
+    """ Put the per window 'values' at the last index of each window.
+    """
+    aligned = np.full(length, np.nan)
+    aligned[n_periods - 1:] = values
+    return aligned
+
+
+
+class window_stream():
+    """ Stream form of the rolling window indicators: keeps the last window
+    and runs the batch form on it.
+    """
+
+    def __init__(self, n_periods, columns=1):
+        self.n_periods = n_periods
+        self.windows = [collections.deque(maxlen=n_periods) for column in range(columns)]
+
+
+    def push(self, *values):
+        """ Returns True once the window is full.
+        """
+        for window, value in zip(self.windows, values):
+            window.append(value)
+        return len(self.windows[0]) == self.n_periods
+
+
+    def arrays(self):
+        return [np.array(window, dtype=np.float64) for window in self.windows]
+
+
+    def state(self):
+        return {'windows': [[float(value) for value in window] for window in self.windows]}
+
+
+    def restore(self, state):
+        self.windows = [collections.deque(window, maxlen=self.n_periods) for window in state['windows']]
+
+
 
 #%%--------------------------------------------------------------------------
 # EMA
@@ -20,28 +247,302 @@ def EMA_tick(n_periods, current_value, previous_ema):
     Returns:
         EMA (double) current EMA value
 
+    Same recurrence as EMA_history, without its blocks. Use EMA_stream to
+    continue an EMA_history bit for bit.
+
     """
 
     most_recent_weight = 2 / (n_periods + 1)
     return (current_value - previous_ema) * most_recent_weight + previous_ema
 
 
+
 def EMA_history(n_periods, values):
     """ EMA for complete history.
-    
+
     Args:
         n_periods (int) EMA sample number
-        values (list) len must be greater than n_periods
+        values (list) first EMA value is the first value
+
+    Returns:
+        EMA (np.array double) complete EMA history
+
+    """
+    return smoothed_history(2 / (n_periods + 1), values)
+
+
+
+class EMA_stream(smoothing_stream):
+    """ EMA one value at a time, update() returns the EMA.
+
+    Example:
+        ema = EMA_stream(26)
+        for close in closes:
+            value = ema.update(close)
+
+    """
+
+    def __init__(self, n_periods):
+        smoothing_stream.__init__(self, 2 / (n_periods + 1))
+        self.n_periods = n_periods
+
+
+
+#%%--------------------------------------------------------------------------
+# SMA
+#----------------------------------------------------------------------------
+
+def SMA_history(n_periods, values):
+    """ Simple moving average.
+
+    Returns:
+        SMA (np.array double) np.nan for the first n_periods - 1 values
+
+    """
+    return window_aligned(n_periods, rolling_sum(values, n_periods) / n_periods, len(values))
+
+
+
+class SMA_stream(window_stream):
+
+    def update(self, value):
+        if not self.push(value):
+            return np.nan
+        return SMA_history(self.n_periods, *self.arrays())[-1]
+
+
+
+#%%--------------------------------------------------------------------------
+# MACD
+#----------------------------------------------------------------------------
+
+def MACD_history(n_fast, n_slow, n_signal, values):
+    """ Moving average convergence divergence.
+
+    Returns:
+        macd (dict) {'macd', 'signal', 'histogram', 'ema_fast', 'ema_slow'} of np.array
+
+    """
+    ema_fast = EMA_history(n_fast, values)
+    ema_slow = EMA_history(n_slow, values)
+    macd = ema_fast - ema_slow
+    signal = EMA_history(n_signal, macd)
+
+    return {'macd': macd, 'signal': signal, 'histogram': macd - signal, 'ema_fast': ema_fast, 'ema_slow': ema_slow}
+
+
+
+class MACD_stream():
+
+    def __init__(self, n_fast, n_slow, n_signal=9):
+        self.ema_fast = EMA_stream(n_fast)
+        self.ema_slow = EMA_stream(n_slow)
+        self.signal = EMA_stream(n_signal)
+
+
+    def update(self, value):
+        ema_fast = self.ema_fast.update(value)
+        ema_slow = self.ema_slow.update(value)
+        macd = ema_fast - ema_slow
+        signal = self.signal.update(macd)
+
+        return {'macd': macd, 'signal': signal, 'histogram': macd - signal, 'ema_fast': ema_fast, 'ema_slow': ema_slow}
+
+
+    def state(self):
+        return {'ema_fast': self.ema_fast.state(), 'ema_slow': self.ema_slow.state(), 'signal': self.signal.state()}
+
+
+    def restore(self, state):
+        self.ema_fast.restore(state['ema_fast'])
+        self.ema_slow.restore(state['ema_slow'])
+        self.signal.restore(state['signal'])
+
+
+
+#%%--------------------------------------------------------------------------
+# RSI
+#----------------------------------------------------------------------------
+
+def RSI_history(n_periods, values):
+    """ Relative strength index, Wilder smoothing (alpha = 1 / n_periods) of
+    the gains and losses, starting from the first change.
+
+    Returns:
+        RSI (np.array double) 0 to 100, np.nan for the first value
+
+    """
+    changes = np.diff(np.asarray(values, dtype=np.float64))
+    gains = smoothed_history(1 / n_periods, np.maximum(changes, 0.0))
+    losses = smoothed_history(1 / n_periods, np.maximum(-changes, 0.0))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(losses == 0, 100.0, 100.0 - 100.0 / (1.0 + gains / losses))
+
+    return np.concatenate([[np.nan], rsi]) if len(values) else rsi
+
+
+
+class RSI_stream():
+
+    def __init__(self, n_periods):
+        self.gains = smoothing_stream(1 / n_periods)
+        self.losses = smoothing_stream(1 / n_periods)
+        self.previous = None
+
+
+    def update(self, value):
+        value = np.float64(value)
+        if self.previous is None:
+            self.previous = value
+            return np.nan
+
+        change = value - self.previous
+        self.previous = value
+
+        gains = self.gains.update(max(change, 0.0))
+        losses = self.losses.update(max(-change, 0.0))
+        return np.float64(100.0) if losses == 0 else 100.0 - 100.0 / (1.0 + gains / losses)
+
+
+    def state(self):
+        return {'gains': self.gains.state(), 'losses': self.losses.state(), 'previous': optional_float(self.previous)}
+
+
+    def restore(self, state):
+        self.gains.restore(state['gains'])
+        self.losses.restore(state['losses'])
+        self.previous = optional_float64(state['previous'])
+
+
+
+#%%--------------------------------------------------------------------------
+# BOLLINGER BANDS
+#----------------------------------------------------------------------------
+
+def bollinger_history(n_periods, n_deviations, values):
+    """ SMA plus and minus n_deviations (population) standard deviations.
 
     Returns:
-        EMA (array double) complete EMA history
+        bands (dict) {'middle', 'upper', 'lower'} of np.array
 
     """
+    values = np.asarray(values, dtype=np.float64)
+    count = max(len(values) - n_periods + 1, 0)
+    middle = rolling_sum(values, n_periods) / n_periods
+
+    squares = np.zeros(count)
+    for j in range(n_periods):
+        squares += (values[j:j + count] - middle) ** 2
+    deviation = np.sqrt(squares / n_periods)
+
+    return {'middle': window_aligned(n_periods, middle, len(values)),
+            'upper':  window_aligned(n_periods, middle + n_deviations * deviation, len(values)),
+            'lower':  window_aligned(n_periods, middle - n_deviations * deviation, len(values)),
+           }
+
+
+
+class bollinger_stream(window_stream):
+
+    def __init__(self, n_periods, n_deviations=2):
+        window_stream.__init__(self, n_periods)
+        self.n_deviations = n_deviations
+
+
+    def update(self, value):
+        if not self.push(value):
+            return {'middle': np.nan, 'upper': np.nan, 'lower': np.nan}
+        bands = bollinger_history(self.n_periods, self.n_deviations, *self.arrays())
+        return {band: values[-1] for band, values in bands.items()}
+
+
+
+#%%--------------------------------------------------------------------------
+# ATR
+#----------------------------------------------------------------------------
+
+def true_range(high, low, close):
+    high, low, close = [np.asarray(values, dtype=np.float64) for values in (high, low, close)]
+    previous = np.concatenate([close[:1], close[:-1]])
+    ranges = np.maximum(high - low, np.maximum(np.abs(high - previous), np.abs(low - previous)))
+    ranges[:1] = high[:1] - low[:1]
+    return ranges
+
+
+
+def ATR_history(n_periods, high, low, close):
+    """ Average true range, Wilder smoothing (alpha = 1 / n_periods) of the
+    true range, starting from the first candle.
+
+    Returns:
+        ATR (np.array double)
+
+    """
+    return smoothed_history(1 / n_periods, true_range(high, low, close))
+
+
+
+class ATR_stream():
+
+    def __init__(self, n_periods):
+        self.ranges = smoothing_stream(1 / n_periods)
+        self.previous = None
+
+
+    def update(self, high, low, close):
+        high, low, close = np.float64(high), np.float64(low), np.float64(close)
+        if self.previous is None:
+            value = high - low
+        else:
+            value = max(high - low, max(abs(high - self.previous), abs(low - self.previous)))
+        self.previous = close
+        return self.ranges.update(value)
+
+
+    def state(self):
+        return {'ranges': self.ranges.state(), 'previous': optional_float(self.previous)}
+
+
+    def restore(self, state):
+        self.ranges.restore(state['ranges'])
+        self.previous = optional_float64(state['previous'])
+
+
+
+#%%--------------------------------------------------------------------------
+# DONCHIAN CHANNELS
+#----------------------------------------------------------------------------
+
+def donchian_history(n_periods, high, low):
+    """ Highest high and lowest low of the last n_periods candles.
+
+    Returns:
+        channels (dict) {'upper', 'lower', 'middle'} of np.array
+
+    """
+    high, low = np.asarray(high, dtype=np.float64), np.asarray(low, dtype=np.float64)
+    if len(high) < n_periods:
+        upper = lower = np.empty(0)
+    else:
+        upper = np.lib.stride_tricks.sliding_window_view(high, n_periods).max(axis=1)
+        lower = np.lib.stride_tricks.sliding_window_view(low, n_periods).min(axis=1)
+
+    return {'upper':  window_aligned(n_periods, upper, len(high)),
+            'lower':  window_aligned(n_periods, lower, len(high)),
+            'middle': window_aligned(n_periods, (upper + lower) / 2, len(high)),
+           }
+
+
 
-    ema = [values[0]]
-    for i in range(1,len(values)):
-      ema.append( EMA_tick(n_periods, values[i], ema[i-1]) )
+class donchian_stream(window_stream):
 
-    return ema
+    def __init__(self, n_periods):
+        window_stream.__init__(self, n_periods, columns=2)
 
 
+    def update(self, high, low):
+        if not self.push(high, low):
+            return {'upper': np.nan, 'lower': np.nan, 'middle': np.nan}
+        channels = donchian_history(self.n_periods, *self.arrays())
+        return {channel: values[-1] for channel, values in channels.items()}
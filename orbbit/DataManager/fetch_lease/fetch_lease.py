@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+
+import os
+import math
+import socket
+import hashlib
+import pymongo
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Milliseconds a lease or a worker heartbeat is valid without being renewed
+LEASE_TTL = 30000
+
+# Seconds between lease rounds, must be well below LEASE_TTL
+LEASE_RENEW_INTERVAL = 10
+
+
+
+
+#%%##########################################################################
+#                               FETCH LEASES                                #
+#############################################################################
+
+class fetch_leases():
+    """ Split fetch units between workers with lease documents in the database.
+
+    A unit is anything with a string id, e.g. all the timeframes of one
+    symbol @ exchange. Every round, each worker renews its heartbeat and its
+    leases, then takes free or expired leases until it owns its fair share
+    (units / live workers), or drops the extra ones. A dead worker stops
+    renewing, so its units are taken over after LEASE_TTL.
+
+    Collections:
+        fetch_workers {'_id': worker_id, 'expires': millis, 'host': str, 'pid': int}
+        fetch_leases  {'_id': unit, 'owner': worker_id, 'expires': millis}
+
+    Args:
+        database (pymongo.database.Database)
+        worker_id (str) unique per process, host and pid by default
+
+    """
+
+    def __init__(self, database, worker_id=None, ttl=LEASE_TTL):
+        self.worker_id = worker_id or (socket.gethostname() + '_' + str(os.getpid()))
+        self.ttl = ttl
+
+        self.leases = database['fetch_leases']
+        self.workers = database['fetch_workers']
+
+
+    def heartbeat(self, now):
+        self.workers.update_one({'_id': self.worker_id},
+                                {'$set': {'expires': now + self.ttl, 'host': socket.gethostname(), 'pid': os.getpid()}},
+                                upsert=True)
+
+
+    def live_workers(self, now):
+        return max(1, self.workers.count_documents({'expires': {'$gt': now}}))
+
+
+    def renew(self, now):
+        """ Extend our leases.
+
+        Returns:
+            owned (set) units leased by this worker.
+
+        """
+        self.leases.update_many({'owner': self.worker_id}, {'$set': {'expires': now + self.ttl}})
+        return {lease['_id'] for lease in self.leases.find({'owner': self.worker_id}, {'_id': True})}
+
+
+    def acquire(self, unit, now):
+        """ Take the lease of 'unit' if it is free or expired.
+        """
+        try:
+            lease = self.leases.find_one_and_update(
+                        {'_id': unit, '$or': [{'expires': {'$lt': now}}, {'owner': self.worker_id}]},
+                        {'$set': {'owner': self.worker_id, 'expires': now + self.ttl}},
+                        upsert=True,
+                        return_document=pymongo.ReturnDocument.AFTER)
+            return lease['owner'] == self.worker_id
+        except pymongo.errors.DuplicateKeyError:
+            # held by another worker
+            return False
+
+
+    def release(self, unit):
+        self.leases.delete_one({'_id': unit, 'owner': self.worker_id})
+
+
+    def release_all(self):
+        self.leases.delete_many({'owner': self.worker_id})
+        self.workers.delete_one({'_id': self.worker_id})
+
+
+    def balance(self, units, now):
+        """ One lease round.
+
+        Args:
+            units (list) ids of all the units to share
+            now (int) millis
+
+        Returns:
+            owned (set) units this worker must run now.
+
+        """
+        self.heartbeat(now)
+        fair_share = math.ceil(len(units) / self.live_workers(now))
+
+        owned = self.renew(now)
+
+        for unit in owned - set(units):
+            self.release(unit)
+        owned &= set(units)
+
+        # each worker tries the units in a different order, to avoid contention
+        for unit in sorted(units, key=self.preference):
+            if len(owned) >= fair_share:
+                break
+            if not unit in owned and self.acquire(unit, now):
+                owned.add(unit)
+
+        for unit in sorted(owned, key=self.preference)[fair_share:]:
+            self.release(unit)
+            owned.discard(unit)
+
+        return owned
+
+
+    def preference(self, unit):
+        return hashlib.md5((self.worker_id + unit).encode('utf-8')).hexdigest()
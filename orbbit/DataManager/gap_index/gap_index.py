@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+
+import math
+import bisect
+
+
+#%%##########################################################################
+#                                 GAP INDEX                                 #
+#############################################################################
+
+def find_gaps(date8061, timeframe_millis, from_millis, to_millis):
+    """ Ranges of missing candles.
+
+    Args:
+        date8061 (list) sorted timestamps of the stored candles
+        timeframe_millis (int) candle length
+        from_millis, to_millis: first and last candle expected, both included.
+            from_millis is rounded up to a candle boundary.
+
+    Returns:
+        gaps (list) [[first_missing, last_missing], ...] candle timestamps,
+        both included.
+
+    Example:
+        find_gaps([0, 60000, 240000], 60000, 0, 300000)
+        [[120000, 180000], [300000, 300000]]
+
+    """
+
+    first = math.ceil(from_millis / timeframe_millis) * timeframe_millis
+
+    gaps = []
+    expected = first
+    for candle_time in date8061:
+        if candle_time < expected:
+            continue
+        if candle_time > to_millis:
+            break
+        if candle_time > expected:
+            gaps.append([expected, candle_time - timeframe_millis])
+        expected = candle_time + timeframe_millis
+
+    if expected <= to_millis:
+        gaps.append([expected, to_millis - (to_millis - expected) % timeframe_millis])
+
+    return gaps
+
+
+
+def gap_requests(gaps, timeframe_millis, data_limit):
+    """ Exchange requests (since, limit) that cover every gap.
+
+    Gaps closer than data_limit candles share the same request.
+
+    Args:
+        gaps (list) as returned by find_gaps
+        timeframe_millis (int) candle length
+        data_limit (int) max candles per request
+
+    Returns:
+        requests (list) [(since, limit), ...]
+
+    """
+
+    requests = []
+    since = None
+
+    for gap_from, gap_to in gaps:
+        while gap_from <= gap_to:
+            if since is None:
+                since = gap_from
+
+            window_end = since + (data_limit - 1) * timeframe_millis
+            if gap_from > window_end:
+                requests.append(request_for(since, last_missing, timeframe_millis))
+                since = gap_from
+                continue
+
+            last_missing = min(gap_to, window_end)
+            if last_missing < gap_to:
+                requests.append(request_for(since, last_missing, timeframe_millis))
+                since = None
+            gap_from = last_missing + timeframe_millis
+
+    if since is not None:
+        requests.append(request_for(since, last_missing, timeframe_millis))
+
+    return requests
+
+
+
+def request_for(since, last_missing, timeframe_millis):
+    return (int(since), int((last_missing - since) // timeframe_millis + 1))
+
+
+
+def subtract_ranges(gaps, ranges, timeframe_millis):
+    """ Remove 'ranges' from 'gaps', both as returned by find_gaps.
+    """
+
+    remaining = []
+    for gap_from, gap_to in gaps:
+        pieces = [[gap_from, gap_to]]
+        for range_from, range_to in ranges:
+            next_pieces = []
+            for piece_from, piece_to in pieces:
+                if range_to < piece_from or range_from > piece_to:
+                    next_pieces.append([piece_from, piece_to])
+                    continue
+                if piece_from < range_from:
+                    next_pieces.append([piece_from, range_from - timeframe_millis])
+                if range_to < piece_to:
+                    next_pieces.append([range_to + timeframe_millis, piece_to])
+            pieces = next_pieces
+        remaining += pieces
+
+    return remaining
+
+
+
+def filter_missing(ohlcv, gaps):
+    """ Keep only the candles that fall inside a gap.
+
+    Args:
+        ohlcv (list) candles as output by ccxt
+        gaps (list) as returned by find_gaps
+
+    """
+
+    gap_starts = [gap[0] for gap in gaps]
+
+    missing = []
+    for candle in ohlcv:
+        i = bisect.bisect_right(gap_starts, candle[0]) - 1
+        if i >= 0 and candle[0] <= gaps[i][1]:
+            missing.append(candle)
+
+    return missing
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+import os
+import json
+import numpy as np
+
+from   orbbit.common.data_dir import *
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Where the computed indicator series are written
+INDICATOR_SERIES_ROUTE = os.environ.get('ORBBIT_SERIES_ROUTE', data_route('series'))
+
+
+
+
+#%%##########################################################################
+#                             INDICATOR SERIES                              #
+#############################################################################
+# An indicator computed over the whole history of a stream, from its first
+# stored candle, so a value does not depend on the range it is requested
+# with. Same layout as the ohlcv archive, raw little-endian columns plus
+# 'meta.json' with the number of values and the state of the stream form of
+# the indicator after the last one:
+#
+#   <INDICATOR_SERIES_ROUTE>/<exchange_id>_<symbol>/<timeframe>/<indicator>/date8061.bin   int64
+#                                                                           value.bin      float64
+#                                                                           meta.json
+#
+# Series are only appended to: the new values are written at the end of the
+# column files, then meta.json, so extending a series costs as much as the
+# new values. Candles written before the last date of a series after it was
+# computed (e.g. a late gap fill) are not in it, delete the directory of the
+# series to compute it again. So are the series of older versions, written
+# as .npy files.
+
+INDICATOR_SERIES_DTYPES = {'date8061': np.dtype('<i8'), 'value': np.dtype('<f8')}
+
+
+
+def series_route(exchange_id, symbol, timeframe, indicator, route=INDICATOR_SERIES_ROUTE):
+    return os.path.join(route, exchange_id + '_' + symbol.replace('/', '_'), timeframe, indicator)
+
+
+
+class indicator_series():
+    """ Stored values of one indicator of one stream.
+
+    Args:
+        route (str) directory of the series, see series_route
+
+    Example:
+        series = indicator_series(series_route('hitbtc2', 'BTC/USDT', '1m', 'ema_12'))
+        ema = EMA_stream(12)
+        if series.state() is not None:
+            ema.restore(series.state())
+        series.append(date8061, ema.extend(close), ema.state())
+        date8061, values = series.read(from_millis, to_millis)
+
+    """
+
+    def __init__(self, route):
+        self.route = route
+
+
+    def meta(self):
+        try:
+            with open(os.path.join(self.route, 'meta.json')) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return {'count': 0, 'state': None}
+
+        if not os.path.exists(os.path.join(self.route, 'date8061.bin')):
+            # written as .npy by an older version
+            return {'count': 0, 'state': None}
+        return meta
+
+
+    def state(self):
+        """ State of the indicator after the last value, None if the series is empty.
+        """
+        return self.meta()['state']
+
+
+    def columns(self):
+        """ Returns:
+            date8061 (np.array int64), values (np.array float64), memory-mapped, read-only.
+        """
+        count = self.meta()['count']
+        if count == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        return tuple(np.memmap(os.path.join(self.route, column + '.bin'), dtype=dtype, mode='r', shape=(count,))
+                     for column, dtype in INDICATOR_SERIES_DTYPES.items())
+
+
+    def newest(self):
+        """ Date of the last value, None if there is none.
+        """
+        date8061, values = self.columns()
+        return int(date8061[-1]) if len(date8061) else None
+
+
+    def read(self, from_millis, to_millis):
+        """ Values within from_millis and to_millis, both included, slices of the files.
+        """
+        date8061, values = self.columns()
+        first = np.searchsorted(date8061, from_millis, side='left')
+        last = np.searchsorted(date8061, to_millis, side='right')
+        return date8061[first:last], values[first:last]
+
+
+    def append(self, date8061, values, state):
+        """ Add values newer than the last one.
+
+        Args:
+            date8061, values (np.array)
+            state (dict) of the indicator after the last of 'values'
+
+        """
+        if len(date8061) == 0:
+            return
+
+        count = self.meta()['count']
+        os.makedirs(self.route, exist_ok=True)
+
+        for column, new in (('date8061', date8061), ('value', values)):
+            dtype = INDICATOR_SERIES_DTYPES[column]
+            with open(os.path.join(self.route, column + '.bin'), 'ab') as f:
+                # values of an interrupted append, past the count
+                f.truncate(count * dtype.itemsize)
+                f.write(np.ascontiguousarray(new, dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        temporary = os.path.join(self.route, 'meta.json.tmp')
+        with open(temporary, 'w') as f:
+            json.dump({'count': count + len(date8061), 'state': state}, f)
+        os.replace(temporary, os.path.join(self.route, 'meta.json'))
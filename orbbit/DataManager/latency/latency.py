@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+
+import time
+import bisect
+import threading
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Upper bounds of the histogram buckets, in milliseconds. One more bucket
+# holds anything slower.
+LATENCY_BUCKETS = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000, 120000, 300000]
+
+# Pipeline stages, in the order a closed candle goes through them. All of
+# them but 'exchange_call' are measured from the candle close.
+LATENCY_STAGES = ['exchange_call', # duration of the exchange query
+                  'fetched',       # exchange answer received
+                  'enqueued',      # put in the subscriber queues (send_to_subscribers)
+                  'stored',        # database write done
+                  'transformed',   # transform output ready, for transformed streams
+                  'sent',          # written to the subscriber connections
+                 ]
+
+
+
+
+#%%##########################################################################
+#                              LATENCY HISTOGRAMS                           #
+#############################################################################
+
+class latency_histogram():
+    """ Fixed bucket histogram of latencies in milliseconds.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.last = 0
+
+
+    def add(self, millis):
+        self.counts[bisect.bisect_left(self.buckets, millis)] += 1
+        self.count += 1
+        self.total += millis
+        self.max = max(self.max, millis)
+        self.last = millis
+
+
+    def percentile(self, fraction):
+        """ Upper bound of the bucket that holds the 'fraction' percentile.
+        """
+        if self.count == 0:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+
+    def status(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else 0,
+                'max': self.max,
+                'last': self.last,
+                'p50': self.percentile(0.50),
+                'p90': self.percentile(0.90),
+                'p99': self.percentile(0.99),
+                'buckets': {('<=' + str(bound)): count for bound, count in zip(self.buckets, self.counts)},
+                'slower': self.counts[-1],
+               }
+
+
+
+class pipeline_latency():
+    """ Latency histograms per stream and stage, shared by all the threads
+    of the pipeline.
+
+    Example:
+        latency = pipeline_latency()
+        latency.record_close('ohlcv_hitbtc2_BTCUSDT_1m', 'stored', date8061 + timeframe_millis)
+        latency.status()
+
+    """
+
+    def __init__(self):
+        self.histograms = {} # dict {'stream_id': {'stage': latency_histogram, ... }, ... }
+        self.lock = threading.Lock()
+
+
+    def record(self, stream_id, stage, millis):
+        with self.lock:
+            stream = self.histograms.setdefault(stream_id, {})
+            if not stage in stream:
+                stream[stage] = latency_histogram()
+            stream[stage].add(millis)
+
+
+    def record_close(self, stream_id, stage, close_millis, now_millis=None):
+        """ Record how long after close_millis (the end of a candle) 'stage' was reached.
+        """
+        if now_millis is None:
+            now_millis = time.time() * 1000
+        self.record(stream_id, stage, max(0, now_millis - close_millis))
+
+
+    def status(self, stream_id=None):
+        """ Summary of the histograms, of one stream or all of them.
+
+        Returns:
+            status (dict) {'stream_id': {'stage': histogram status, ... }, ... }
+            with the stages in pipeline order.
+
+        """
+        with self.lock:
+            stream_ids = [stream_id] if stream_id else list(self.histograms)
+            return {sid: {stage: self.histograms[sid][stage].status() for stage in sorted(self.histograms[sid], key=stage_order)}
+                    for sid in stream_ids if sid in self.histograms}
+
+
+
+def stage_order(stage):
+    return LATENCY_STAGES.index(stage) if stage in LATENCY_STAGES else len(LATENCY_STAGES)
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+import threading
+import numpy as np
+
+
+#%%##########################################################################
+#                                OHLCV CACHE                                #
+#############################################################################
+
+class ohlcv_ring():
+    """ Most recent candles of one stream, in NumPy arrays.
+
+    Each candle has a fixed slot, (date8061 / timeframe) % depth, so an open
+    candle is refreshed in place and the oldest candle is overwritten as a
+    new one arrives. Thread-safe, written by the fetch engine and read by
+    the API threads.
+
+    Args:
+        timeframe_millis (int) candle length
+        depth (int) candles kept
+
+    Example:
+        ring = ohlcv_ring(timeframe_to_millis('1m'), 1000)
+        ring.load(get_db_candles(symbol, exchange_id, '1m', from_millis, to_millis), from_millis)
+        ring.update(new_ohlcv)
+        date8061, values = ring.read(from_millis, to_millis)
+
+    """
+
+    def __init__(self, timeframe_millis, depth):
+        self.timeframe_millis = timeframe_millis
+        self.depth = depth
+
+        self.dates = np.full(depth, -1, dtype=np.int64)
+        self.values = np.zeros((depth, 5), dtype=np.float64) # open, high, low, close, volume
+
+        self.newest = None
+        self.complete_from = None # every stored candle from here on is in the ring
+        self.lock = threading.Lock()
+
+
+    def _put(self, candle):
+        date8061 = int(candle[0])
+        slot = (date8061 // self.timeframe_millis) % self.depth
+        self.dates[slot] = date8061
+        self.values[slot] = candle[1:6]
+        if self.newest is None or date8061 > self.newest:
+            self.newest = date8061
+
+
+    def load(self, ohlcv, from_millis):
+        """ Fill with the stored candles since from_millis. Candles already
+        in the ring are newer than the stored ones, and are kept.
+        """
+        with self.lock:
+            for candle in ohlcv:
+                slot = (int(candle[0]) // self.timeframe_millis) % self.depth
+                if self.dates[slot] != candle[0]:
+                    self._put(candle)
+            self.complete_from = int(from_millis)
+
+
+    def update(self, ohlcv):
+        """ Add or refresh candles as output by ccxt ohlcv.
+        """
+        with self.lock:
+            for candle in ohlcv:
+                self._put(candle)
+
+
+    def oldest(self):
+        """ Start of the range served by the ring, None while it is not loaded.
+        """
+        if self.complete_from is None:
+            return None
+        if self.newest is None:
+            return self.complete_from
+        return max(self.complete_from, self.newest - (self.depth - 1) * self.timeframe_millis)
+
+
+    def read(self, from_millis, to_millis):
+        """ Candles within from_millis and to_millis, both included. Only the
+        part of the range from oldest() on is served.
+
+        Returns:
+            date8061 (np.array int64) sorted
+            values (np.array float64) one [open, high, low, close, volume] row per candle
+
+        """
+        with self.lock:
+            oldest = self.oldest()
+            if oldest is None:
+                return np.empty(0, dtype=np.int64), np.empty((0, 5))
+
+            lower = max(from_millis, oldest)
+            valid = (self.dates >= lower) & (self.dates <= to_millis)
+            slots = np.nonzero(valid)[0]
+            slots = slots[np.argsort(self.dates[slots])]
+            return self.dates[slots].copy(), self.values[slots].copy()
+
+
+
+def ring_to_documents(date8061, values, timeframe):
+    """ Candles read from a ring as documents like the ones of get_db_ohlcv.
+    """
+    return [{'_id': timeframe + '_' + str(date),
+             'date8061': date,
+             'ohlcv': {'open': row[0], 'high': row[1], 'low': row[2], 'close': row[3], 'volume': row[4]},
+            }
+            for date, row in zip(date8061.tolist(), values.tolist())]
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+
+#%%##########################################################################
+#                                  ROLL-UP                                  #
+#############################################################################
+
+def candle_bucket(date8061, timeframe_millis):
+    """ Start of the timeframe_millis candle that contains date8061.
+    """
+    return date8061 - (date8061 % timeframe_millis)
+
+
+
+def merge_candle(rolled, candle):
+    """ Add a lower timeframe candle to the higher timeframe candle 'rolled'.
+    Both as output by ccxt ohlcv, 'candle' must be newer than the ones in 'rolled'.
+    """
+    rolled[2] = max(rolled[2], candle[2])
+    rolled[3] = min(rolled[3], candle[3])
+    rolled[4] = candle[4]
+    rolled[5] = rolled[5] + candle[5]
+
+
+
+def rollup_candles(ohlcv, timeframe_millis):
+    """ Build higher timeframe candles from a complete history.
+
+    Args:
+        ohlcv (list) candles as output by ccxt, sorted by date
+        timeframe_millis (int) length of the candles to build
+
+    Returns:
+        ohlcv (list) one candle per timeframe_millis period
+
+    Example:
+        ohlcv_1h = rollup_candles(ohlcv_1m, timeframe_to_millis('1h'))
+
+    """
+
+    rolled = []
+    for candle in ohlcv:
+        bucket = candle_bucket(candle[0], timeframe_millis)
+        if rolled and rolled[-1][0] == bucket:
+            merge_candle(rolled[-1], candle)
+        else:
+            rolled.append([bucket] + list(candle[1:6]))
+
+    return rolled
+
+
+
+class candle_rollup():
+    """ Build one higher timeframe candle at a time from streamed candles.
+
+    The candle being built keeps its lower timeframe parts, so an updated
+    (still open) part replaces its previous version instead of being added
+    twice.
+
+    Args:
+        timeframe_millis (int) length of the candles to build
+
+    """
+
+    def __init__(self, timeframe_millis):
+        self.timeframe_millis = timeframe_millis
+        self.bucket = None
+        self.parts = {} # dict {date8061: candle, ... } of the open candle
+        self.closed = []
+        self.closed_until = 0
+
+
+    def update(self, candle, overwrite=True):
+        """ Add or refresh a lower timeframe candle.
+
+        Candles older than the one being built are ignored.
+        """
+        bucket = candle_bucket(candle[0], self.timeframe_millis)
+
+        if bucket < self.closed_until or (self.parts and bucket < self.bucket):
+            return
+
+        if self.parts and bucket > self.bucket:
+            self.close()
+
+        self.bucket = bucket
+        if overwrite or not candle[0] in self.parts:
+            self.parts[candle[0]] = list(candle)
+
+
+    def current(self):
+        """ Candle being built, None if there is no data yet.
+        """
+        if not self.parts:
+            return None
+        return rollup_candles([self.parts[key] for key in sorted(self.parts)], self.timeframe_millis)[0]
+
+
+    def close(self):
+        self.closed.append(self.current())
+        self.closed_until = self.bucket + self.timeframe_millis
+        self.parts = {}
+
+
+    def pop_closed(self, now):
+        """ Candles completed since the last call.
+
+        Args:
+            now (int) millis, the open candle is complete once it has ended.
+
+        """
+        if self.parts and self.bucket + self.timeframe_millis <= now:
+            self.close()
+
+        closed = self.closed
+        self.closed = []
+        return closed
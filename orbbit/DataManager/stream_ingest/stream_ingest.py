@@ -0,0 +1,270 @@
+#!/usr/bin/python3
+
+import os
+import csv
+import json
+import time
+import asyncio
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+REPLAY_HOST = '127.0.0.1'
+REPLAY_PORT = 5090
+
+# Recorded candles shipped with the repo, BTC/USDT 5m and XRP/USDT 15m. The
+# timeframe of each file is taken from the spacing of its candles.
+REPLAY_DATA_ROUTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'robots', 'examples', 'data')
+REPLAY_DATA_FILES = {'BTC/USDT': 'Data_HitBtc_BTCUSD_1t.csv',
+                     'XRP/USDT': 'Data_HitBtc_XRPUSD_1t.csv',
+                    }
+
+
+
+
+#%%##########################################################################
+#                               FEED MESSAGES                               #
+#############################################################################
+# Push feeds send one JSON message per line:
+#
+#   {'type': 'subscribe', 'symbol': 'BTC/USDT', 'timeframe': '5m'}  (client to feed)
+#   {'type': 'candle', 'symbol': 'BTC/USDT', 'ohlcv': [date8061, o, h, l, c, v], 'sent': millis}
+#   {'type': 'trade',  'symbol': 'BTC/USDT', 'timestamp': millis, 'price': p, 'amount': a, 'sent': millis}
+#   {'type': 'error',  'error': 'Symbol XXX/USDT not available.'}  (then the feed is closed)
+#
+# A 'candle' message holds the current state of a candle, it is sent again
+# while it is open. Adapters for real exchange feeds translate their
+# messages to these ones.
+
+def feed_message(message):
+    return (json.dumps(message) + '\n').encode('ascii')
+
+
+
+async def read_feed_message(reader):
+    """ Next message from an asyncio StreamReader, None once the feed is closed.
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line.decode('ascii'))
+
+
+
+FEED_TIMEFRAME_UNITS = {'s': 1000, 'm': 60 * 1000, 'h': 60 * 60 * 1000, 'd': 24 * 60 * 60 * 1000, 'w': 7 * 24 * 60 * 60 * 1000}
+
+def feed_timeframe_millis(timeframe):
+    """ Length of a timeframe like '5m', None if it is not valid.
+    """
+    try:
+        return int(timeframe[:-1]) * FEED_TIMEFRAME_UNITS[timeframe[-1]]
+    except (TypeError, ValueError, KeyError, IndexError):
+        return None
+
+
+
+
+#%%##########################################################################
+#                              CANDLE BUILDER                               #
+#############################################################################
+
+class feed_candle_builder():
+    """ Candles of one stream, built from feed messages.
+
+    Args:
+        timeframe_millis (int) candle length
+
+    """
+
+    def __init__(self, timeframe_millis):
+        self.timeframe_millis = timeframe_millis
+        self.candle = None # open candle, as output by ccxt ohlcv
+        self.closed = []
+
+
+    def _open(self, date8061):
+        """ Close the open candle if date8061 belongs to a newer one.
+        Returns False for data older than the open candle.
+        """
+        if self.candle is not None:
+            if date8061 < self.candle[0]:
+                return False
+            if date8061 > self.candle[0]:
+                self.closed.append(self.candle)
+                self.candle = None
+        return True
+
+
+    def add_trade(self, timestamp, price, amount):
+        date8061 = timestamp - (timestamp % self.timeframe_millis)
+        if not self._open(date8061):
+            return
+
+        if self.candle is None:
+            self.candle = [date8061, price, price, price, price, amount]
+        else:
+            self.candle[2] = max(self.candle[2], price)
+            self.candle[3] = min(self.candle[3], price)
+            self.candle[4] = price
+            self.candle[5] += amount
+
+
+    def add_candle(self, candle):
+        if self._open(candle[0]):
+            self.candle = list(candle)
+
+
+    def add_message(self, message):
+        if message['type'] == 'trade':
+            self.add_trade(message['timestamp'], message['price'], message['amount'])
+        elif message['type'] == 'candle':
+            self.add_candle(message['ohlcv'])
+
+
+    def pop(self):
+        """ Candles closed since the last call, plus the open one.
+
+        Returns:
+            ohlcv (list) candles as output by ccxt
+            final_until (int) millis, the candles that end before are closed
+
+        """
+        ohlcv = self.closed + ([list(self.candle)] if self.candle else [])
+        self.closed = []
+        final_until = self.candle[0] if self.candle else (ohlcv[-1][0] + self.timeframe_millis if ohlcv else 0)
+        return ohlcv, final_until
+
+
+
+
+#%%##########################################################################
+#                               REPLAY SERVER                               #
+#############################################################################
+
+def load_csv_candles(route):
+    """ Candles from a 'date,open,high,low,close,volume' CSV, sorted by date.
+
+    Example:
+        ohlcv = load_csv_candles(os.path.join(REPLAY_DATA_ROUTE, REPLAY_DATA_FILES['BTC/USDT']))
+
+    """
+    with open(route) as f:
+        rows = list(csv.DictReader(f))
+
+    ohlcv = [[int(row['date']), float(row['open']), float(row['high']), float(row['low']), float(row['close']), float(row['volume'])] for row in rows]
+    ohlcv.sort(key=lambda candle: candle[0])
+    return ohlcv
+
+
+
+class replay_server():
+    """ Local stand-in for an exchange push feed, replays recorded candles.
+
+    Every subscriber gets the candles of its symbol from the start. Each
+    candle is sent 'updates' times, growing from its open to its final
+    values, like an open candle on a live feed. A subscription to another
+    timeframe than the one of the recorded candles gets an error.
+
+    Args:
+        ohlcv (dict) {'symbol': candles as output by ccxt, ... }
+        interval (float) seconds between candles, 0 to replay as fast as possible
+        updates (int) messages per candle
+
+    Example:
+        server = replay_server({'BTC/USDT': load_csv_candles(route)}, interval=0.01)
+        server.start()
+
+    """
+
+    def __init__(self, ohlcv, interval=0.0, updates=1, host=REPLAY_HOST, port=REPLAY_PORT):
+        self.ohlcv = ohlcv
+        self.timeframes = {symbol: candle_spacing(candles) for symbol, candles in ohlcv.items()} # millis
+        self.interval = interval
+        self.updates = updates
+        self.host = host
+        self.port = port
+        self.sent = 0
+
+
+    async def serve(self):
+        server = await asyncio.start_server(self.replay, self.host, self.port)
+        print('Replay feed serving ' + ', '.join(self.ohlcv.keys()) + ' on ' + self.host + ':' + str(self.port))
+        async with server:
+            await server.serve_forever()
+
+
+    def start(self):
+        """ Serve forever in the calling thread.
+        """
+        asyncio.run(self.serve())
+
+
+    async def replay(self, reader, writer):
+        subscription = await read_feed_message(reader)
+        symbol = subscription['symbol']
+
+        try:
+            if not symbol in self.ohlcv:
+                error = 'Symbol ' + str(symbol) + ' not available.'
+            elif feed_timeframe_millis(subscription.get('timeframe')) != self.timeframes[symbol]:
+                error = 'Timeframe ' + str(subscription.get('timeframe')) + ' not available, ' + symbol + ' candles are ' + str(self.timeframes[symbol]) + ' ms.'
+            else:
+                error = None
+
+            if error:
+                writer.write(feed_message({'type': 'error', 'error': error}))
+                await writer.drain()
+                return
+
+            for candle in self.ohlcv[symbol]:
+                for update in partial_candles(candle, self.updates):
+                    writer.write(feed_message({'type': 'candle', 'symbol': symbol, 'ohlcv': update, 'sent': time.time() * 1000}))
+                    self.sent += 1
+                await writer.drain()
+
+                if self.interval:
+                    await asyncio.sleep(self.interval)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+
+def candle_spacing(ohlcv):
+    """ Timeframe of sorted candles in millis, the shortest step between two of them.
+    """
+    steps = [newer[0] - older[0] for older, newer in zip(ohlcv, ohlcv[1:]) if newer[0] > older[0]]
+    return min(steps) if steps else None
+
+
+
+def partial_candles(candle, updates):
+    """ States of 'candle' while it was open, the last one is 'candle'.
+    """
+    date8061, open_price, high, low, close, volume = candle
+    partial = []
+    for i in range(1, updates + 1):
+        progress = i / updates
+        price = open_price + (close - open_price) * progress
+        partial.append([date8061,
+                        open_price,
+                        high if i == updates else max(open_price, price),
+                        low  if i == updates else min(open_price, price),
+                        price if i < updates else close,
+                        volume * progress,
+                      ])
+    return partial
+
+
+
+
+#%%##########################################################################
+#                                SCRIPT MODE                                #
+#############################################################################
+if __name__ == '__main__':
+    print("Replay feed in script mode.")
+    recorded = {symbol: load_csv_candles(os.path.join(REPLAY_DATA_ROUTE, REPLAY_DATA_FILES[symbol])) for symbol in REPLAY_DATA_FILES}
+    replay_server(recorded, interval=0.01, updates=3).start()
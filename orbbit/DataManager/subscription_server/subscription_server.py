@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+
+import struct
+import asyncio
+import threading
+
+from   orbbit.common.subscription_protocol import *
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Connections waiting to be accepted
+SUBSCRIPTION_BACKLOG = 1024
+
+# Bytes waiting to be sent to a subscriber before it is dropped as too slow
+SUBSCRIPTION_BUFFER_MAX = 1024 * 1024
+
+
+
+
+#%%##########################################################################
+#                           SUBSCRIPTION MESSAGES                           #
+#############################################################################
+# Framed messages, see subscription_protocol. A client can subscribe to any
+# number of streams over the same connection:
+#
+#   {'type': 'hello', 'encodings': ['struct', 'msgpack', 'json']}  (client to server, optional, first)
+#   {'type': 'subscribe', 'res': 'macd', 'params': {...}}
+#   {'type': 'subscribe', 'stream_id': 'ohlcv_hitbtc2_BTC/USDT_1m'}
+#   {'type': 'unsubscribe', 'stream_id': 'ohlcv_hitbtc2_BTC/USDT_1m'}
+#
+#   {'type': 'hello', 'encoding': 'struct'}                        (server to client, always JSON)
+#   {'type': 'subscribed', 'stream_id': ...}
+#   {'type': 'unsubscribed', 'stream_id': ...}
+#   {'type': 'error', 'error': 'Stream not available.', 'request': {...}}
+#   {'type': 'data', 'stream_id': ..., 'data': {...}}
+#
+# The server sends in the first encoding of the hello message it supports,
+# JSON without hello.
+
+
+
+
+#%%##########################################################################
+#                            SUBSCRIPTION SERVER                            #
+#############################################################################
+
+class subscription_server(threading.Thread):
+    """ One asyncio endpoint for the subscriptions to every stream.
+
+    Each client is a coroutine that reads its subscribe / unsubscribe
+    messages. publish() can be called from any thread, the data is encoded
+    once per encoding in use and written to the clients of the stream by the
+    event loop without waiting for them.
+
+    Args:
+        subscribe (function) subscribe(message) -> stream_id of a subscribe
+            message, None if it is not available. Called in a worker thread,
+            it can start the stream.
+        on_sent (function) on_sent(stream_id, data) once data is written to
+            the clients of the stream, optional.
+
+    Example:
+        server = subscription_server('0.0.0.0', 5100, subscribe)
+        server.start()
+        server.publish('ohlcv_hitbtc2_BTC/USDT_1m', new_data)
+
+    """
+
+    def __init__(self, host, port, subscribe, on_sent=None, backlog=SUBSCRIPTION_BACKLOG, buffer_max=SUBSCRIPTION_BUFFER_MAX):
+        threading.Thread.__init__(self, daemon=True)
+        self.host = host
+        self.port = port
+        self.subscribe = subscribe
+        self.on_sent = on_sent
+        self.backlog = backlog
+        self.buffer_max = buffer_max
+
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+
+        self.clients = {} # dict {'stream_id': set of writers, ... }
+        self.encodings = {} # dict {writer: 'encoding', ... }
+        self.connections = 0
+        self.published = 0
+        self.encoded = 0 # frames encoded for the published data, at most one per encoding and message
+        self.dropped = 0 # clients too slow to keep up
+        self.last_error = None
+
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.serve_client, self.host, self.port, backlog=self.backlog))
+        except OSError as ex:
+            self.last_error = repr(ex)
+            print('ERR subscription server on ' + self.host + ':' + str(self.port) + ': ' + self.last_error)
+            self.started.set()
+            return
+
+        print('Subscriptions served on ' + self.host + ':' + str(self.port))
+        self.started.set()
+        self.loop.run_forever()
+
+
+    def publish(self, stream_id, data):
+        """ Send data to the clients subscribed to stream_id.
+        """
+        if self.clients.get(stream_id):
+            self.loop.call_soon_threadsafe(self.send, stream_id, data)
+
+
+    def send(self, stream_id, data):
+        writers = self.clients.get(stream_id)
+        if not writers:
+            return
+
+        # encoded once per encoding, every client of that encoding gets the same bytes
+        message = {'type': 'data', 'stream_id': stream_id, 'data': data}
+        frames = {}
+
+        for writer in list(writers):
+            if writer.transport.get_write_buffer_size() > self.buffer_max:
+                print('ERR subscriber of ' + stream_id + ' too slow, dropped.')
+                self.dropped += 1
+                self.remove(writer)
+                writer.close()
+                continue
+
+            encoding = self.encodings[writer]
+            if not encoding in frames:
+                frames[encoding] = encode_frame(message, encoding)
+            writer.write(frames[encoding])
+
+        self.encoded += len(frames)
+
+        self.published += 1
+        if self.on_sent:
+            self.on_sent(stream_id, data)
+
+
+    def remove(self, writer):
+        for stream_id in list(self.clients):
+            self.clients[stream_id].discard(writer)
+            if not self.clients[stream_id]:
+                del self.clients[stream_id]
+
+
+    async def serve_client(self, reader, writer):
+        self.connections += 1
+        self.encodings[writer] = 'json'
+        try:
+            while True:
+                try:
+                    message = await read_frame(reader)
+                except (ValueError, struct.error) as ex:
+                    # the frames can not be told apart any more
+                    print('ERR subscription client: ' + str(ex))
+                    break
+
+                if message is None:
+                    break
+
+                try:
+                    reply = await self.handle(message, writer)
+                    frame = encode_frame(reply, 'json' if reply['type'] == 'hello' else self.encodings[writer])
+                except Exception as ex:
+                    # e.g. a failing subscribe, the connection and its other streams go on
+                    self.last_error = repr(ex)
+                    print('ERR subscription client message ' + str(message)[:200] + ': ' + self.last_error)
+                    frame = self.error_frame('Message failed: ' + repr(ex), message, writer)
+
+                writer.write(frame)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            self.remove(writer)
+            del self.encodings[writer]
+            writer.close()
+
+
+    def error_frame(self, error, request, writer):
+        """ Error reply to 'request', without it if it can not be encoded back.
+        """
+        reply = {'type': 'error', 'error': error, 'request': request}
+        try:
+            return encode_frame(reply, self.encodings[writer])
+        except (TypeError, ValueError):
+            del reply['request']
+            return encode_frame(reply, self.encodings[writer])
+
+
+    async def handle(self, message, writer):
+        """ Reply to a client message.
+        """
+        if not isinstance(message, dict):
+            return {'type': 'error', 'error': 'Invalid message.'}
+
+        if message.get('type') == 'hello':
+            self.encodings[writer] = negotiate_encoding(message.get('encodings'))
+            return {'type': 'hello', 'encoding': self.encodings[writer]}
+
+        elif message.get('type') == 'subscribe':
+            stream_id = await self.loop.run_in_executor(None, self.subscribe, message)
+            if stream_id is None:
+                return {'type': 'error', 'error': 'Stream not available.', 'request': message}
+
+            self.clients.setdefault(stream_id, set()).add(writer)
+            return {'type': 'subscribed', 'stream_id': stream_id}
+
+        elif message.get('type') == 'unsubscribe':
+            stream_id = message.get('stream_id')
+            if stream_id in self.clients:
+                self.clients[stream_id].discard(writer)
+                if not self.clients[stream_id]:
+                    del self.clients[stream_id]
+            return {'type': 'unsubscribed', 'stream_id': stream_id}
+
+        else:
+            return {'type': 'error', 'error': 'Invalid message type.', 'request': message}
+
+
+    def status(self):
+        return {'host': self.host,
+                'port': self.port,
+                'connections': self.connections,
+                'subscribers': {stream_id: len(writers) for stream_id, writers in list(self.clients.items())},
+                'published': self.published,
+                'encoded': self.encoded,
+                'dropped': self.dropped,
+                'last_error': self.last_error,
+               }
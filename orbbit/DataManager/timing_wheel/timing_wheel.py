@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+
+import math
+import heapq
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Slots per wheel and number of wheels, deadlines further than
+# TIMING_WHEEL_SIZE ** TIMING_WHEEL_LEVELS ticks wait in a heap
+TIMING_WHEEL_SIZE = 64
+TIMING_WHEEL_LEVELS = 4
+
+
+
+
+#%%##########################################################################
+#                               TIMING WHEEL                                #
+#############################################################################
+
+class timing_wheel():
+    """ Hierarchical timing wheel.
+
+    Scheduling and expiring are O(1) whatever the number of pending
+    deadlines. The innermost wheel has one slot per tick, each outer wheel
+    has one slot per full turn of the wheel inside it. Deadlines further
+    than all the wheels wait in a heap.
+
+    Args:
+        tick_millis (int) resolution, deadlines are rounded up to a tick
+        wheel_size (int) slots per wheel
+        levels (int) number of wheels
+        start_millis (int) current time
+
+    Example:
+        wheel = timing_wheel(100, start_millis=current_millis())
+        wheel.schedule(current_millis() + 60e3, 'in one minute')
+        expired = wheel.advance(current_millis())
+
+    """
+
+    def __init__(self, tick_millis=100, wheel_size=TIMING_WHEEL_SIZE, levels=TIMING_WHEEL_LEVELS, start_millis=0):
+        self.tick_millis = tick_millis
+        self.wheel_size = wheel_size
+        self.levels = levels
+
+        self.wheels = [[[] for slot in range(wheel_size)] for level in range(levels)]
+        self.overflow = [] # heap [(deadline_tick, order, item), ... ]
+        self.order = 0
+
+        self.current_tick = int(start_millis // tick_millis)
+        self.pending = 0
+
+
+    def schedule(self, deadline_millis, item):
+        """ Add 'item', it will be returned by the first advance() at or after deadline_millis.
+        """
+        deadline_tick = max(math.ceil(deadline_millis / self.tick_millis), self.current_tick + 1)
+        self.pending += 1
+        self._insert(deadline_tick, item)
+
+
+    def _insert(self, deadline_tick, item):
+        delta = deadline_tick - self.current_tick
+
+        span = 1
+        for level in range(self.levels):
+            if delta < span * self.wheel_size:
+                slot = (deadline_tick // span) % self.wheel_size
+                self.wheels[level][slot].append((deadline_tick, item))
+                return
+            span *= self.wheel_size
+
+        self.order += 1
+        heapq.heappush(self.overflow, (deadline_tick, self.order, item))
+
+
+    def advance(self, now_millis):
+        """ Move the wheel up to now_millis.
+
+        Returns:
+            expired (list) items whose deadline has passed, in deadline order.
+
+        """
+        expired = []
+        target_tick = int(now_millis // self.tick_millis)
+        outer_span = self.wheel_size ** self.levels
+
+        while self.current_tick < target_tick:
+            self.current_tick += 1
+
+            while self.overflow and self.overflow[0][0] - self.current_tick < outer_span:
+                deadline_tick, order, item = heapq.heappop(self.overflow)
+                self._insert(deadline_tick, item)
+
+            # outer wheels first, so that their entries can fall into the inner slot due now
+            for level in reversed(range(1, self.levels)):
+                span = self.wheel_size ** level
+                if self.current_tick % span == 0:
+                    slot = (self.current_tick // span) % self.wheel_size
+                    entries = self.wheels[level][slot]
+                    self.wheels[level][slot] = []
+                    for deadline_tick, item in entries:
+                        self._insert(deadline_tick, item)
+
+            slot = self.current_tick % self.wheel_size
+            expired += [item for deadline_tick, item in self.wheels[0][slot]]
+            self.wheels[0][slot] = []
+
+        self.pending -= len(expired)
+        return expired
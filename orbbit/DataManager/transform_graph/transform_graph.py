@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+
+import os
+import json
+
+from   orbbit.common.data_dir import *
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Saved state of the transform nodes, see checkpoint_store
+TRANSFORM_CHECKPOINT_ROUTE = os.environ.get('ORBBIT_CHECKPOINT_ROUTE', process_route('transform_checkpoints.json'))
+
+
+
+
+#%%##########################################################################
+#                              TRANSFORM GRAPH                              #
+#############################################################################
+# Transformed streams are built from indicator nodes. Nodes are keyed by
+# what they compute (e.g. 'ema_12_ohlcv_hitbtc2_BTC/USDT_1m'), so a node
+# shared by several streams, like the fast EMA of two MACDs, is created and
+# updated once. The inputs of a node are other nodes or the ohlcv streams
+# (sources) the graph is fed with.
+
+class transform_node():
+    """ One indicator in the graph.
+
+    Args:
+        node_id (str) unique, nodes with the same id give the same values
+        inputs (list) node_ids or source stream_ids it reads
+        update (function) update(*input_values) -> value, called once per
+            source candle. A source value is the candle {'date8061', 'ohlcv'}.
+
+    """
+
+    def __init__(self, node_id, inputs, update):
+        self.node_id = node_id
+        self.inputs = inputs
+        self.update = update
+
+        self.value = None
+        self.date8061 = None # candle of the last update
+        self.state = None    # function state() -> JSON-like dict to restore the node, None if it has none
+
+
+
+def build_node(node_id, inputs, make_update):
+    """ Node not in any graph yet, see transform_graph.node for the arguments.
+
+    Building can be slow (make_update reads the warm-up history), this way it
+    is done without holding the graph, that is only needed to add the node.
+    """
+    update, value, date8061, state = make_update()
+    node = transform_node(node_id, inputs, update)
+    node.value = value
+    node.date8061 = date8061
+    node.state = state
+    return node
+
+
+
+def catch_up(stream, update, checkpoint, candles):
+    """ make_update result (see transform_graph.node) of a node computed by
+    a stream form indicator (see data_transform).
+
+    Args:
+        stream: the indicator, restored from 'checkpoint' if there is one
+        update (function) update(candle) -> value, updates 'stream'
+        checkpoint (dict) of the node, as returned by checkpoint_store.get, or None
+        candles (list) past candles {'date8061', 'ohlcv'} to warm up with,
+            the ones not newer than the checkpoint are skipped
+
+    Example:
+        ema = EMA_stream(12)
+        graph.node(node_id, [source], lambda: catch_up(ema, lambda candle: float(ema.update(candle['ohlcv']['close'])),
+                                                       checkpoints.get(node_id), candles))
+
+    """
+    value, date8061 = None, None
+    if checkpoint:
+        stream.restore(checkpoint['state'])
+        value, date8061 = checkpoint['value'], checkpoint['date8061']
+
+    for candle in candles:
+        if date8061 is None or candle['date8061'] > date8061:
+            value, date8061 = update(candle), candle['date8061']
+
+    return update, value, date8061, stream.state
+
+
+
+class transform_graph():
+    """ Deduplicated graph of transform nodes.
+
+    Example:
+        graph = transform_graph()
+        graph.node('ema_12_' + source, [source], lambda: (ema_update, None, None, None))
+        updated = graph.tick(source, candle)
+
+    """
+
+    def __init__(self):
+        self.nodes = {}      # dict {'node_id': transform_node, ... }
+        self.dependents = {} # dict {'node_id' or source: [node_ids that read it], ... }
+        self.orders = {}     # dict {source: [node_ids in update order], ... }
+
+
+    def node(self, node_id, inputs, make_update):
+        """ The node 'node_id', created if it is not in the graph yet.
+
+        Args:
+            make_update (function) make_update() -> (update, value, date8061, state),
+                the update function of the node, its value once warmed up
+                with past candles, and its state function (see
+                transform_node). Only called when the node is created.
+
+        """
+        if node_id in self.nodes:
+            return self.nodes[node_id]
+
+        return self.add(build_node(node_id, inputs, make_update))
+
+
+    def add(self, node):
+        """ Add a node built with build_node, unless there already is one with its node_id.
+
+        Returns:
+            the node in the graph with that node_id.
+
+        """
+        if node.node_id in self.nodes:
+            return self.nodes[node.node_id]
+
+        self.nodes[node.node_id] = node
+        for input_id in node.inputs:
+            self.dependents.setdefault(input_id, []).append(node.node_id)
+
+        self.orders = {}
+        return node
+
+
+    def sources(self, node_id):
+        """ Source stream_ids 'node_id' depends on.
+        """
+        if not node_id in self.nodes:
+            return {node_id}
+        return set().union(*[self.sources(input_id) for input_id in self.nodes[node_id].inputs])
+
+
+    def update_order(self, source):
+        """ Nodes that depend on 'source', each after its inputs.
+        """
+        if not source in self.orders:
+            order = []
+            visited = set()
+
+            def visit(node_id):
+                visited.add(node_id)
+                for dependent in self.dependents.get(node_id, []):
+                    if not dependent in visited:
+                        visit(dependent)
+                order.append(node_id)
+
+            visit(source)
+            self.orders[source] = [node_id for node_id in reversed(order) if node_id != source]
+
+        return self.orders[source]
+
+
+    def tick(self, source, candle, only=None):
+        """ Update every node that depends on 'source' with a new candle.
+
+        A node skips candles not newer than its last one, e.g. the ones
+        already in the history it was warmed up with.
+
+        Args:
+            only (set) node_ids to update, every node by default
+
+        Returns:
+            updated (list) node_ids, in update order
+
+        """
+        updated = []
+        for node_id in self.update_order(source):
+            if only is not None and not node_id in only:
+                continue
+
+            node = self.nodes[node_id]
+            if node.date8061 is not None and candle['date8061'] <= node.date8061:
+                continue
+
+            values = [candle if not input_id in self.nodes else self.nodes[input_id].value for input_id in node.inputs]
+            node.value = node.update(*values)
+            node.date8061 = candle['date8061']
+            updated.append(node_id)
+
+        return updated
+
+
+    def checkpoints(self):
+        """ State of the nodes that have one.
+
+        Returns:
+            checkpoints (dict) {'node_id': {'date8061', 'value', 'state'}, ... }
+
+        """
+        return {node_id: {'date8061': node.date8061, 'value': node.value, 'state': node.state()}
+                for node_id, node in self.nodes.items() if node.state is not None and node.date8061 is not None}
+
+
+
+
+#%%##########################################################################
+#                             CHECKPOINT STORE                              #
+#############################################################################
+
+class checkpoint_store():
+    """ Node checkpoints in a JSON file, so that the nodes come back from
+    their last state instead of warming up from scratch.
+
+    Args:
+        route (str) JSON file, {'node_id': checkpoint, ... }
+
+    Example:
+        checkpoints = checkpoint_store()
+        checkpoints.save(graph.checkpoints())
+        checkpoint = checkpoints.get('ema_200_ohlcv_hitbtc2_BTC/USDT_1m')
+
+    """
+
+    def __init__(self, route=TRANSFORM_CHECKPOINT_ROUTE):
+        self.route = route
+        try:
+            with open(route) as f:
+                self.checkpoints = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.checkpoints = {}
+
+
+    def get(self, node_id):
+        return self.checkpoints.get(node_id)
+
+
+    def save(self, checkpoints):
+        """ Add or replace checkpoints, then write the whole file.
+        """
+        self.checkpoints.update(checkpoints)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.route)), exist_ok=True)
+        temporary = self.route + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.checkpoints, f)
+        os.replace(temporary, self.route)
@@ -0,0 +1,393 @@
+#!/usr/bin/python3
+
+import os
+import json
+import math
+import time
+import heapq
+import queue
+import threading
+
+from   orbbit.DataManager.latency.latency import latency_histogram
+from   orbbit.common.data_dir import *
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Candle batches waiting to be written, more are sent to the spill file
+WRITE_BEHIND_MAX_DEPTH = 10000
+
+# Seconds the writer waits after the first batch to gather more in the same commit
+WRITE_BEHIND_GROUP_WINDOW = 0.05
+
+# Seconds between retries of the spilled candles while the database is down
+WRITE_BEHIND_RETRY_INTERVAL = 5
+
+# Candles not written yet when the database is unavailable, one JSON batch
+# per line. They are written first when it is back, also after a restart.
+WRITE_BEHIND_SPILL_ROUTE = os.environ.get('ORBBIT_SPILL_ROUTE', process_route('write_behind.spill'))
+
+# Failed writes of a batch, for errors other than the database being
+# unavailable (e.g. a document it rejects), before it is given up on
+WRITE_BEHIND_MAX_ATTEMPTS = 10
+
+# Batches given up on, one JSON line each with the reason, to be looked at by hand
+WRITE_BEHIND_DEAD_LETTER_ROUTE = os.environ.get('ORBBIT_DEAD_LETTER_ROUTE', process_route('write_behind.dead'))
+
+BATCH_FIELDS = ('sequence', 'exchange_id', 'symbol', 'timeframe_millis', 'documents')
+
+
+
+
+#%%##########################################################################
+#                            WRITE-BEHIND QUEUE                             #
+#############################################################################
+
+class write_behind(threading.Thread):
+    """ Candle writes decoupled from the fetchers.
+
+    put() only queues the batch. The writer thread takes every batch waiting
+    (and the spill file), keeps the newest version of each candle and writes
+    them with one bulk write per symbol @ exchange and timeframe. If that
+    fails, the candles go to the spill file and are retried along with the
+    next ones. A batch that keeps failing for any other reason than the
+    database being unavailable goes to the dead letter file.
+
+    Each batch gets a sequence number when it is put, a candle is only
+    replaced by a newer batch whatever the order of the queue and the file.
+
+    Args:
+        write (function) write(exchange_id, symbol, timeframe_millis, new_documents), see storage_backend.write_ohlcv
+        unavailable (tuple) exceptions of 'write' that mean the database is
+            unavailable, batches are retried for as long as they last
+
+    Example:
+        writer = write_behind(storage.write_ohlcv, STORAGE_UNAVAILABLE_ERRORS)
+        writer.start()
+        sequence = writer.put('hitbtc2', 'BTC/USDT', 60000, new_documents)
+        writer.flush(sequence)
+
+    """
+
+    def __init__(self, write, unavailable, spill_route=WRITE_BEHIND_SPILL_ROUTE, dead_letter_route=WRITE_BEHIND_DEAD_LETTER_ROUTE,
+                 max_depth=WRITE_BEHIND_MAX_DEPTH, max_attempts=WRITE_BEHIND_MAX_ATTEMPTS):
+        threading.Thread.__init__(self, daemon=True)
+        self.write = write
+        self.unavailable = unavailable
+        self.spill_route = spill_route
+        self.dead_letter_route = dead_letter_route
+        self.max_attempts = max_attempts
+
+        self.queue = queue.Queue(max_depth)
+        self.spill_lock = threading.Lock()
+
+        # batches put while the queue is full, the spiller thread writes them
+        # to the spill file so that put() never waits for the disk
+        self.overflow = []
+        self.overflow_lock = threading.Lock()
+        self.overflow_ready = threading.Event()
+
+        self.sequence = 0
+        self.sequence_lock = threading.Lock()
+
+        self.pending = []     # heap of the sequences put and not yet written or spilled
+        self.finished = set() # sequences done while an older one is still pending
+        self.finished_condition = threading.Condition()
+
+        self.flush_latency = latency_histogram() # put to written, milliseconds
+        self.commits = 0
+        self.written = 0
+        self.spilled = 0     # candles in the spill file
+        self.dead = 0        # candles sent to the dead letter file
+        self.last_error = None
+
+        # left by a previous run, so that flush does not return True before they are written
+        with self.spill_lock:
+            self.spilled = sum(len(batch['documents']) for batch in self.read_spill(remove=False))
+
+
+    def next_sequence(self):
+        with self.sequence_lock:
+            self.sequence = max(time.time_ns(), self.sequence + 1)
+            return self.sequence
+
+
+    def put(self, exchange_id, symbol, timeframe_millis, new_documents, on_written=None):
+        """ Queue candle documents, all of the same timeframe, for writing.
+
+        Args:
+            on_written (function) called without arguments from the writer
+                thread once they are in the database, not if they are spilled.
+
+        Returns:
+            sequence (int) of the batch, see flush. None if there are no documents.
+
+        """
+        if not new_documents:
+            return None
+
+        sequence = self.next_sequence()
+        batch = {'sequence': sequence,
+                 'exchange_id': exchange_id,
+                 'symbol': symbol,
+                 'timeframe_millis': timeframe_millis,
+                 'documents': new_documents,
+                 'attempts': 0,
+                 'put': time.time() * 1000,
+                 'on_written': on_written,
+                }
+
+        with self.finished_condition:
+            heapq.heappush(self.pending, sequence)
+
+        try:
+            self.queue.put_nowait(batch)
+        except queue.Full:
+            # writes are slower than the fetchers, do not hold them back
+            with self.overflow_lock:
+                self.overflow.append(batch)
+            self.overflow_ready.set()
+
+        return sequence
+
+
+    def flush(self, sequence=None, timeout=None):
+        """ Wait until the batches up to 'sequence' are written or spilled.
+
+        Args:
+            sequence (int) as returned by put, every batch put so far by default.
+                Batches put later are not waited for.
+
+        Returns:
+            True if they are done and nothing is left in the spill file.
+
+        """
+        if sequence is None:
+            sequence = self.sequence
+
+        with self.finished_condition:
+            self.finished_condition.wait_for(lambda: self.oldest_pending() > sequence, timeout)
+            return self.oldest_pending() > sequence and self.spilled == 0
+
+
+    def oldest_pending(self):
+        """ Oldest sequence not done yet, finished_condition must be held.
+        """
+        while self.pending and self.pending[0] in self.finished:
+            self.finished.discard(heapq.heappop(self.pending))
+        return self.pending[0] if self.pending else math.inf
+
+
+    def done(self, sequences):
+        with self.finished_condition:
+            self.finished.update(sequences)
+            self.oldest_pending()
+            self.finished_condition.notify_all()
+
+
+    def run(self):
+        threading.Thread(target=self.run_spiller, daemon=True).start()
+
+        while True:
+            try:
+                first = [self.queue.get(timeout=WRITE_BEHIND_RETRY_INTERVAL)]
+                time.sleep(WRITE_BEHIND_GROUP_WINDOW)
+            except queue.Empty:
+                if not self.spilled:
+                    continue
+                first = []
+
+            queued = []
+            batches = []
+            try:
+                # the whole queue and spill file, so that no older version of
+                # a candle can be written after this commit
+                with self.spill_lock:
+                    queued = first + self.drain() + self.take_overflow()
+                    batches = queued + self.read_spill(remove=True)
+
+                self.commit(batches)
+            except Exception as ex:
+                # the writer must go on, or every flush would wait forever
+                self.last_error = repr(ex)
+                print('ERR write-behind: ' + self.last_error)
+                self.dead_letter(batches, 'write-behind error: ' + self.last_error)
+            finally:
+                self.done([batch['sequence'] for batch in queued])
+
+
+    def run_spiller(self):
+        """ Write the overflow batches to the spill file.
+        """
+        while True:
+            self.overflow_ready.wait()
+            with self.spill_lock:
+                batches = self.take_overflow()
+                try:
+                    self.spill(batches)
+                except Exception as ex:
+                    self.last_error = repr(ex)
+                    print('ERR write-behind spill: ' + self.last_error)
+            self.done([batch['sequence'] for batch in batches])
+
+
+    def drain(self):
+        batches = []
+        while True:
+            try:
+                batches.append(self.queue.get_nowait())
+            except queue.Empty:
+                return batches
+
+
+    def take_overflow(self):
+        with self.overflow_lock:
+            batches, self.overflow = self.overflow, []
+            self.overflow_ready.clear()
+        return batches
+
+
+    def commit(self, batches):
+        """ Write the newest version of each candle in 'batches', spill them if the database fails.
+        """
+        batches.sort(key=lambda batch: batch['sequence'])
+
+        groups = {} # dict {(exchange_id, symbol, timeframe_millis): {date8061: document, ... }, ... }
+        sequences = {}
+        attempts = {}
+        for batch in batches:
+            key = (batch['exchange_id'], batch['symbol'], batch['timeframe_millis'])
+            group = groups.setdefault(key, {})
+            for document in batch['documents']:
+                group[document['date8061']] = document
+            sequences[key] = batch['sequence']
+            attempts[key] = max(attempts.get(key, 0), batch.get('attempts', 0))
+
+        keys = list(groups)
+        written = set()
+        for i, key in enumerate(keys):
+            exchange_id, symbol, timeframe_millis = key
+            documents = sorted(groups[key].values(), key=lambda document: document['date8061'])
+            try:
+                self.write(exchange_id, symbol, timeframe_millis, documents)
+            except Exception as ex:
+                self.last_error = repr(ex)
+                print('ERR write-behind, spilling ' + str(sum(len(groups[key]) for key in keys[i:])) + ' candles: ' + self.last_error)
+
+                # only the failed group is one attempt closer to the dead letter
+                # file, and not while the database is just unavailable
+                if not isinstance(ex, self.unavailable):
+                    attempts[key] += 1
+
+                with self.spill_lock:
+                    self.spill([{'sequence': sequences[key],
+                                 'exchange_id': key[0],
+                                 'symbol': key[1],
+                                 'timeframe_millis': key[2],
+                                 'documents': list(groups[key].values()),
+                                 'attempts': attempts[key],
+                                } for key in keys[i:]])
+                break
+
+            written.add(key)
+            self.written += len(documents)
+            self.commits += 1
+
+        # the batches of the groups written before a failure are in the database too
+        now = time.time() * 1000
+        for batch in batches:
+            if not (batch['exchange_id'], batch['symbol'], batch['timeframe_millis']) in written:
+                continue
+            if 'put' in batch:
+                self.flush_latency.add(now - batch['put'])
+            if batch.get('on_written'):
+                try:
+                    batch['on_written']()
+                except Exception as ex:
+                    print('ERR write-behind on_written: ' + repr(ex))
+
+
+    def spill(self, batches):
+        """ Append batches to the spill file, spill_lock must be held.
+
+        Batches that failed too many times, or can not be written as JSON, go
+        to the dead letter file instead.
+        """
+        if not batches:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.spill_route)), exist_ok=True)
+        with open(self.spill_route, 'a') as f:
+            for batch in batches:
+                if batch.get('attempts', 0) >= self.max_attempts:
+                    self.dead_letter([batch], 'failed ' + str(batch['attempts']) + ' times, last error: ' + str(self.last_error))
+                    continue
+
+                try:
+                    line = json.dumps({field: batch[field] for field in BATCH_FIELDS + ('attempts',)})
+                except (TypeError, ValueError) as ex:
+                    self.dead_letter([batch], 'not JSON serializable: ' + repr(ex))
+                    continue
+
+                f.write(line + '\n')
+                self.spilled += len(batch['documents'])
+
+
+    def read_spill(self, remove):
+        """ Batches in the spill file, spill_lock must be held.
+
+        Lines that are not a batch (e.g. a partial line) go to the dead letter file.
+        """
+        try:
+            with open(self.spill_route) as f:
+                lines = [line for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+        batches = []
+        for line in lines:
+            try:
+                batch = json.loads(line)
+                if all(field in batch for field in BATCH_FIELDS):
+                    batches.append(batch)
+                    continue
+            except ValueError:
+                pass
+            if remove:
+                self.dead_letter([{'line': line}], 'invalid spill line')
+
+        if remove:
+            os.remove(self.spill_route)
+            self.spilled = 0
+        return batches
+
+
+    def dead_letter(self, batches, reason):
+        """ Give up on batches, they are appended to the dead letter file.
+        """
+        if not batches:
+            return
+
+        candles = sum(len(batch.get('documents', [])) for batch in batches)
+        print('ERR write-behind, ' + str(len(batches)) + ' batches (' + str(candles) + ' candles) to the dead letter file: ' + reason)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.dead_letter_route)), exist_ok=True)
+        with open(self.dead_letter_route, 'a') as f:
+            for batch in batches:
+                fields = {field: value for field, value in batch.items() if field not in ('put', 'on_written')}
+                f.write(json.dumps({'reason': reason, 'batch': fields}, default=str) + '\n')
+        self.dead += candles
+
+
+    def status(self):
+        return {'depth': self.queue.qsize(),
+                'unfinished': len(self.pending),
+                'spilled': self.spilled,
+                'dead': self.dead,
+                'commits': self.commits,
+                'written': self.written,
+                'last_error': self.last_error,
+                'flush_latency': self.flush_latency.status(),
+               }
@@ -8,7 +8,7 @@ import socket
 from   flask      import Flask, jsonify, abort, make_response, request
 from   flask_cors import CORS
 import asyncio
-import ccxt.async as ccxt
+import ccxt.async_support as ccxt_async
 import pymongo
 import json
 
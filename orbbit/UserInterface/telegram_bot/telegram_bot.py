@@ -10,6 +10,8 @@ import requests
 from   pkg_resources import resource_filename
 from   telegram.ext  import Updater, CommandHandler, MessageHandler, Filters
 
+from   orbbit.common.subscription_protocol import *
+
 
 #----------------------------------------------------------------------------
 # Host settings
@@ -173,25 +175,28 @@ class alert_macd(threading.Thread):
         print(response_dict)
 
         #%% keep only the (IP, PORT) part of the response, the socket expects a tuple.
-        subs = list( response_dict.values() )[0]
+        stream_id, subs = list( response_dict.items() )[0]
         ip_port_tuple = tuple(subs)
 
         #%% connect socket
         try:
-            self.subscription_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.subscription = subscription_client(*ip_port_tuple)
         except socket.error:
-            print('Failed to create socket')
+            print('Failed to connect to the subscription server')
             sys.exit()
 
-        self.subscription_socket.connect( ip_port_tuple )
+        self.subscription.subscribe(stream_id)
         print('Bot connected to MACD subscription socket')
 
     def run(self):
 
         #%% get new data as soon as it is generated
-        while 1:
-            reply = self.subscription_socket.recv(4096) # waits here until new data is received
-            reply_dict = json.loads(reply.decode('ascii')) # turn string into data structure
+        for message in self.subscription.messages(): # waits here until new data is received
+            if message['type'] != 'data':
+                print(message)
+                continue
+
+            reply_dict = message['data']
             # print('Telegram bot alert_macd thread got new subs data.')
             # print(reply_dict)
 
@@ -2,16 +2,25 @@
 
 import os
 import sys
+import copy
 import time
+import threading
 from   datetime       import timedelta
 from   flask          import make_response, request, current_app
 from   functools      import update_wrapper
 import json
 import pymongo
+import numpy as np
 from   pkg_resources  import resource_filename
 import ccxt
 from   flask_httpauth import HTTPBasicAuth
 
+from   orbbit.common.rate_governor import *
+from   orbbit.common.ohlcv_storage import *
+from   orbbit.common.ohlcv_archive import *
+from   orbbit.common.storage_backend import *
+from   orbbit.common.sqlite_storage import *
+
 
 #%%##########################################################################
 #                          CONFIGURATION PARAMETERS                         #
@@ -23,6 +32,19 @@ typical_quote_currencies = ['USDT', 'BTC', 'ETH']
 
 typical_exchanges = ['hitbtc2', 'bittrex', 'binance', 'kraken']
 
+# Storage for candles and info: 'mongo' or 'sqlite' (embedded, single node)
+STORAGE_BACKEND = os.environ.get('ORBBIT_STORAGE_BACKEND', 'mongo')
+
+# Max connections in the pool of each database client
+DB_POOL_SIZE = 50
+
+# Seconds an info document read from the database is kept in memory
+DB_INFO_CACHE_TTL = 5
+
+# Drop cached info documents as soon as they change in the database. Needs
+# a replica set, without one the cache relies on DB_INFO_CACHE_TTL.
+DB_INFO_CHANGE_STREAM = True
+
 
 #%%##########################################################################
 #                             GENERIC FUNCTIONS                             #
@@ -90,6 +112,19 @@ def candle_to_document(candle, timeframe):
 
 
 
+
+def document_to_candle(document):
+    """ Convert database documents back to candles (ohlcv).
+    Args:
+        document: as stored by candle_to_document, or returned by get_db_ohlcv
+    Returns:
+        candle as output by ccxt ohlcv
+    """
+    ohlcv = document['ohlcv']
+    return [document['date8061'], ohlcv['open'], ohlcv['high'], ohlcv['low'], ohlcv['close'], ohlcv['volume']]
+
+
+
 # Types that are implemented
 valid_subscribtion_resources = {'fetched': ['ohlcv',],
                                 'transformed': ['macd',],
@@ -149,22 +184,33 @@ def dict_from_key(route):
         db_key = dict_from_key('DataManager/keys/db.key')
         database_names = db_key.keys()
         for database_name in database_names:
-            db_connection = pymongo.MongoClient(db_key[database_name]['url'], db_key[database_name]['port'])
-            db = db_connection[database_name]
-            db.authenticate(db_key[database_name]['user'], db_key[database_name]['password'])
+            db_connection = database_connection(database_name).client
             db_connection.drop_database(database_name)
 
     """
 
+database_clients = {} # dict {'database_name': pymongo.MongoClient, ... }
+database_clients_lock = threading.Lock()
+
 def database_connection(database_name):
+    """ Database handle from the client shared by the whole process.
 
-    db_key = dict_from_key('DataManager/keys/db.key')
-    # print(db_key)
-    db_connection = pymongo.MongoClient(db_key[database_name]['url'], db_key[database_name]['port'])
+    The first call creates the client, with its own connection pool, and
+    authenticates. Later calls reuse it.
+    """
+    with database_clients_lock:
+        if not database_name in database_clients:
+            db_key = dict_from_key('DataManager/keys/db.key')
+            database_clients[database_name] = pymongo.MongoClient(db_key[database_name]['url'],
+                                                                  db_key[database_name]['port'],
+                                                                  username=db_key[database_name]['user'],
+                                                                  password=db_key[database_name]['password'],
+                                                                  authSource=database_name,
+                                                                  maxPoolSize=DB_POOL_SIZE)
+            if DB_INFO_CHANGE_STREAM:
+                info_change_watcher(database_name).start()
 
-    db = db_connection[database_name]
-    db.authenticate(db_key[database_name]['user'], db_key[database_name]['password'])
-    return db
+    return database_clients[database_name][database_name]
 
 
 
@@ -173,10 +219,15 @@ def database_info_connection(database):
 
 
 
+database_info_cache = {} # dict {('database_name', 'info'): (read_time, value), ... }
+database_info_lock = threading.Lock()
+
 def get_database_info(database_name, info):
     """Get the 'info' field from the 'info' collection at the db.
 
     It stores parameters that should be kept between runs of the program.
+    Values are cached for DB_INFO_CACHE_TTL, or until they are updated.
+    Each call returns its own copy, it can be modified freely.
 
     Args:
         info (str): info field identifier.
@@ -196,48 +247,91 @@ def get_database_info(database_name, info):
 
     """
 
-    db_conn = database_connection(database_name)
-    info_connection = database_info_connection(db_conn)
+    with database_info_lock:
+        cached = database_info_cache.get((database_name, info))
+    if cached and time.time() - cached[0] < DB_INFO_CACHE_TTL:
+        return copy.deepcopy(cached[1])
 
-    try:
-        return info_connection.find( {info: {'$exists': True}} )[0][info]
-    except IndexError:
-        # if the database is empty, use these config by default
-        if database_name == 'datamanager':
-            new_documents = [
-                {'fetching_symbols':
-                    {'hitbtc2': {'BTC/USDT':   default_fetch_timeframes,
-                                 'ETH/USDT':   default_fetch_timeframes,
-                                },
-                     'bittrex': {'BTC/USDT':   default_fetch_timeframes,
-                                 'ETH/USDT':   default_fetch_timeframes,
-                                },
-                    }
+    read_time = time.time()
+    value = read_database_info(database_name, info)
+    with database_info_lock:
+        database_info_cache[(database_name, info)] = (read_time, value)
+    return copy.deepcopy(value)
+
+
+
+def read_database_info(database_name, info):
+    """ get_database_info without the cache.
+    """
+    value = storage.get_info(database_name, info)
+    if value is not None:
+        return value
+
+    # if the database is empty, use these config by default
+    if database_name == 'datamanager':
+        new_documents = {
+            'fetching_symbols':
+                {'hitbtc2': {'BTC/USDT':   default_fetch_timeframes,
+                             'ETH/USDT':   default_fetch_timeframes,
+                            },
+                 'bittrex': {'BTC/USDT':   default_fetch_timeframes,
+                             'ETH/USDT':   default_fetch_timeframes,
+                            },
                 },
-                {'fetch_exchanges':
-                    typical_exchanges
+            'fetch_exchanges':
+                typical_exchanges,
+        }
+    elif database_name == 'ordermanager':
+        new_documents = {
+            'user_info': {
+                'farolillo': {
+                    'exchanges': ['hitbtc2', 'binance'],
                 },
-            ]
-        elif database_name == 'ordermanager':
-            new_documents = [
-                {   'user_info': {
-                        'farolillo': {
-                            'exchanges': ['hitbtc2', 'binance'],
-                        },
-                        'linternita': {
-                            'exchanges': ['bittrex',],
-                        },
-                    }
+                'linternita': {
+                    'exchanges': ['bittrex',],
                 },
-            ]
-        info_connection.insert_many(new_documents, ordered = False )
-        return info_connection.find( {info: {'$exists': True}} )[0][info]
+            },
+        }
+    for key in new_documents:
+        if storage.get_info(database_name, key) is None:
+            storage.set_info(database_name, key, new_documents[key])
+    return storage.get_info(database_name, info)
 
 
 
 def update_database_info(database_name, key, value):
-    info_connection = database_info_connection( database_connection(database_name) )
-    info_connection.update_one( {key: {'$exists': True}}, {"$set": {key: value, }}, upsert=True )
+    storage.set_info(database_name, key, value)
+    invalidate_database_info(database_name, key)
+
+
+
+def invalidate_database_info(database_name, info=None):
+    """ Drop cached info, all of the database if info is None.
+    """
+    with database_info_lock:
+        for cached in list(database_info_cache):
+            if cached[0] == database_name and (info is None or cached[1] == info):
+                del database_info_cache[cached]
+
+
+
+class info_change_watcher(threading.Thread):
+    """ Invalidate the cached info of a database when its 'info' collection
+    changes, also when another process changes it.
+    """
+
+    def __init__(self, database_name):
+        threading.Thread.__init__(self, daemon=True)
+        self.database_name = database_name
+
+    def run(self):
+        info_connection = database_info_connection(database_clients[self.database_name][self.database_name])
+        try:
+            with info_connection.watch() as stream:
+                for change in stream:
+                    invalidate_database_info(self.database_name)
+        except pymongo.errors.PyMongoError as ex:
+            print('Info cache of ' + self.database_name + ' without change stream, expires after ' + str(DB_INFO_CACHE_TTL) + ' s. ' + repr(ex))
 
 
 
@@ -249,30 +343,29 @@ def add_fetching_symbol(exchange_id, symbol, timeframe):
         exchange_id = 'bittrex'
         symbol = 'BTC/USDT'
         timeframe = '1m'
-        fetching_symbols = add_fetching_symbol(exchange_id, symbol, timeframe)
+        fetching_symbols, is_new = add_fetching_symbol(exchange_id, symbol, timeframe)
 
     Args:
 
     Returns:
+        fetching_symbols (dict) updated fetchers.
+        is_new (1 / 0) whether it was not being fetched yet.
 
     """
 
     database_name = 'datamanager'
 
-    fetching_symbols = get_database_info(database_name, 'fetching_symbols')
+    # the defaults are written on the first read of an empty database
+    get_database_info(database_name, 'fetching_symbols')
 
-    if not timeframe in ( fetching_symbols.get(exchange_id, {}) ).get(symbol, {}):
-        is_new = 1
+    # atomic, the cached value can be stale and other processes add fetchers too
+    is_new = int(storage.add_to_info(database_name, 'fetching_symbols', [exchange_id, symbol], timeframe))
+    invalidate_database_info(database_name, 'fetching_symbols')
 
-        fetching_symbols.setdefault(exchange_id, {})
-        fetching_symbols[exchange_id].setdefault(symbol, [])
-        fetching_symbols[exchange_id][symbol].append(timeframe)
-
-
-        update_database_info('datamanager', 'fetching_symbols', fetching_symbols)
+    if is_new:
         print('Adding fetcher for ' + symbol + ' ' + timeframe + ' @ ' + exchange_id)
 
-    return fetching_symbols
+    return get_database_info(database_name, 'fetching_symbols'), is_new
 
 
 
@@ -280,6 +373,87 @@ def add_fetching_symbol(exchange_id, symbol, timeframe):
 #   Get information sets from DB
 #----------------------------------------------------------------------------
 
+ohlcv_indexed_collections = set() # names of the collections with OHLCV_INDEXES checked
+
+def ohlcv_collection(exchange_id, symbol):
+    """ Collection where the candles of symbol @ exchange_id are stored.
+
+    The first time a collection is opened its indexes are checked, and the
+    missing ones created (see ensure_ohlcv_indexes).
+    """
+    symbol_db = symbol.replace('/', '_')
+    collection_name = exchange_id + '_' + symbol_db
+    collection = database_connection('datamanager')[collection_name]
+
+    if not collection_name in ohlcv_indexed_collections:
+        created = ensure_ohlcv_indexes(collection)
+        if created: print('Created indexes ' + ', '.join(created) + ' in ' + collection_name)
+        ohlcv_indexed_collections.add(collection_name)
+
+    return collection
+
+
+
+class mongo_storage(storage_backend):
+    """ Storage in MongoDB, one collection of bucket documents per
+    symbol @ exchange (see ohlcv_storage), and one 'info' collection per
+    database. Connects on first use.
+    """
+
+    name = 'mongo'
+
+    def get_info(self, database_name, info):
+        info_connection = database_info_connection(database_connection(database_name))
+        document = info_connection.find_one({info: {'$exists': True}})
+        return document[info] if document else None
+
+
+    def set_info(self, database_name, info, value):
+        info_connection = database_info_connection(database_connection(database_name))
+        info_connection.update_one( {info: {'$exists': True}}, {"$set": {info: value, }}, upsert=True )
+
+
+    def add_to_info(self, database_name, info, keys, value):
+        if any('.' in key or key.startswith('$') for key in keys):
+            raise ValueError('Info keys can not contain \'.\' or start with \'$\': ' + str(keys))
+
+        info_connection = database_info_connection(database_connection(database_name))
+        result = info_connection.update_one( {info: {'$exists': True}}, {'$addToSet': {'.'.join([info] + list(keys)): value}} )
+        return result.modified_count == 1
+
+
+    def read_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis, from_millis, to_millis):
+        return read_ohlcv_documents(ohlcv_collection(exchange_id, symbol), timeframe, timeframe_millis, from_millis, to_millis)
+
+
+    def write_ohlcv(self, exchange_id, symbol, timeframe_millis, new_documents):
+        ohlcv_collection(exchange_id, symbol).bulk_write(bucket_updates(new_documents, timeframe_millis), ordered = False )
+        return len(new_documents)
+
+
+    def oldest_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis):
+        return oldest_ohlcv_date(ohlcv_collection(exchange_id, symbol), timeframe, timeframe_millis)
+
+
+    def delete_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis, from_millis, to_millis):
+        delete_ohlcv_documents(ohlcv_collection(exchange_id, symbol), timeframe, timeframe_millis, from_millis, to_millis)
+
+
+    def check_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis, from_millis, to_millis):
+        return check_ohlcv_query_plans(ohlcv_collection(exchange_id, symbol), timeframe, timeframe_millis, from_millis, to_millis)
+
+
+    def migrate_ohlcv(self, exchange_id, symbol, batch_buckets=10):
+        collection = ohlcv_collection(exchange_id, symbol)
+
+        migrated = {}
+        for timeframe in legacy_timeframes(collection):
+            migrated[timeframe] = migrate_ohlcv_timeframe(collection, timeframe, timeframe_to_millis(timeframe), batch_buckets)
+        return migrated
+
+
+
+
 def get_db_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis):
     """Get 'ohlcv' documents from db.
 
@@ -291,26 +465,163 @@ def get_db_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis):
         to_millis = current_millis() + 10e3
         ohlcv_cursor = get_db_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis)
     Args:
-        symbol, timeframe, from_millis, to_millis
+        symbol, timeframe, from_millis, to_millis (limits not included)
     Returns:
-        pymongo cursor pointing to the docs
+        list of docs {'_id', 'date8061', 'ohlcv'} sorted by date8061, from
+        the storage backend, and from the archive for the archived part of
+        the range (see archive_ohlcv).
 
     """
 
-    projection = {'date8061': True, 'ohlcv': True}
+    documents = read_stored_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis)
 
-    symbol_db = symbol.replace('/', '_')
+    return [document for document in documents if from_millis < document['date8061'] < to_millis]
 
-    collection_name = exchange_id + '_' + symbol_db
-    collection = datamanager_db[collection_name]
 
-    query = {'ohlcv': {'$exists': True},
-             'timeframe': timeframe,
-             'date8061': {'$gt': from_millis, '$lt': to_millis}
-            }
 
-    # print('get_db_ohlcv '+ str(len(cursor_to_list(collection.find(query, projection).sort('date8061', pymongo.ASCENDING)))))
-    return collection.find(query, projection).sort('date8061', pymongo.ASCENDING)
+def read_stored_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis):
+    """ Candle documents from the archive and the database, both limits included.
+
+    The database is only read after the newest archived candle.
+    """
+    archive = ohlcv_archive(archive_route(exchange_id, symbol, timeframe))
+    archived_until = archive.newest()
+
+    documents = []
+    if archived_until is not None and from_millis <= archived_until:
+        documents = archive_to_documents(archive.read(from_millis, to_millis), timeframe)
+        from_millis = archived_until + 1
+
+    if from_millis <= to_millis:
+        documents += storage.read_ohlcv(exchange_id, symbol, timeframe, timeframe_to_millis(timeframe), from_millis, to_millis)
+
+    return documents
+
+
+
+def get_ohlcv_arrays(symbol, exchange_id, timeframe, from_millis, to_millis):
+    """Get candles as NumPy columns, for long reads (research, backtests).
+
+    Ranges within the archive are slices of the memory-mapped files, no copy
+    is made.
+
+    Example:
+        columns = get_ohlcv_arrays('BTC/USDT', 'bittrex', '1m', 0, current_millis())
+        columns['close'].mean()
+    Args:
+        symbol, timeframe, from_millis, to_millis (limits included)
+    Returns:
+        columns (dict) {'date8061': np.array, 'open': ..., 'high', 'low', 'close', 'volume'}
+
+    """
+    archive = ohlcv_archive(archive_route(exchange_id, symbol, timeframe))
+    archived = archive.read(from_millis, to_millis)
+
+    archived_until = archive.newest()
+    if archived_until is not None and to_millis <= archived_until:
+        return archived
+
+    from_db = from_millis if archived_until is None else max(from_millis, archived_until + 1)
+    recent = [document_to_candle(document) for document in storage.read_ohlcv(exchange_id, symbol, timeframe, timeframe_to_millis(timeframe), from_db, to_millis)]
+    recent = np.array(recent, dtype=np.float64).reshape(-1, 6)
+
+    columns = {'date8061': np.concatenate([archived['date8061'], recent[:, 0].astype(np.int64)])}
+    for i, column in enumerate(OHLCV_ARCHIVE_COLUMNS[1:]):
+        columns[column] = np.concatenate([archived[column], recent[:, i + 1]])
+    return columns
+
+
+
+def archive_ohlcv(symbol, exchange_id, timeframe, before_millis, batch_buckets=100, delete=True):
+    """Move the candles older than before_millis from the database to the archive.
+
+    before_millis is rounded down to a bucket start (see ohlcv_storage), so
+    only whole bucket documents are moved. Candles are appended to the archive before they are
+    deleted from the database, so an interrupted run loses nothing.
+
+    Example:
+        archive_ohlcv('BTC/USDT', 'bittrex', '1m', current_millis() - 90 * 24 * 3600e3)
+    Args:
+        batch_buckets (int) buckets moved at a time
+        delete (bool) delete the archived candles from the database. Leave
+            them if other hosts read the database and can not see the
+            archive, only the candles after the archive are copied then.
+    Returns:
+        archived (int) candles archived.
+
+    """
+    timeframe_millis = timeframe_to_millis(timeframe)
+    cutoff = bucket_start(before_millis, timeframe_millis)
+
+    archive = ohlcv_archive(archive_route(exchange_id, symbol, timeframe))
+
+    oldest = storage.oldest_ohlcv(exchange_id, symbol, timeframe, timeframe_millis)
+    if oldest is None:
+        return 0
+
+    batch_from = bucket_start(oldest, timeframe_millis)
+    newest = archive.newest()
+    if not delete and newest is not None:
+        batch_from = max(batch_from, bucket_start(newest + timeframe_millis, timeframe_millis))
+
+    archived = 0
+    while batch_from < cutoff:
+        batch_to = min(batch_from + batch_buckets * timeframe_millis * OHLCV_BUCKET_CANDLES, cutoff) - 1
+
+        documents = storage.read_ohlcv(exchange_id, symbol, timeframe, timeframe_millis, batch_from, batch_to)
+        late = archive.append([document_to_candle(document) for document in documents])
+        if late:
+            print('ERR archive ' + symbol + ' @ ' + exchange_id + ' ' + timeframe + ': ' + str(len(late)) + ' candles older than the archive, kept in late.json')
+        if delete:
+            storage.delete_ohlcv(exchange_id, symbol, timeframe, timeframe_millis, batch_from, batch_to)
+
+        archived += len(documents)
+        batch_from = batch_to + 1
+
+    return archived
+
+
+
+
+def migrate_ohlcv(exchange_id, symbol, batch_buckets=10):
+    """Convert the candles of symbol @ exchange_id stored in former layouts
+    to compact buckets (see migrate_ohlcv_timeframe). Can run while fetching.
+
+    Example:
+        migrate_ohlcv('bittrex', 'BTC/USDT')
+    Returns:
+        migrated (dict) {'timeframe': candles converted, ... }
+
+    """
+    return storage.migrate_ohlcv(exchange_id, symbol, batch_buckets)
+
+
+
+def get_db_ohlcv_dates(symbol, exchange_id, timeframe, from_millis, to_millis):
+    """Get the timestamps of the stored candles, both limits included.
+
+    Example:
+        symbol = 'BTC/USDT'
+        exchange_id = 'bittrex'
+        timeframe = '1m'
+        from_millis = current_millis() - 1000 * timeframe_to_millis(timeframe)
+        to_millis = current_millis()
+        date8061 = get_db_ohlcv_dates(symbol, exchange_id, timeframe, from_millis, to_millis)
+    Args:
+        symbol, timeframe, from_millis, to_millis
+    Returns:
+        date8061 (list) sorted
+
+    """
+
+    return [doc['date8061'] for doc in read_stored_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis)]
+
+
+
+def get_db_candles(symbol, exchange_id, timeframe, from_millis, to_millis):
+    """Same as get_db_ohlcv, as a list of candles like the ones output by ccxt.
+    """
+    return [document_to_candle(document) for document in get_db_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis)]
 
 
 
@@ -319,9 +630,23 @@ def get_db_ohlcv(symbol, exchange_id, timeframe, from_millis, to_millis):
 #   Databases Connections
 #----------------------------------------------------------------------------
 
-datamanager_db = database_connection('datamanager')
+storage_backends = {'mongo':  mongo_storage,
+                    'sqlite': sqlite_storage,
+                   }
+
+storage = storage_backends[STORAGE_BACKEND]()
+
+# errors of any storage backend
+STORAGE_ERRORS = (pymongo.errors.PyMongoError, sqlite3.Error)
+
+# errors of any storage backend that mean it is unavailable for now (down,
+# unreachable, locked), not that the request itself is wrong
+STORAGE_UNAVAILABLE_ERRORS = (pymongo.errors.ConnectionFailure, sqlite3.OperationalError)
+
+# MongoDB only, e.g. for the fetch leases
+datamanager_db = database_connection('datamanager') if storage.name == 'mongo' else None
 
-ordermanager_db = database_connection('ordermanager')
+ordermanager_db = database_connection('ordermanager') if storage.name == 'mongo' else None
 
 
 
@@ -418,7 +743,7 @@ def get_balance(exchange, coin=None, add_missing_fetchers=True):
 
     while retry > 0:
         try:
-            api_balance = exchange.fetchBalance()
+            api_balance = governed_call(exchange, 'fetchBalance')
             break
         except Exception as ex:
             retry -= 1
@@ -491,11 +816,11 @@ def get_trade_history(exchange, symbol=None):
     trade_history = []
 
     if exchange.id == 'hitbtc2':
-        api_my_trades = exchange.fetchMyTrades(limit=1000)
+        api_my_trades = governed_call(exchange, 'fetchMyTrades', limit=1000)
         trade_history = api_my_trades
 
     elif exchange.id == 'bittrex':
-        api_orders = exchange.fetchOrders(limit=1000)
+        api_orders = governed_call(exchange, 'fetchOrders', limit=1000)
         trade_history = api_orders
 
     elif exchange.id == 'binance':
@@ -504,7 +829,7 @@ def get_trade_history(exchange, symbol=None):
         for holding_coin in balance:
             possible_symbols = [holding_coin + '/' + quote for quote in typical_quote_currencies if (holding_coin + '/' + quote) in exchange.symbols]
             for next_symbol in possible_symbols:
-                api_my_trades = exchange.fetchMyTrades(symbol=next_symbol, limit=1000)
+                api_my_trades = governed_call(exchange, 'fetchMyTrades', symbol=next_symbol, limit=1000)
                 trade_history.append(api_my_trades)
 
     else:
@@ -552,11 +877,11 @@ def get_open_orders(exchange):
     open_orders = []
 
     if exchange.id == 'hitbtc2':
-        api_closed_orders = exchange.fetchClosedOrders(limit=1000)
+        api_closed_orders = governed_call(exchange, 'fetchClosedOrders', limit=1000)
         open_orders = [order for order in api_closed_orders if order['status'] == 'open']
 
     elif exchange.id == 'bittrex':
-        api_open_orders = exchange.fetchOpenOrders(limit=1000)
+        api_open_orders = governed_call(exchange, 'fetchOpenOrders', limit=1000)
         open_orders = api_open_orders
         #\todo create one and cancel, see what happens
 
@@ -590,7 +915,7 @@ def get_current_price(symbol, exchange):
 
         while retry > 0:
             try:
-                api_ticker = exchange.fetchTicker( symbol_os(symbol, exchange.id) )
+                api_ticker = governed_call(exchange, 'fetchTicker', symbol_os(symbol, exchange.id))
                 return api_ticker['last']
             except Exception as ex:
                 retry -= 1
@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+
+import os
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Where the runtime data of OrbBit is written (sqlite database, archive,
+# indicator series, spill file, checkpoints), never inside the package.
+# Each of them can also be moved on its own with its ORBBIT_*_ROUTE variable.
+ORBBIT_DATA_DIR = os.path.expanduser(os.environ.get('ORBBIT_DATA_DIR', os.path.join('~', '.orbbit')))
+
+# Fetch worker id of this process (see start_fetch_worker). Processes that
+# share ORBBIT_DATA_DIR keep their own files (spill file, checkpoints) in
+# 'workers/<ORBBIT_WORKER_ID>', give a worker the same id across restarts to
+# pick them up again.
+ORBBIT_WORKER_ID = os.environ.get('ORBBIT_WORKER_ID')
+
+
+
+
+#%%##########################################################################
+#                               DATA ROUTES                                 #
+#############################################################################
+
+def data_route(*names):
+    """ Route of a file or directory in ORBBIT_DATA_DIR. Nothing is created.
+
+    Example:
+        data_route('archive')
+
+    """
+    return os.path.join(ORBBIT_DATA_DIR, *names)
+
+
+
+def process_route(*names):
+    """ Same as data_route, for the files only this process may write,
+    in the directory of its ORBBIT_WORKER_ID if it has one.
+
+    Example:
+        process_route('write_behind.spill')
+
+    """
+    if ORBBIT_WORKER_ID:
+        return data_route('workers', ORBBIT_WORKER_ID, *names)
+    return data_route(*names)
@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+
+import os
+import json
+import numpy as np
+
+from   orbbit.common.data_dir import *
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Where the archived candles are written. Processes in other hosts only see
+# the archive if this is shared storage.
+OHLCV_ARCHIVE_ROUTE = os.environ.get('ORBBIT_ARCHIVE_ROUTE', data_route('archive'))
+
+# Set ORBBIT_ARCHIVE_SHARED=1 if OHLCV_ARCHIVE_ROUTE is shared storage that
+# every process reading the database can see. Only then are the archived
+# candles deleted from a database shared between hosts (MongoDB).
+OHLCV_ARCHIVE_SHARED = os.environ.get('ORBBIT_ARCHIVE_SHARED', '0') == '1'
+
+OHLCV_ARCHIVE_COLUMNS = ['date8061', 'open', 'high', 'low', 'close', 'volume']
+OHLCV_ARCHIVE_DTYPES = {column: np.dtype('<i8' if column == 'date8061' else '<f8') for column in OHLCV_ARCHIVE_COLUMNS}
+
+
+
+
+#%%##########################################################################
+#                               OHLCV ARCHIVE                               #
+#############################################################################
+# Cold candles of one stream, one raw little-endian file per column plus
+# 'meta.json' with the number of candles:
+#
+#   <OHLCV_ARCHIVE_ROUTE>/<exchange_id>_<symbol>/<timeframe>/date8061.bin   int64
+#                                                            open.bin ...   float64
+#                                                            meta.json
+#                                                            late.json
+#
+# Columns are read memory-mapped, so a range read is a slice of the files.
+# Rows are only appended, newer than the last one: the new rows are written
+# at the end of each column file, then the count in meta.json. A reader that
+# got the old count keeps seeing the same rows at the same indexes, and rows
+# past the count (an interrupted append) are overwritten by the next one.
+# Candles older than the last archived one are not inserted, they go to
+# 'late.json', one JSON line each.
+
+def archive_route(exchange_id, symbol, timeframe, route=OHLCV_ARCHIVE_ROUTE):
+    return os.path.join(route, exchange_id + '_' + symbol.replace('/', '_'), timeframe)
+
+
+
+class ohlcv_archive():
+    """ Columnar archive of the candles of one stream.
+
+    Args:
+        route (str) directory of the stream, see archive_route
+
+    Example:
+        archive = ohlcv_archive(archive_route('hitbtc2', 'BTC/USDT', '1m'))
+        columns = archive.read(from_millis, to_millis)
+        columns['close'].mean()
+
+    """
+
+    def __init__(self, route):
+        self.route = route
+
+
+    def count(self):
+        try:
+            with open(os.path.join(self.route, 'meta.json')) as f:
+                return json.load(f)['count']
+        except FileNotFoundError:
+            return 0
+
+
+    def columns(self):
+        """ All the archived candles.
+
+        Returns:
+            columns (dict) {'date8061': np.array int64, 'open': np.array float64, ... }
+            memory-mapped, read-only.
+
+        """
+        count = self.count()
+        if count == 0:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in OHLCV_ARCHIVE_DTYPES.items()}
+        return {column: np.memmap(os.path.join(self.route, column + '.bin'), dtype=dtype, mode='r', shape=(count,))
+                for column, dtype in OHLCV_ARCHIVE_DTYPES.items()}
+
+
+    def newest(self):
+        """ Date of the newest archived candle, None if there is none.
+        """
+        date8061 = self.columns()['date8061']
+        return int(date8061[-1]) if len(date8061) else None
+
+
+    def read(self, from_millis, to_millis):
+        """ Candles within from_millis and to_millis, both included.
+
+        Returns:
+            columns (dict) as returned by columns(), slices of the files.
+
+        """
+        columns = self.columns()
+        first = np.searchsorted(columns['date8061'], from_millis, side='left')
+        last = np.searchsorted(columns['date8061'], to_millis, side='right')
+        return {column: values[first:last] for column, values in columns.items()}
+
+
+    def append(self, ohlcv):
+        """ Add candles as output by ccxt ohlcv, sorted by date. Only the ones
+        newer than the last archived candle are added.
+
+        Returns:
+            late (list) candles older than the last archived one that are not
+                in the archive as they are, written to 'late.json' instead.
+
+        """
+        if not ohlcv:
+            return []
+
+        new = np.array(ohlcv, dtype=np.float64)
+        date8061 = new[:, 0].astype(np.int64)
+
+        archived = self.columns()
+        count = len(archived['date8061'])
+
+        late = []
+        if count:
+            older = date8061 <= archived['date8061'][-1]
+            if older.any():
+                index = np.minimum(np.searchsorted(archived['date8061'], date8061[older]), count - 1)
+                known = archived['date8061'][index] == date8061[older]
+                for i, column in enumerate(OHLCV_ARCHIVE_COLUMNS[1:]):
+                    known &= archived[column][index] == new[older, i + 1]
+
+                late = [[int(candle[0])] + candle[1:] for candle, is_known in zip(new[older].tolist(), known) if not is_known]
+                self.write_late(late)
+            new, date8061 = new[~older], date8061[~older]
+
+        # the last version of each date, in order
+        reversed_unique, reversed_index = np.unique(date8061[::-1], return_index=True)
+        keep = len(date8061) - 1 - reversed_index
+
+        if len(keep):
+            columns = {'date8061': date8061[keep]}
+            columns.update({column: new[keep, i + 1] for i, column in enumerate(OHLCV_ARCHIVE_COLUMNS[1:])})
+            self.write(columns, count)
+
+        return late
+
+
+    def write(self, columns, count):
+        """ Write 'columns' after the first 'count' rows, then the new count.
+        """
+        os.makedirs(self.route, exist_ok=True)
+
+        for column, dtype in OHLCV_ARCHIVE_DTYPES.items():
+            with open(os.path.join(self.route, column + '.bin'), 'ab') as f:
+                # rows of an interrupted append, past the count
+                f.truncate(count * dtype.itemsize)
+                f.write(np.ascontiguousarray(columns[column], dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        temporary = os.path.join(self.route, 'meta.json.tmp')
+        with open(temporary, 'w') as f:
+            json.dump({'count': count + len(columns['date8061'])}, f)
+        os.replace(temporary, os.path.join(self.route, 'meta.json'))
+
+
+    def write_late(self, ohlcv):
+        """ Keep candles that can not be appended, to be merged by hand.
+        """
+        if not ohlcv:
+            return
+
+        os.makedirs(self.route, exist_ok=True)
+        with open(os.path.join(self.route, 'late.json'), 'a') as f:
+            for candle in ohlcv:
+                f.write(json.dumps(candle) + '\n')
+
+
+
+def archive_to_documents(columns, timeframe):
+    """ Archived candles as documents like the ones of get_db_ohlcv.
+    """
+    rows = zip(*[columns[column].tolist() for column in OHLCV_ARCHIVE_COLUMNS])
+    return [{'_id': timeframe + '_' + str(date8061),
+             'date8061': date8061,
+             'ohlcv': {'open': open_price, 'high': high, 'low': low, 'close': close, 'volume': volume},
+            }
+            for date8061, open_price, high, low, close, volume in rows]
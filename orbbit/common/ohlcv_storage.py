@@ -0,0 +1,354 @@
+#!/usr/bin/python3
+
+import pymongo
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Candles packed in each bucket document, e.g. one day of 1m candles
+OHLCV_BUCKET_CANDLES = 1440
+
+# Compact _id = timeframe seconds * OHLCV_ID_SCALE + bucket start seconds
+OHLCV_ID_SCALE = 10 ** 10
+
+
+
+
+#%%##########################################################################
+#                              OHLCV BUCKETS                                #
+#############################################################################
+# Candles are stored OHLCV_BUCKET_CANDLES per document, in the collection of
+# their symbol @ exchange:
+#
+#   {'_id': 601514764800,                      timeframe and bucket start, see compact_id
+#    'c': {'0': [o, h, l, c, v],               by position in the bucket
+#          '1': [o, h, l, c, v], ... },
+#   }
+#
+# Each candle is written with a $set of its own position, so a bucket is
+# created by the first write and an open candle is refreshed in place. The
+# buckets of a timeframe are a contiguous range of _id, range reads only
+# need the _id index.
+#
+# Former layouts have a string _id and are still read, until they are
+# converted by migrate_ohlcv_timeframe:
+#
+#   one document per candle   {'_id': '1m_1514764800000', 'timeframe': '1m', 'date8061': ..., 'ohlcv': {'open': ...}}
+#   string id buckets         {'_id': '1m_b1514764800000', 'timeframe': '1m', 'bucket': ..., 'candles': {...}}
+#
+# Where a candle is in more than one layout, the compact one wins.
+
+def bucket_start(date8061, timeframe_millis):
+    """ First candle of the bucket that holds date8061.
+    """
+    bucket_millis = timeframe_millis * OHLCV_BUCKET_CANDLES
+    return int(date8061 - (date8061 % bucket_millis))
+
+
+
+def compact_id(timeframe_millis, start):
+    """ _id of the bucket of timeframe_millis that starts at 'start' millis.
+
+    Example:
+        compact_id(60000, 1514764800000)
+        601514764800
+    """
+    return int(timeframe_millis // 1000) * OHLCV_ID_SCALE + int(start // 1000)
+
+
+
+def compact_id_start(bucket_id, timeframe_millis):
+    """ Start of a bucket in millis, from its compact _id.
+    """
+    return (bucket_id - int(timeframe_millis // 1000) * OHLCV_ID_SCALE) * 1000
+
+
+
+def bucket_updates(new_documents, timeframe_millis):
+    """ Bucket writes for candle documents, one per bucket touched.
+
+    Args:
+        new_documents (list) as output by candle_to_document, all of the same timeframe
+        timeframe_millis (int) candle length
+
+    Returns:
+        requests (list) of pymongo.UpdateOne, for bulk_write
+
+    Example:
+        collection.bulk_write(bucket_updates(new_documents, timeframe_to_millis('1m')), ordered=False)
+
+    """
+    buckets = {}
+    for new_document in new_documents:
+        start = bucket_start(new_document['date8061'], timeframe_millis)
+        position = str(int((new_document['date8061'] - start) // timeframe_millis))
+
+        ohlcv = new_document['ohlcv']
+        bucket = buckets.setdefault(start, {})
+        bucket['c.' + position] = [ohlcv['open'], ohlcv['high'], ohlcv['low'], ohlcv['close'], ohlcv['volume']]
+
+    return [pymongo.UpdateOne({'_id': compact_id(timeframe_millis, start)}, {'$set': fields}, upsert=True)
+            for start, fields in buckets.items()]
+
+
+
+def unpack_candles(candles, start, timeframe, timeframe_millis, from_millis, to_millis):
+    """ Candle documents of a bucket within from_millis and to_millis, both included.
+
+    Args:
+        candles (dict) {'position': [o, h, l, c, v], ... } of a bucket
+        start (int) millis, first candle of the bucket
+
+    Returns:
+        documents (dict) {date8061: {'_id', 'date8061', 'ohlcv'}, ... } like
+        the documents of the one document per candle layout.
+
+    """
+    documents = {}
+    for position, candle in candles.items():
+        date8061 = start + int(position) * timeframe_millis
+        if from_millis <= date8061 <= to_millis:
+            documents[date8061] = {'_id': timeframe + '_' + str(date8061),
+                                   'date8061': date8061,
+                                   'ohlcv': {'open':   candle[0],
+                                             'high':   candle[1],
+                                             'low':    candle[2],
+                                             'close':  candle[3],
+                                             'volume': candle[4],
+                                            },
+                                  }
+    return documents
+
+
+
+def compact_query(timeframe_millis, from_millis, to_millis):
+    return {'_id': {'$gte': compact_id(timeframe_millis, bucket_start(from_millis, timeframe_millis)),
+                    '$lte': compact_id(timeframe_millis, to_millis)}}
+
+
+
+def read_compact_documents(collection, timeframe, timeframe_millis, from_millis, to_millis):
+    """ Candles in compact buckets, both limits included. See unpack_candles.
+    """
+    documents = {}
+    for bucket_document in collection.find(compact_query(timeframe_millis, from_millis, to_millis)):
+        start = compact_id_start(bucket_document['_id'], timeframe_millis)
+        documents.update(unpack_candles(bucket_document.get('c', {}), start, timeframe, timeframe_millis, from_millis, to_millis))
+    return documents
+
+
+
+def legacy_queries(timeframe, timeframe_millis, from_millis, to_millis):
+    return {'candle': {'ohlcv': {'$exists': True},
+                       'timeframe': timeframe,
+                       'date8061': {'$gte': from_millis, '$lte': to_millis},
+                      },
+            'bucket': {'bucket': {'$exists': True, '$gte': bucket_start(from_millis, timeframe_millis), '$lte': to_millis},
+                       'timeframe': timeframe,
+                      },
+           }
+
+
+
+def read_legacy_documents(collection, timeframe, timeframe_millis, from_millis, to_millis):
+    """ Candles in the former layouts, both limits included. See unpack_candles.
+    """
+    queries = legacy_queries(timeframe, timeframe_millis, from_millis, to_millis)
+
+    documents = {}
+    for document in collection.find(queries['candle'], {'date8061': True, 'ohlcv': True}):
+        documents[document['date8061']] = document
+
+    for bucket_document in collection.find(queries['bucket']):
+        documents.update(unpack_candles(bucket_document.get('candles', {}), bucket_document['bucket'], timeframe, timeframe_millis, from_millis, to_millis))
+
+    return documents
+
+
+
+def read_ohlcv_documents(collection, timeframe, timeframe_millis, from_millis, to_millis):
+    """ Candle documents of a timeframe, both limits included, whatever their layout.
+
+    Returns:
+        documents (list) {'_id', 'date8061', 'ohlcv'} sorted by date8061.
+
+    """
+    documents = read_legacy_documents(collection, timeframe, timeframe_millis, from_millis, to_millis)
+    documents.update(read_compact_documents(collection, timeframe, timeframe_millis, from_millis, to_millis))
+
+    return [documents[date8061] for date8061 in sorted(documents)]
+
+
+
+def oldest_legacy_date(collection, timeframe):
+    """ Oldest candle or bucket start of a timeframe in the former layouts, None if there is none.
+    """
+    dates = []
+
+    first_bucket = collection.find_one({'bucket': {'$exists': True}, 'timeframe': timeframe}, {'bucket': True}, sort=[('timeframe', pymongo.ASCENDING), ('bucket', pymongo.ASCENDING)])
+    if first_bucket:
+        dates.append(first_bucket['bucket'])
+
+    first_candle = collection.find_one({'ohlcv': {'$exists': True}, 'timeframe': timeframe}, {'date8061': True}, sort=[('timeframe', pymongo.ASCENDING), ('date8061', pymongo.ASCENDING)])
+    if first_candle:
+        dates.append(first_candle['date8061'])
+
+    return min(dates) if dates else None
+
+
+
+def oldest_ohlcv_date(collection, timeframe, timeframe_millis):
+    """ Start of the oldest bucket or legacy candle of a timeframe, None if there is none.
+    """
+    dates = []
+
+    first_compact = collection.find_one({'_id': {'$gte': compact_id(timeframe_millis, 0), '$lt': compact_id(timeframe_millis, 0) + OHLCV_ID_SCALE}},
+                                        {'_id': True}, sort=[('_id', pymongo.ASCENDING)])
+    if first_compact:
+        dates.append(compact_id_start(first_compact['_id'], timeframe_millis))
+
+    oldest_legacy = oldest_legacy_date(collection, timeframe)
+    if oldest_legacy is not None:
+        dates.append(oldest_legacy)
+
+    return min(dates) if dates else None
+
+
+
+def delete_legacy_documents(collection, timeframe, timeframe_millis, from_millis, to_millis):
+    """ Remove the former layout candles, and buckets that start, within
+    from_millis and to_millis, both included.
+    """
+    for query in legacy_queries(timeframe, timeframe_millis, from_millis, to_millis).values():
+        collection.delete_many(query)
+
+
+
+def delete_ohlcv_documents(collection, timeframe, timeframe_millis, from_millis, to_millis):
+    """ Remove the buckets that start, and the legacy candles, within
+    from_millis and to_millis, both included.
+    """
+    collection.delete_many({'_id': {'$gte': compact_id(timeframe_millis, from_millis), '$lte': compact_id(timeframe_millis, to_millis)}})
+    delete_legacy_documents(collection, timeframe, timeframe_millis, from_millis, to_millis)
+
+
+
+
+#%%##########################################################################
+#                                 MIGRATION                                 #
+#############################################################################
+
+def legacy_timeframes(collection):
+    """ Timeframes with documents in the former layouts.
+    """
+    return collection.distinct('timeframe', {'_id': {'$type': 'string'}})
+
+
+
+def migrate_ohlcv_timeframe(collection, timeframe, timeframe_millis, batch_buckets=10):
+    """ Convert the former layout documents of a timeframe to compact buckets.
+
+    Safe while the fetchers keep writing: every batch is written before its
+    former documents are deleted, candles already in a compact bucket are
+    left as they are, and reads merge all the layouts meanwhile. An
+    interrupted migration resumes where it stopped.
+
+    Args:
+        batch_buckets (int) buckets converted at a time
+
+    Returns:
+        migrated (int) candles converted.
+
+    Example:
+        migrate_ohlcv_timeframe(ohlcv_collection('bittrex', 'BTC/USDT'), '1m', 60000)
+
+    """
+    migrated = 0
+
+    batch_from = oldest_legacy_date(collection, timeframe)
+    while batch_from is not None:
+        batch_from = bucket_start(batch_from, timeframe_millis)
+        batch_to = batch_from + batch_buckets * timeframe_millis * OHLCV_BUCKET_CANDLES - 1
+
+        legacy = read_legacy_documents(collection, timeframe, timeframe_millis, batch_from, batch_to)
+        compact = read_compact_documents(collection, timeframe, timeframe_millis, batch_from, batch_to)
+
+        missing = [dict(legacy[date8061], timeframe=timeframe) for date8061 in legacy if not date8061 in compact]
+        if missing:
+            collection.bulk_write(bucket_updates(missing, timeframe_millis), ordered=False)
+        delete_legacy_documents(collection, timeframe, timeframe_millis, batch_from, batch_to)
+
+        migrated += len(missing)
+        batch_from = oldest_legacy_date(collection, timeframe)
+
+    return migrated
+
+
+
+
+#%%##########################################################################
+#                                  INDEXES                                  #
+#############################################################################
+
+# Indexes every ohlcv collection must have, as (keys, options). Compact
+# buckets only need the _id index, these serve the former layouts and are
+# partial, so they stay empty once a collection is migrated.
+OHLCV_INDEXES = [
+    # string id buckets
+    ([('timeframe', pymongo.ASCENDING), ('bucket', pymongo.ASCENDING)],
+     {'name': 'timeframe_bucket', 'partialFilterExpression': {'bucket': {'$exists': True}}}),
+
+    # one document per candle
+    ([('timeframe', pymongo.ASCENDING), ('date8061', pymongo.ASCENDING)],
+     {'name': 'timeframe_date8061', 'partialFilterExpression': {'ohlcv': {'$exists': True}}}),
+]
+
+
+
+def ensure_ohlcv_indexes(collection):
+    """ Create the missing OHLCV_INDEXES. Existing ones are left as they are.
+
+    Returns:
+        created (list) names of the new indexes.
+
+    """
+    existing = collection.index_information()
+
+    created = []
+    for keys, options in OHLCV_INDEXES:
+        if not options['name'] in existing:
+            created.append(collection.create_index(keys, **options))
+    return created
+
+
+
+def plan_stages(plan):
+    """ All the stages of a query plan, as returned by explain()['queryPlanner']['winningPlan'].
+    """
+    stages = [plan['stage']] if 'stage' in plan else []
+    for child in plan.get('inputStages', []) + [plan[key] for key in ('inputStage', 'queryPlan') if key in plan]:
+        stages += plan_stages(child)
+    return stages
+
+
+
+def check_ohlcv_query_plans(collection, timeframe, timeframe_millis, from_millis, to_millis):
+    """ Check that the queries of read_ohlcv_documents are served by an index.
+
+    Returns:
+        problems (list) of str, empty if every query uses an index scan.
+
+    """
+    queries = {'compact': compact_query(timeframe_millis, from_millis, to_millis)}
+    for layout, query in legacy_queries(timeframe, timeframe_millis, from_millis, to_millis).items():
+        queries['legacy ' + layout] = query
+
+    problems = []
+    for layout, query in queries.items():
+        plan = collection.find(query).explain()['queryPlanner']['winningPlan']
+        stages = plan_stages(plan)
+        if 'COLLSCAN' in stages or not ('IXSCAN' in stages or 'IDHACK' in stages or 'EXPRESS_IXSCAN' in stages):
+            problems.append(collection.name + ' ' + timeframe + ' ' + layout + ' query plan: ' + ' <- '.join(stages))
+    return problems
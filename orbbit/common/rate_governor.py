@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+
+import time
+import threading
+import asyncio
+import ccxt
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Request priorities, the lowest value is served first
+PRIORITY_LIVE     = 0  # live candle polls
+PRIORITY_BACKFILL = 1  # filling past data
+PRIORITY_ADHOC    = 2  # tickers, balances and other API requests
+
+N_PRIORITIES = 3
+
+# Requests that can be sent back to back before rateLimit spacing applies
+RATE_GOVERNOR_BURST = 3
+
+# Seconds without requests to an exchange after it complains about the rate
+RATE_GOVERNOR_BACKOFF = 10
+
+# Seconds between checks while waiting behind higher priority requests
+RATE_GOVERNOR_POLL = 0.05
+
+# Exchange errors that mean we are going too fast
+RATE_LIMIT_ERRORS = (ccxt.DDoSProtection,)
+
+
+
+
+#%%##########################################################################
+#                              RATE GOVERNOR                                #
+#############################################################################
+
+class rate_governor():
+    """ Token bucket shared by every caller that talks to one exchange.
+
+    Tokens refill at one every 'rateLimit' milliseconds (as given by ccxt), up
+    to RATE_GOVERNOR_BURST. A request only gets a token when no request with
+    a higher priority is waiting for one, so live polls go before backfill,
+    and backfill before ad-hoc requests.
+
+    Both threads (acquire) and asyncio tasks (acquire_async) can share it.
+
+    Args:
+        exchange_id (str)
+        rate_limit (int) milliseconds between requests, exchange.rateLimit
+
+    """
+
+    def __init__(self, exchange_id, rate_limit, burst=RATE_GOVERNOR_BURST):
+        self.exchange_id = exchange_id
+        self.interval = max(rate_limit, 1) / 1000
+        self.burst = burst
+
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0
+
+        self.waiting = [0] * N_PRIORITIES
+        self.lock = threading.Lock()
+
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) / self.interval)
+        self.last_refill = now
+
+
+    def _try_acquire(self, priority):
+        """ Take a token if it is this priority's turn.
+
+        Returns:
+            0 if the token was taken, else seconds to wait before trying again.
+
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            if now < self.blocked_until:
+                return self.blocked_until - now
+
+            if any(self.waiting[:priority]):
+                return RATE_GOVERNOR_POLL
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) * self.interval
+
+
+    def _set_waiting(self, priority, increment):
+        with self.lock:
+            self.waiting[priority] += increment
+
+
+    def acquire(self, priority=PRIORITY_ADHOC):
+        """ Block the calling thread until a request can be sent.
+        """
+        self._set_waiting(priority, 1)
+        try:
+            wait = self._try_acquire(priority)
+            while wait:
+                time.sleep(wait)
+                wait = self._try_acquire(priority)
+        finally:
+            self._set_waiting(priority, -1)
+
+
+    async def acquire_async(self, priority=PRIORITY_LIVE):
+        """ Wait in the event loop until a request can be sent.
+        """
+        self._set_waiting(priority, 1)
+        try:
+            wait = self._try_acquire(priority)
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self._try_acquire(priority)
+        finally:
+            self._set_waiting(priority, -1)
+
+
+    def backoff(self, seconds=RATE_GOVERNOR_BACKOFF):
+        """ Stop all requests for a while, e.g. after an HTTP 429.
+        """
+        with self.lock:
+            self.tokens = 0
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        print('Rate limited by ' + self.exchange_id + ', pausing requests ' + str(seconds) + 's')
+
+
+    def status(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            return {'tokens': self.tokens,
+                    'waiting': list(self.waiting),
+                    'blocked_for': max(0, self.blocked_until - time.monotonic()),
+                   }
+
+
+
+rate_governors = {} # dict {'exchange_id': rate_governor, ... }
+rate_governors_lock = threading.Lock()
+
+def get_rate_governor(exchange):
+    """ Governor shared by all the ccxt exchange objects with the same id.
+
+    Args:
+        exchange (ccxt.Exchange) sync, async or with user keys.
+
+    """
+    with rate_governors_lock:
+        if not exchange.id in rate_governors:
+            rate_governors[exchange.id] = rate_governor(exchange.id, exchange.rateLimit)
+        return rate_governors[exchange.id]
+
+
+
+def governed_call(exchange, method, *args, priority=PRIORITY_ADHOC, **kwargs):
+    """ Call a ccxt exchange method once the governor allows it.
+
+    Example:
+        ticker = governed_call(exchange, 'fetch_ticker', 'BTC/USDT')
+
+    """
+    governor = get_rate_governor(exchange)
+    governor.acquire(priority)
+    try:
+        return getattr(exchange, method)(*args, **kwargs)
+    except RATE_LIMIT_ERRORS:
+        governor.backoff()
+        raise
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+
+import os
+import json
+import sqlite3
+import threading
+
+from   orbbit.common.storage_backend import *
+from   orbbit.common.data_dir import *
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+SQLITE_STORAGE_ROUTE = os.environ.get('ORBBIT_SQLITE_ROUTE', data_route('orbbit.sqlite'))
+
+# Seconds to wait for a lock held by another connection
+SQLITE_BUSY_TIMEOUT = 30
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ohlcv (
+    exchange_id TEXT    NOT NULL,
+    symbol      TEXT    NOT NULL,
+    timeframe   TEXT    NOT NULL,
+    date8061    INTEGER NOT NULL,
+    open        REAL,
+    high        REAL,
+    low         REAL,
+    close       REAL,
+    volume      REAL,
+    PRIMARY KEY (exchange_id, symbol, timeframe, date8061)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS info (
+    database_name TEXT NOT NULL,
+    info          TEXT NOT NULL,
+    value         TEXT NOT NULL,
+    PRIMARY KEY (database_name, info)
+) WITHOUT ROWID;
+"""
+
+SQLITE_RANGE_QUERY = ('SELECT date8061, open, high, low, close, volume FROM ohlcv'
+                      ' WHERE exchange_id = ? AND symbol = ? AND timeframe = ? AND date8061 >= ? AND date8061 <= ?'
+                      ' ORDER BY date8061')
+
+
+
+
+#%%##########################################################################
+#                              SQLITE STORAGE                               #
+#############################################################################
+
+class sqlite_storage(storage_backend):
+    """ Embedded storage in one SQLite file, for single node setups and
+    benchmarks without a database server.
+
+    The file is in WAL mode, so readers do not block the writer. Candles are
+    rows of one table, the primary key serves the range reads. Each thread
+    gets its own connection.
+
+    Args:
+        route (str) database file
+
+    Example:
+        storage = sqlite_storage('/tmp/orbbit.sqlite')
+        storage.write_ohlcv('hitbtc2', 'BTC/USDT', 60000, new_documents)
+
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, route=SQLITE_STORAGE_ROUTE):
+        self.route = route
+        self.local = threading.local()
+        self.connection()
+
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.route)), exist_ok=True)
+            connection = sqlite3.connect(self.route, timeout=SQLITE_BUSY_TIMEOUT)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SQLITE_SCHEMA)
+            self.local.connection = connection
+        return connection
+
+
+    def get_info(self, database_name, info):
+        row = self.connection().execute('SELECT value FROM info WHERE database_name = ? AND info = ?', (database_name, info)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+    def set_info(self, database_name, info, value):
+        with self.connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO info VALUES (?, ?, ?)', (database_name, info, json.dumps(value)))
+
+
+    def add_to_info(self, database_name, info, keys, value):
+        connection = self.connection()
+        # the write lock from the read on, no other process writes in between
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            stored = self.get_info(database_name, info) or {}
+            parent = stored
+            for key in keys[:-1]:
+                parent = parent.setdefault(key, {})
+            values = parent.setdefault(keys[-1], [])
+
+            is_new = not value in values
+            if is_new:
+                values.append(value)
+                connection.execute('INSERT OR REPLACE INTO info VALUES (?, ?, ?)', (database_name, info, json.dumps(stored)))
+            connection.commit()
+        except:
+            connection.rollback()
+            raise
+        return is_new
+
+
+    def read_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis, from_millis, to_millis):
+        rows = self.connection().execute(SQLITE_RANGE_QUERY, (exchange_id, symbol, timeframe, int(from_millis), int(to_millis)))
+        return [{'_id': timeframe + '_' + str(date8061),
+                 'date8061': date8061,
+                 'ohlcv': {'open': open_price, 'high': high, 'low': low, 'close': close, 'volume': volume},
+                }
+                for date8061, open_price, high, low, close, volume in rows]
+
+
+    def write_ohlcv(self, exchange_id, symbol, timeframe_millis, new_documents):
+        rows = [(exchange_id, symbol, new_document['timeframe'], int(new_document['date8061']),
+                 new_document['ohlcv']['open'], new_document['ohlcv']['high'], new_document['ohlcv']['low'],
+                 new_document['ohlcv']['close'], new_document['ohlcv']['volume'])
+                for new_document in new_documents]
+
+        with self.connection() as connection:
+            connection.executemany('INSERT OR REPLACE INTO ohlcv VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+
+    def oldest_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis):
+        row = self.connection().execute('SELECT MIN(date8061) FROM ohlcv WHERE exchange_id = ? AND symbol = ? AND timeframe = ?',
+                                        (exchange_id, symbol, timeframe)).fetchone()
+        return row[0]
+
+
+    def delete_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis, from_millis, to_millis):
+        with self.connection() as connection:
+            connection.execute('DELETE FROM ohlcv WHERE exchange_id = ? AND symbol = ? AND timeframe = ? AND date8061 >= ? AND date8061 <= ?',
+                               (exchange_id, symbol, timeframe, int(from_millis), int(to_millis)))
+
+
+    def check_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis, from_millis, to_millis):
+        plan = self.connection().execute('EXPLAIN QUERY PLAN ' + SQLITE_RANGE_QUERY, (exchange_id, symbol, timeframe, int(from_millis), int(to_millis))).fetchall()
+        details = [row[-1] for row in plan]
+        if any(detail.startswith('SCAN') for detail in details):
+            return ['sqlite ' + exchange_id + ' ' + symbol + ' ' + timeframe + ' query plan: ' + ' <- '.join(details)]
+        return []
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+
+#%%##########################################################################
+#                             STORAGE INTERFACE                             #
+#############################################################################
+
+class storage_backend():
+    """ Where the DataManager keeps candles and the 'info' parameters.
+
+    Implementations: mongo_storage (common), sqlite_storage. The one in use is
+    chosen with the ORBBIT_STORAGE_BACKEND environment variable.
+
+    Candles go in and out as documents like the ones of candle_to_document
+    ({'date8061', 'ohlcv': {'open', ...}}), limits are always included.
+    """
+
+    name = None
+
+
+    def get_info(self, database_name, info):
+        """ Stored value of 'info', None if there is none.
+        """
+        raise NotImplementedError
+
+
+    def set_info(self, database_name, info, value):
+        raise NotImplementedError
+
+
+    def add_to_info(self, database_name, info, keys, value):
+        """ Add 'value' to the list at info[keys[0]][keys[1]]..., creating
+        it if needed, in one atomic update: concurrent adds of other values
+        are not lost.
+
+        Returns:
+            True if it was added, False if it was already there.
+
+        """
+        raise NotImplementedError
+
+
+    def read_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis, from_millis, to_millis):
+        """ Candles within from_millis and to_millis.
+
+        Returns:
+            documents (list) {'_id', 'date8061', 'ohlcv'} sorted by date8061.
+
+        """
+        raise NotImplementedError
+
+
+    def write_ohlcv(self, exchange_id, symbol, timeframe_millis, new_documents):
+        """ Insert or replace candle documents, all of the same timeframe.
+
+        Returns:
+            Number of candles written.
+
+        """
+        raise NotImplementedError
+
+
+    def oldest_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis):
+        """ Date of the oldest stored candle (or of its storage block), None if there is none.
+        """
+        raise NotImplementedError
+
+
+    def delete_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis, from_millis, to_millis):
+        raise NotImplementedError
+
+
+    def check_ohlcv(self, exchange_id, symbol, timeframe, timeframe_millis, from_millis, to_millis):
+        """ Check that range reads are served by an index.
+
+        Returns:
+            problems (list) of str, empty if all is well.
+
+        """
+        raise NotImplementedError
+
+
+    def migrate_ohlcv(self, exchange_id, symbol, batch_buckets=10):
+        """ Convert candles stored in former layouts.
+
+        Returns:
+            migrated (dict) {'timeframe': candles converted, ... }
+
+        """
+        return {}
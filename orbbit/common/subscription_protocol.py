@@ -0,0 +1,253 @@
+#!/usr/bin/python3
+
+import json
+import socket
+import struct
+import asyncio
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+#%%##########################################################################
+#                          CONFIGURATION PARAMETERS                         #
+#############################################################################
+
+# Encodings this process can send, in order of preference. 'json' is always
+# available, 'msgpack' only if the package is installed.
+SUBSCRIPTION_ENCODINGS = ['struct'] + (['msgpack'] if msgpack else []) + ['json']
+
+# Larger frames are taken as a corrupt stream
+SUBSCRIPTION_FRAME_MAX = 16 * 1024 * 1024
+
+
+
+
+#%%##########################################################################
+#                                  FRAMES                                   #
+#############################################################################
+# Every message is a frame: a header with the payload length and how it is
+# encoded, then the payload.
+#
+#   '>IB' length, kind | payload
+#
+# Kinds:
+#   FRAME_JSON     JSON object
+#   FRAME_MSGPACK  msgpack map
+#   FRAME_OHLCV    'data' message of an ohlcv stream, fixed layout:
+#                  '>H' stream_id length | stream_id | '>q5d' date8061, open, high, low, close, volume
+#   FRAME_MACD     'data' message of a macd stream, fixed layout:
+#                  '>H' stream_id length | stream_id | '>q3d2B5d' date8061, macd, ema_fast,
+#                  ema_slow, cross, rising, open, high, low, close, volume
+#
+# The encoding of a connection is agreed on with its first message
+# (see subscription_server). With 'struct', the messages that have no fixed
+# layout are sent as JSON, frames are always decoded by their kind.
+
+FRAME_HEADER = struct.Struct('>IB')
+FRAME_JSON = 0
+FRAME_MSGPACK = 1
+FRAME_OHLCV = 2
+FRAME_MACD = 3
+
+STREAM_ID_LENGTH = struct.Struct('>H')
+OHLCV_LAYOUT = struct.Struct('>q5d')
+MACD_LAYOUT = struct.Struct('>q3d2B5d')
+
+OHLCV_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+MACD_FIELDS = ('macd', 'ema_fast', 'ema_slow', 'cross', 'rising')
+
+
+
+def encode_frame(message, encoding='json'):
+    """ Frame of a message in the given encoding.
+
+    Example:
+        writer.write(encode_frame({'type': 'subscribe', 'stream_id': stream_id}, 'msgpack'))
+
+    """
+    if encoding == 'struct':
+        frame = encode_struct(message)
+        if frame is not None:
+            return frame
+    elif encoding == 'msgpack':
+        return frame_payload(FRAME_MSGPACK, msgpack.packb(message, use_bin_type=True))
+
+    return frame_payload(FRAME_JSON, json.dumps(message, separators=(',', ':')).encode('utf-8'))
+
+
+
+def frame_payload(kind, payload):
+    return FRAME_HEADER.pack(len(payload), kind) + payload
+
+
+
+def encode_struct(message):
+    """ Fixed layout frame of a 'data' message, None if it has none.
+    """
+    if message.get('type') != 'data':
+        return None
+
+    data = message['data']
+    try:
+        ohlcv = data['ohlcv']
+        if len(ohlcv) != len(OHLCV_FIELDS):
+            return None
+        ohlcv = (ohlcv['open'], ohlcv['high'], ohlcv['low'], ohlcv['close'], ohlcv['volume'])
+
+        if len(data) == 2:
+            kind, values = FRAME_OHLCV, OHLCV_LAYOUT.pack(data['date8061'], *ohlcv)
+        elif len(data) == 3 and len(data['macd']) == len(MACD_FIELDS):
+            macd = data['macd']
+            kind, values = FRAME_MACD, MACD_LAYOUT.pack(data['date8061'], macd['macd'], macd['ema_fast'], macd['ema_slow'], macd['cross'], macd['rising'], *ohlcv)
+        else:
+            return None
+    except (KeyError, TypeError, AttributeError, struct.error):
+        return None
+
+    return frame_payload(kind, stream_id_prefix(message['stream_id']) + values)
+
+
+
+stream_id_prefixes = {}
+
+def stream_id_prefix(stream_id):
+    """ Length and bytes of a stream_id, as they start a fixed layout frame.
+    """
+    if not stream_id in stream_id_prefixes:
+        encoded = stream_id.encode('utf-8')
+        stream_id_prefixes[stream_id] = STREAM_ID_LENGTH.pack(len(encoded)) + encoded
+    return stream_id_prefixes[stream_id]
+
+
+
+def decode_frame(kind, payload):
+    """ Message of a frame, from its kind and payload.
+    """
+    if kind == FRAME_JSON:
+        return json.loads(payload.decode('utf-8'))
+
+    if kind == FRAME_MSGPACK:
+        if msgpack is None:
+            raise ValueError('msgpack frame received, msgpack is not installed.')
+        return msgpack.unpackb(payload, raw=False)
+
+    if kind in (FRAME_OHLCV, FRAME_MACD):
+        length, = STREAM_ID_LENGTH.unpack_from(payload)
+        stream_id = payload[STREAM_ID_LENGTH.size:STREAM_ID_LENGTH.size + length].decode('utf-8')
+        offset = STREAM_ID_LENGTH.size + length
+
+        if kind == FRAME_OHLCV:
+            date8061, *ohlcv = OHLCV_LAYOUT.unpack_from(payload, offset)
+            data = {'date8061': date8061, 'ohlcv': dict(zip(OHLCV_FIELDS, ohlcv))}
+        else:
+            date8061, *values = MACD_LAYOUT.unpack_from(payload, offset)
+            data = {'date8061': date8061,
+                    'macd': dict(zip(MACD_FIELDS, values[:5])),
+                    'ohlcv': dict(zip(OHLCV_FIELDS, values[5:])),
+                   }
+        return {'type': 'data', 'stream_id': stream_id, 'data': data}
+
+    raise ValueError('Unknown frame kind ' + str(kind) + '.')
+
+
+
+def frame_length(header):
+    length, kind = FRAME_HEADER.unpack(header)
+    if length > SUBSCRIPTION_FRAME_MAX:
+        raise ValueError('Frame of ' + str(length) + ' bytes, the stream is corrupt.')
+    return length, kind
+
+
+
+async def read_frame(reader):
+    """ Next message from an asyncio StreamReader, None once the connection is closed.
+    """
+    try:
+        length, kind = frame_length(await reader.readexactly(FRAME_HEADER.size))
+        return decode_frame(kind, await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        return None
+
+
+
+def recv_frame(stream):
+    """ Next message from a file-like binary stream (e.g. socket.makefile('rb')),
+    None once the connection is closed.
+    """
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+
+    length, kind = frame_length(header)
+    payload = stream.read(length)
+    if len(payload) < length:
+        return None
+    return decode_frame(kind, payload)
+
+
+
+def negotiate_encoding(requested):
+    """ First of the 'requested' encodings this process can send, 'json' if none.
+    """
+    for encoding in requested or []:
+        if encoding in SUBSCRIPTION_ENCODINGS:
+            return encoding
+    return 'json'
+
+
+
+
+#%%##########################################################################
+#                            SUBSCRIPTION CLIENT                            #
+#############################################################################
+
+class subscription_client():
+    """ Blocking client of the subscription server.
+
+    Args:
+        encodings (list) accepted, in order of preference
+
+    Example:
+        client = subscription_client(host, port)
+        client.subscribe('ohlcv_hitbtc2_BTC/USDT_1m')
+        for message in client.messages():
+            print(message['stream_id'], message['data'])
+
+    """
+
+    def __init__(self, host, port, encodings=SUBSCRIPTION_ENCODINGS):
+        self.socket = socket.create_connection((host, port))
+        self.stream = self.socket.makefile('rb')
+
+        self.send({'type': 'hello', 'encodings': list(encodings)})
+        self.encoding = recv_frame(self.stream)['encoding']
+
+
+    def send(self, message):
+        self.socket.sendall(encode_frame(message))
+
+
+    def subscribe(self, stream_id):
+        self.send({'type': 'subscribe', 'stream_id': stream_id})
+
+
+    def unsubscribe(self, stream_id):
+        self.send({'type': 'unsubscribe', 'stream_id': stream_id})
+
+
+    def messages(self):
+        """ Every message received, until the connection is closed.
+        """
+        while True:
+            message = recv_frame(self.stream)
+            if message is None:
+                return
+            yield message
+
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
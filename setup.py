@@ -25,10 +25,12 @@ setup(name='orbbit',
       install_requires=[
           # 'pandas',
           'ccxt',
+          'numpy',
           'flask',
           'flask_cors',
           'flask_httpauth',
           'pymongo',
+          # 'msgpack', # optional, compact subscription messages
           # 'matplotlib',
           'python-telegram-bot',
           'telethon',
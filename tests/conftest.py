@@ -0,0 +1,22 @@
+# Importing orbbit starts the DataManager (database, exchanges, servers), so
+# the tests import its modules without running the __init__ of its packages.
+# Their runtime data goes to a temporary ORBBIT_DATA_DIR, and the candles to
+# the sqlite backend, no database server is needed.
+
+import os
+import sys
+import types
+import tempfile
+
+PACKAGE_ROUTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'orbbit')
+
+os.environ['ORBBIT_DATA_DIR'] = tempfile.mkdtemp(prefix='orbbit_tests_')
+os.environ['ORBBIT_STORAGE_BACKEND'] = 'sqlite'
+
+for package, route in (('orbbit', PACKAGE_ROUTE),
+                       ('orbbit.common', os.path.join(PACKAGE_ROUTE, 'common')),
+                       ('orbbit.DataManager', os.path.join(PACKAGE_ROUTE, 'DataManager')),
+                      ):
+    module = types.ModuleType(package)
+    module.__path__ = [route]
+    sys.modules[package] = module
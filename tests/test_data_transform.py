@@ -0,0 +1,130 @@
+import json
+import numpy as np
+
+from   orbbit.DataManager.data_transform.data_transform import *
+
+
+
+def candles(count, seed=2):
+    random = np.random.RandomState(seed)
+    close = 100 + np.cumsum(random.normal(0, 1, count))
+    high = close + random.uniform(0, 2, count)
+    low = close - random.uniform(0, 2, count)
+    return high, low, close
+
+
+
+def run_stream(stream, *columns):
+    return [stream.update(*values) for values in zip(*columns)]
+
+
+def stacked(outputs, key=None):
+    return np.array([output if key is None else output[key] for output in outputs], dtype=np.float64)
+
+
+def assert_same(batch, streamed):
+    assert np.array_equal(np.asarray(batch, dtype=np.float64), streamed, equal_nan=True)
+
+
+
+def test_EMA_stream_matches_history():
+    high, low, close = candles(5000)
+    for n_periods in (1, 2, 12, 26, 200):
+        assert_same(EMA_history(n_periods, close), stacked(run_stream(EMA_stream(n_periods), close)))
+
+
+def test_EMA_stream_extend_matches_history():
+    high, low, close = candles(5000)
+    ema = EMA_stream(26)
+    streamed = np.concatenate([ema.extend(close[:1234]), stacked(run_stream(ema, close[1234:2000])), ema.extend(close[2000:])])
+    assert_same(EMA_history(26, close), streamed)
+
+
+def test_EMA_tick_is_close_to_history():
+    high, low, close = candles(500)
+    ema = close[0]
+    for value in close[1:]:
+        ema = EMA_tick(26, value, ema)
+    assert abs(ema - EMA_history(26, close)[-1]) < 1e-9
+
+
+def test_SMA_stream_matches_history():
+    high, low, close = candles(500)
+    assert_same(SMA_history(20, close), stacked(run_stream(SMA_stream(20), close)))
+
+
+def test_MACD_stream_matches_history():
+    high, low, close = candles(3000)
+    batch = MACD_history(12, 26, 9, close)
+    streamed = run_stream(MACD_stream(12, 26, 9), close)
+    for key in batch:
+        assert_same(batch[key], stacked(streamed, key))
+
+
+def test_RSI_stream_matches_history():
+    high, low, close = candles(3000)
+    assert_same(RSI_history(14, close), stacked(run_stream(RSI_stream(14), close)))
+
+
+def test_bollinger_stream_matches_history():
+    high, low, close = candles(500)
+    batch = bollinger_history(20, 2, close)
+    streamed = run_stream(bollinger_stream(20, 2), close)
+    for key in batch:
+        assert_same(batch[key], stacked(streamed, key))
+
+
+def test_ATR_stream_matches_history():
+    high, low, close = candles(3000)
+    assert_same(ATR_history(14, high, low, close), stacked(run_stream(ATR_stream(14), high, low, close)))
+
+
+def test_donchian_stream_matches_history():
+    high, low, close = candles(500)
+    batch = donchian_history(20, high, low)
+    streamed = run_stream(donchian_stream(20), high, low)
+    for key in batch:
+        assert_same(batch[key], stacked(streamed, key))
+
+
+def test_short_histories():
+    assert len(EMA_history(12, [])) == 0
+    assert len(RSI_history(14, [])) == 0
+    assert np.isnan(SMA_history(20, [1.0, 2.0])).all()
+    assert np.isnan(donchian_history(20, [1.0], [0.5])['upper']).all()
+
+
+
+def restored(make_stream, stream):
+    copy = make_stream()
+    copy.restore(json.loads(json.dumps(stream.state())))
+    return copy
+
+
+def test_restored_streams_go_on_bit_for_bit():
+    high, low, close = candles(1000)
+    streams = {'ema':       (lambda: EMA_stream(26), (close,)),
+               'sma':       (lambda: SMA_stream(20), (close,)),
+               'macd':      (lambda: MACD_stream(12, 26, 9), (close,)),
+               'rsi':       (lambda: RSI_stream(14), (close,)),
+               'bollinger': (lambda: bollinger_stream(20, 2), (close,)),
+               'atr':       (lambda: ATR_stream(14), (high, low, close)),
+               'donchian':  (lambda: donchian_stream(20), (high, low)),
+              }
+
+    for name, (make_stream, columns) in streams.items():
+        for cut in (0, 1, 377, 999):
+            stream = make_stream()
+            run_stream(stream, *[column[:cut] for column in columns])
+            copy = restored(make_stream, stream)
+
+            expected = run_stream(stream, *[column[cut:] for column in columns])
+            assert repr(run_stream(copy, *[column[cut:] for column in columns])) == repr(expected), name
+
+
+def test_restored_EMA_continues_history():
+    high, low, close = candles(5000)
+    ema = EMA_stream(26)
+    first = ema.extend(close[:2500])
+    rest = restored(lambda: EMA_stream(26), ema).extend(close[2500:])
+    assert_same(EMA_history(26, close), np.concatenate([first, rest]))
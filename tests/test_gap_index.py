@@ -0,0 +1,71 @@
+import random
+
+from   orbbit.DataManager.gap_index.gap_index import *
+
+
+M = 60000
+
+
+
+def test_find_gaps_example():
+    assert find_gaps([0, M, 4 * M], M, 0, 5 * M) == [[2 * M, 3 * M], [5 * M, 5 * M]]
+
+
+def test_find_gaps_complete():
+    assert find_gaps([0, M, 2 * M], M, 0, 2 * M) == []
+
+
+def test_find_gaps_empty():
+    assert find_gaps([], M, 0, 3 * M) == [[0, 3 * M]]
+
+
+def test_find_gaps_rounds_from_up_and_to_down():
+    assert find_gaps([2 * M], M, M + 1, 4 * M - 1) == [[3 * M, 3 * M]]
+
+
+def test_find_gaps_ignores_candles_out_of_range():
+    assert find_gaps([-M, 0, 3 * M, 9 * M], M, 0, 3 * M) == [[M, 2 * M]]
+
+
+def test_gap_requests_merges_close_gaps():
+    gaps = [[M, M], [3 * M, 4 * M]]
+    assert gap_requests(gaps, M, 10) == [(M, 4)]
+
+
+def test_gap_requests_splits_far_gaps():
+    gaps = [[0, 0], [20 * M, 21 * M]]
+    assert gap_requests(gaps, M, 10) == [(0, 1), (20 * M, 2)]
+
+
+def test_gap_requests_splits_long_gaps():
+    assert gap_requests([[0, 24 * M]], M, 10) == [(0, 10), (10 * M, 10), (20 * M, 5)]
+
+
+def test_gap_requests_cover_every_gap():
+    random.seed(3)
+    for attempt in range(200):
+        stored = sorted(random.sample(range(100), random.randint(0, 100)))
+        gaps = find_gaps([t * M for t in stored], M, 0, 99 * M)
+        data_limit = random.randint(1, 30)
+
+        requested = set()
+        for since, limit in gap_requests(gaps, M, data_limit):
+            assert 1 <= limit <= data_limit
+            requested |= set(range(since, since + limit * M, M))
+
+        missing = {t * M for t in range(100)} - {t * M for t in stored}
+        assert missing <= requested
+
+
+def test_subtract_ranges():
+    gaps = [[0, 9 * M]]
+    assert subtract_ranges(gaps, [[3 * M, 4 * M]], M) == [[0, 2 * M], [5 * M, 9 * M]]
+    assert subtract_ranges(gaps, [[0, 9 * M]], M) == []
+    assert subtract_ranges(gaps, [[-5 * M, 2 * M], [8 * M, 20 * M]], M) == [[3 * M, 7 * M]]
+    assert subtract_ranges(gaps, [[20 * M, 30 * M]], M) == [[0, 9 * M]]
+
+
+def test_filter_missing():
+    gaps = [[M, 2 * M], [5 * M, 5 * M]]
+    ohlcv = [[t * M, 1, 1, 1, 1, 1] for t in range(7)]
+    assert [candle[0] for candle in filter_missing(ohlcv, gaps)] == [M, 2 * M, 5 * M]
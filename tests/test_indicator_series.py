@@ -0,0 +1,66 @@
+import os
+import json
+import numpy as np
+
+from   orbbit.DataManager.data_transform.data_transform import *
+from   orbbit.DataManager.indicator_series.indicator_series import *
+
+
+M = 60000
+
+
+
+def test_extended_series_matches_history(tmp_path):
+    close = 100 + np.cumsum(np.random.RandomState(4).normal(0, 1, 1000))
+    date8061 = np.arange(1000, dtype=np.int64) * M
+    series = indicator_series(str(tmp_path / 'ema_12'))
+
+    assert series.newest() is None and series.state() is None
+    for first, last in ((0, 1), (1, 400), (400, 401), (401, 1000)):
+        ema = EMA_stream(12)
+        if series.state() is not None:
+            ema.restore(series.state())
+        series.append(date8061[first:last], ema.extend(close[first:last]), ema.state())
+
+    assert series.newest() == 999 * M
+    read_date8061, values = series.read(0, 999 * M)
+    assert np.array_equal(read_date8061, date8061)
+    assert np.array_equal(values, EMA_history(12, close))
+
+    read_date8061, values = series.read(10 * M + 1, 20 * M)
+    assert read_date8061.tolist() == list(range(11 * M, 21 * M, M))
+
+
+def test_append_only_writes_the_new_values(tmp_path):
+    series = indicator_series(str(tmp_path / 'ema_12'))
+    series.append(np.array([0, M]), np.array([1.0, 2.0]), {'n': 2})
+    date8061, values = series.read(0, M)
+
+    series.append(np.array([2 * M]), np.array([3.0]), {'n': 3})
+    assert os.path.getsize(str(tmp_path / 'ema_12' / 'date8061.bin')) == 3 * 8
+    assert values.tolist() == [1.0, 2.0]
+    assert series.state() == {'n': 3}
+
+
+def test_interrupted_append_is_overwritten(tmp_path):
+    series = indicator_series(str(tmp_path / 'ema_12'))
+    series.append(np.array([0]), np.array([1.0]), {'n': 1})
+
+    # values written, meta.json not
+    with open(str(tmp_path / 'ema_12' / 'date8061.bin'), 'ab') as f:
+        f.write(np.array([M, 2 * M], dtype='<i8').tobytes())
+    assert series.newest() == 0
+
+    series.append(np.array([M]), np.array([5.0]), {'n': 2})
+    assert series.read(0, 9 * M)[1].tolist() == [1.0, 5.0]
+
+
+def test_older_npy_series_are_computed_again(tmp_path):
+    route = tmp_path / 'ema_12'
+    route.mkdir()
+    np.save(str(route / 'date8061.npy'), np.array([0]))
+    with open(str(route / 'meta.json'), 'w') as f:
+        json.dump({'count': 1, 'state': {'n': 1}}, f)
+
+    series = indicator_series(str(route))
+    assert series.newest() is None and series.state() is None
@@ -0,0 +1,111 @@
+import os
+import json
+import numpy as np
+
+from   orbbit.common.common import *
+
+
+M = 60000
+BUCKET = M * OHLCV_BUCKET_CANDLES
+START = 1514764800000
+
+
+
+def candles(count, start=START, close=0.0):
+    return [[start + i * M, 1.0, 2.0, 0.5, close + i, 3.0] for i in range(count)]
+
+
+def stored(symbol, ohlcv):
+    storage.write_ohlcv('test', symbol, M, [candle_to_document(candle, '1m') for candle in ohlcv])
+
+
+
+def test_append_and_read(tmp_path):
+    archive = ohlcv_archive(str(tmp_path))
+    assert archive.newest() is None
+
+    assert archive.append(candles(10)) == []
+    assert archive.append(candles(5, start=START + 10 * M, close=10.0)) == []
+    assert archive.newest() == START + 14 * M
+
+    columns = archive.read(START + 3 * M, START + 5 * M)
+    assert columns['date8061'].tolist() == [START + 3 * M, START + 4 * M, START + 5 * M]
+    assert columns['close'].tolist() == [3.0, 4.0, 5.0]
+    assert document_to_candle(archive_to_documents(columns, '1m')[0]) == candles(1, START + 3 * M, 3.0)[0]
+
+
+def test_older_candles_go_to_late_json(tmp_path):
+    archive = ohlcv_archive(str(tmp_path))
+    archive.append(candles(10))
+
+    changed = candles(1, START + 2 * M, close=-1.0)
+    late = archive.append(candles(3) + changed + candles(2, start=START + 10 * M, close=10.0))
+
+    assert late == changed
+    assert archive.read(START + 2 * M, START + 2 * M)['close'].tolist() == [2.0]
+    assert archive.newest() == START + 11 * M
+    with open(str(tmp_path / 'late.json')) as f:
+        assert [json.loads(line) for line in f] == changed
+
+
+def test_appends_keep_read_columns(tmp_path):
+    archive = ohlcv_archive(str(tmp_path))
+    archive.append(candles(10))
+    before = archive.columns()['close']
+
+    archive.append(candles(10, start=START + 10 * M, close=10.0))
+    assert before.tolist() == list(np.arange(10.0))
+    assert len(archive.columns()['close']) == 20
+
+
+def test_interrupted_append_is_overwritten(tmp_path):
+    archive = ohlcv_archive(str(tmp_path))
+    archive.append(candles(3))
+
+    # columns written, meta.json not
+    with open(str(tmp_path / 'date8061.bin'), 'ab') as f:
+        f.write(np.array([START + 7 * M], dtype='<i8').tobytes())
+    assert archive.newest() == START + 2 * M
+
+    archive.append(candles(1, start=START + 3 * M, close=3.0))
+    assert archive.columns()['date8061'].tolist() == [START + i * M for i in range(4)]
+    assert os.path.getsize(str(tmp_path / 'date8061.bin')) == 4 * 8
+
+
+def test_reads_stitch_archive_and_database():
+    ohlcv = candles(3 * OHLCV_BUCKET_CANDLES)
+    stored('STITCH/USDT', ohlcv)
+
+    assert archive_ohlcv('STITCH/USDT', 'test', '1m', START + 2 * BUCKET + 5 * M) == 2 * OHLCV_BUCKET_CANDLES
+    archive = ohlcv_archive(archive_route('test', 'STITCH/USDT', '1m'))
+    assert archive.newest() == START + 2 * BUCKET - M
+    assert storage.oldest_ohlcv('test', 'STITCH/USDT', '1m', M) == START + 2 * BUCKET
+
+    for from_millis, to_millis in ((START, START + 3 * BUCKET - M),
+                                   (START + 2 * BUCKET - 3 * M, START + 2 * BUCKET + 2 * M),
+                                   (START + 10 * M, START + 20 * M),
+                                   (START + 2 * BUCKET + M, START + 2 * BUCKET + 9 * M),
+                                  ):
+        expected = [candle for candle in ohlcv if from_millis <= candle[0] <= to_millis]
+
+        assert [document_to_candle(document) for document in read_stored_ohlcv('STITCH/USDT', 'test', '1m', from_millis, to_millis)] == expected
+
+        # limits not included
+        assert [document_to_candle(document) for document in get_db_ohlcv('STITCH/USDT', 'test', '1m', from_millis, to_millis)] == expected[1:-1]
+
+        columns = get_ohlcv_arrays('STITCH/USDT', 'test', '1m', from_millis, to_millis)
+        assert columns['date8061'].tolist() == [candle[0] for candle in expected]
+        assert columns['close'].tolist() == [candle[4] for candle in expected]
+
+
+def test_archive_without_delete_copies_only_new_candles():
+    ohlcv = candles(3 * OHLCV_BUCKET_CANDLES)
+    stored('COPY/USDT', ohlcv)
+
+    assert archive_ohlcv('COPY/USDT', 'test', '1m', START + BUCKET, delete=False) == OHLCV_BUCKET_CANDLES
+    assert archive_ohlcv('COPY/USDT', 'test', '1m', START + 2 * BUCKET, delete=False) == OHLCV_BUCKET_CANDLES
+
+    assert storage.oldest_ohlcv('test', 'COPY/USDT', '1m', M) == START
+    archive = ohlcv_archive(archive_route('test', 'COPY/USDT', '1m'))
+    assert archive.columns()['date8061'].tolist() == [candle[0] for candle in ohlcv[:2 * OHLCV_BUCKET_CANDLES]]
+    assert not os.path.exists(os.path.join(archive.route, 'late.json'))
@@ -0,0 +1,115 @@
+import pymongo
+
+from   orbbit.common.ohlcv_storage import *
+
+
+M = 60000
+H = 60 * M
+BUCKET = M * OHLCV_BUCKET_CANDLES
+START = 1514764800000 # a bucket start of 1m
+
+
+
+class bucket_collection():
+    """ The _id range reads of a collection of compact buckets.
+    """
+
+    def __init__(self, bucket_documents):
+        self.bucket_documents = bucket_documents
+
+    def find(self, query):
+        bounds = query['_id']
+        return [document for document in self.bucket_documents if bounds['$gte'] <= document['_id'] <= bounds['$lte']]
+
+
+
+def documents(*dates):
+    return [{'date8061': date8061, 'ohlcv': {'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': float(date8061), 'volume': 3.0}}
+            for date8061 in dates]
+
+
+def buckets_of(new_documents, timeframe_millis):
+    """ Bucket documents as the updates of bucket_updates leave them.
+    """
+    buckets = {}
+    for update in bucket_updates(new_documents, timeframe_millis):
+        bucket = buckets.setdefault(update._filter['_id'], {'_id': update._filter['_id'], 'c': {}})
+        for field, value in update._doc['$set'].items():
+            bucket['c'][field.split('.')[1]] = value
+    return list(buckets.values())
+
+
+
+def test_compact_id():
+    assert compact_id(M, START) == 601514764800
+    assert compact_id(H, START) == 36001514764800
+
+    for timeframe_millis in (M, 5 * M, H, 24 * H):
+        for start in (0, START, bucket_start(START + 123456789, timeframe_millis)):
+            assert compact_id_start(compact_id(timeframe_millis, start), timeframe_millis) == start
+
+
+def test_compact_ids_of_a_timeframe_are_contiguous():
+    ids = [compact_id(M, START + i * BUCKET) for i in range(3)]
+    assert ids == sorted(ids)
+    assert compact_id(5 * M, 0) > compact_id(M, START + 1000 * BUCKET)
+
+
+def test_bucket_start():
+    assert bucket_start(START, M) == START
+    assert bucket_start(START + BUCKET - 1, M) == START
+    assert bucket_start(START + BUCKET, M) == START + BUCKET
+
+
+def test_bucket_updates():
+    new_documents = documents(START, START + 2 * M, START + BUCKET + M)
+    assert bucket_updates(new_documents, M) == [
+        pymongo.UpdateOne({'_id': compact_id(M, START)},
+                          {'$set': {'c.0': [1.0, 2.0, 0.5, float(START), 3.0],
+                                    'c.2': [1.0, 2.0, 0.5, float(START + 2 * M), 3.0]}}, upsert=True),
+        pymongo.UpdateOne({'_id': compact_id(M, START + BUCKET)},
+                          {'$set': {'c.1': [1.0, 2.0, 0.5, float(START + BUCKET + M), 3.0]}}, upsert=True),
+    ]
+
+
+def test_unpack_candles():
+    candles = {'0': [1, 2, 0.5, 1.5, 3], '5': [1, 2, 0.5, 1.5, 3], '9': [1, 2, 0.5, 1.5, 3]}
+    unpacked = unpack_candles(candles, START, '1m', M, START + M, START + 9 * M)
+    assert sorted(unpacked) == [START + 5 * M, START + 9 * M]
+    assert unpacked[START + 5 * M] == {'_id': '1m_' + str(START + 5 * M),
+                                       'date8061': START + 5 * M,
+                                       'ohlcv': {'open': 1, 'high': 2, 'low': 0.5, 'close': 1.5, 'volume': 3}}
+
+
+def test_ranges_across_bucket_edges():
+    dates = [START + i * M for i in range(3 * OHLCV_BUCKET_CANDLES)]
+    collection = bucket_collection(buckets_of(documents(*dates), M))
+
+    for from_millis, to_millis in ((START, START + 3 * BUCKET - M),      # everything
+                                   (START + BUCKET - M, START + BUCKET), # the last and first candle of two buckets
+                                   (START + 10 * M + 1, START + 2 * BUCKET + 5 * M - 1),
+                                   (START + BUCKET, START + BUCKET),
+                                   (START - BUCKET, START - M),          # before the first bucket
+                                  ):
+        read = read_compact_documents(collection, '1m', M, from_millis, to_millis)
+        assert sorted(read) == [date8061 for date8061 in dates if from_millis <= date8061 <= to_millis]
+        assert all(read[date8061]['ohlcv']['close'] == float(date8061) for date8061 in read)
+
+
+def test_compact_query_reads_only_the_buckets_of_the_range():
+    query = compact_query(M, START + BUCKET + 5 * M, START + 2 * BUCKET)
+    assert query['_id']['$gte'] == compact_id(M, START + BUCKET)
+    assert query['_id']['$lte'] == compact_id(M, START + 2 * BUCKET)
+
+    query = compact_query(M, START + BUCKET + 5 * M, START + 2 * BUCKET - 1)
+    assert query['_id']['$lte'] < compact_id(M, START + 2 * BUCKET)
+
+
+def test_refreshed_candle_replaces_its_position():
+    first = buckets_of(documents(START + M), M)
+    refreshed = documents(START + M)
+    refreshed[0]['ohlcv']['close'] = -1.0
+
+    bucket, = buckets_of(refreshed, M)
+    assert list(bucket['c']) == list(first[0]['c']) == ['1']
+    assert bucket['c']['1'][3] == -1.0
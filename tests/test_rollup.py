@@ -0,0 +1,100 @@
+import random
+
+from   orbbit.DataManager.rollup.rollup import *
+
+
+M = 60000
+H = 60 * M
+
+
+
+def candles_1m(count, start=0, seed=5):
+    random.seed(seed)
+    ohlcv = []
+    for i in range(count):
+        open_price = random.uniform(90, 110)
+        close = random.uniform(90, 110)
+        ohlcv.append([start + i * M, open_price, max(open_price, close) + random.uniform(0, 5),
+                      min(open_price, close) - random.uniform(0, 5), close, random.uniform(0, 10)])
+    return ohlcv
+
+
+
+def test_candle_bucket():
+    assert candle_bucket(0, H) == 0
+    assert candle_bucket(H - 1, H) == 0
+    assert candle_bucket(H + 5 * M, H) == H
+
+
+def test_rollup_candles():
+    ohlcv = candles_1m(150)
+    rolled = rollup_candles(ohlcv, H)
+
+    assert [candle[0] for candle in rolled] == [0, H, 2 * H]
+    for candle, parts in zip(rolled, (ohlcv[0:60], ohlcv[60:120], ohlcv[120:150])):
+        assert candle[1] == parts[0][1]
+        assert candle[2] == max(part[2] for part in parts)
+        assert candle[3] == min(part[3] for part in parts)
+        assert candle[4] == parts[-1][4]
+        assert abs(candle[5] - sum(part[5] for part in parts)) < 1e-9
+
+
+def test_rollup_candles_does_not_modify_its_input():
+    ohlcv = candles_1m(10)
+    copy = [list(candle) for candle in ohlcv]
+    rollup_candles(ohlcv, H)
+    assert ohlcv == copy
+
+
+def test_candle_rollup_matches_rollup_candles():
+    ohlcv = candles_1m(150)
+    rollup = candle_rollup(H)
+
+    closed = []
+    for candle in ohlcv:
+        rollup.update(candle)
+        closed += rollup.pop_closed(candle[0] + M)
+
+    assert closed == rollup_candles(ohlcv, H)[:2]
+    assert rollup.current() == rollup_candles(ohlcv, H)[2]
+
+
+def test_candle_rollup_replaces_updated_parts():
+    ohlcv = candles_1m(3)
+    rollup = candle_rollup(H)
+
+    for candle in ohlcv:
+        rollup.update(candle)
+    rollup.update([2 * M, 1, 200, 0.5, 2, 1]) # the open part, updated
+
+    current = rollup.current()
+    assert current[2] == 200
+    assert current[3] == 0.5
+    assert current[4] == 2
+    assert abs(current[5] - (ohlcv[0][5] + ohlcv[1][5] + 1)) < 1e-9
+
+
+def test_candle_rollup_without_overwrite_keeps_parts():
+    rollup = candle_rollup(H)
+    rollup.update([0, 1, 2, 0.5, 1.5, 10])
+    rollup.update([0, 1, 9, 0.1, 5, 99], overwrite=False)
+    assert rollup.current() == [0, 1, 2, 0.5, 1.5, 10]
+
+
+def test_candle_rollup_ignores_older_candles():
+    rollup = candle_rollup(H)
+    rollup.update([H, 1, 2, 0.5, 1.5, 10])
+    rollup.update([H - M, 1, 9, 0.1, 5, 99])
+    assert rollup.current() == [H, 1, 2, 0.5, 1.5, 10]
+
+    assert rollup.pop_closed(2 * H) == [[H, 1, 2, 0.5, 1.5, 10]]
+    rollup.update([H + M, 1, 9, 0.1, 5, 99])
+    assert rollup.current() is None
+
+
+def test_candle_rollup_closes_only_once_ended():
+    rollup = candle_rollup(H)
+    rollup.update([0, 1, 2, 0.5, 1.5, 10])
+    assert rollup.pop_closed(H - 1) == []
+    assert rollup.pop_closed(H) == [[0, 1, 2, 0.5, 1.5, 10]]
+    assert rollup.pop_closed(2 * H) == []
@@ -0,0 +1,89 @@
+import io
+import asyncio
+
+import pytest
+
+from   orbbit.common.subscription_protocol import *
+
+
+OHLCV_DATA = {'date8061': 1514764800000,
+              'ohlcv': {'open': 13800.5, 'high': 13900.25, 'low': 13750.0, 'close': 13880.125, 'volume': 12.5}}
+
+MACD_DATA = {'date8061': 1514764800000,
+             'macd': {'macd': -1.5, 'ema_fast': 13870.0, 'ema_slow': 13871.5, 'cross': 1, 'rising': 0},
+             'ohlcv': OHLCV_DATA['ohlcv']}
+
+MESSAGES = [{'type': 'data', 'stream_id': 'ohlcv_hitbtc2_BTC/USDT_1m', 'data': OHLCV_DATA},
+            {'type': 'data', 'stream_id': 'macd_hitbtc2_BTC/USDT_1m_12_26', 'data': MACD_DATA},
+            {'type': 'data', 'stream_id': 'ema_hitbtc2_BTC/USDT_1m_12', 'data': {'date8061': 0, 'ema': 1.5}},
+            {'type': 'subscribe', 'res': 'macd', 'params': {'exchange': 'hitbtc2', 'symbol': 'BTC/USDT'}},
+            {'type': 'error', 'error': 'Stream not available.', 'request': {'type': 'subscribe'}},
+           ]
+
+
+
+def decoded(frame):
+    return recv_frame(io.BytesIO(frame))
+
+
+
+@pytest.mark.parametrize('encoding', SUBSCRIPTION_ENCODINGS)
+@pytest.mark.parametrize('message', MESSAGES)
+def test_round_trip(encoding, message):
+    assert decoded(encode_frame(message, encoding)) == message
+
+
+def test_struct_frames_have_a_fixed_layout():
+    ohlcv_frame = encode_frame(MESSAGES[0], 'struct')
+    macd_frame = encode_frame(MESSAGES[1], 'struct')
+    assert FRAME_HEADER.unpack_from(ohlcv_frame)[1] == FRAME_OHLCV
+    assert FRAME_HEADER.unpack_from(macd_frame)[1] == FRAME_MACD
+
+    # any other message is sent as JSON
+    assert FRAME_HEADER.unpack_from(encode_frame(MESSAGES[2], 'struct'))[1] == FRAME_JSON
+    incomplete = {'type': 'data', 'stream_id': 'x', 'data': {'date8061': 0, 'ohlcv': {'open': 1}}}
+    assert decoded(encode_frame(incomplete, 'struct')) == incomplete
+
+
+def test_frames_in_sequence():
+    stream = io.BytesIO(b''.join(encode_frame(message, encoding) for message in MESSAGES for encoding in SUBSCRIPTION_ENCODINGS))
+    for message in MESSAGES:
+        for encoding in SUBSCRIPTION_ENCODINGS:
+            assert recv_frame(stream) == message
+    assert recv_frame(stream) is None
+
+
+def test_truncated_frame():
+    frame = encode_frame(MESSAGES[0], 'json')
+    assert decoded(frame[:-1]) is None
+    assert decoded(frame[:2]) is None
+
+
+def test_corrupt_frames():
+    with pytest.raises(ValueError):
+        decoded(FRAME_HEADER.pack(SUBSCRIPTION_FRAME_MAX + 1, FRAME_JSON))
+    with pytest.raises(ValueError):
+        decoded(frame_payload(99, b'{}'))
+
+
+def test_read_frame():
+    async def read_all(frames):
+        reader = asyncio.StreamReader()
+        reader.feed_data(frames)
+        reader.feed_eof()
+        messages = []
+        while True:
+            message = await read_frame(reader)
+            if message is None:
+                return messages
+            messages.append(message)
+
+    frames = b''.join(encode_frame(message, 'struct') for message in MESSAGES)
+    assert asyncio.run(read_all(frames)) == MESSAGES
+
+
+def test_negotiate_encoding():
+    assert negotiate_encoding(None) == 'json'
+    assert negotiate_encoding(['cbor']) == 'json'
+    assert negotiate_encoding(['cbor', 'struct', 'json']) == 'struct'
+    assert negotiate_encoding(['json', 'struct']) == 'json'
@@ -0,0 +1,73 @@
+from   orbbit.common.subscription_protocol import *
+from   orbbit.DataManager.subscription_server.subscription_server import *
+
+
+OHLCV_DATA = {'date8061': 0, 'ohlcv': {'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5, 'volume': 3.0}}
+
+
+
+def subscribe(message):
+    if message.get('stream_id') == 'failing':
+        raise RuntimeError('subscribe failed')
+    if message.get('stream_id') == 'missing':
+        return None
+    return message.get('stream_id')
+
+
+def started_server():
+    server = subscription_server('127.0.0.1', 0, subscribe)
+    server.start()
+    server.started.wait(5)
+    return server, server.server.sockets[0].getsockname()[1]
+
+
+def connected(port, encodings=SUBSCRIPTION_ENCODINGS):
+    client = subscription_client('127.0.0.1', port, encodings)
+    client.socket.settimeout(5)
+    return client, client.messages()
+
+
+
+def test_subscribe_and_receive():
+    server, port = started_server()
+    for encoding in SUBSCRIPTION_ENCODINGS:
+        client, messages = connected(port, [encoding])
+        assert client.encoding == encoding
+
+        client.subscribe('ohlcv_hitbtc2_BTC/USDT_1m')
+        assert next(messages) == {'type': 'subscribed', 'stream_id': 'ohlcv_hitbtc2_BTC/USDT_1m'}
+
+        server.publish('ohlcv_hitbtc2_BTC/USDT_1m', OHLCV_DATA)
+        assert next(messages) == {'type': 'data', 'stream_id': 'ohlcv_hitbtc2_BTC/USDT_1m', 'data': OHLCV_DATA}
+        client.close()
+
+
+def test_failing_messages_get_an_error_and_keep_the_connection():
+    server, port = started_server()
+    client, messages = connected(port)
+
+    client.subscribe('failing')
+    error = next(messages)
+    assert error['type'] == 'error'
+    assert 'subscribe failed' in error['error']
+    assert error['request'] == {'type': 'subscribe', 'stream_id': 'failing'}
+
+    client.subscribe('missing')
+    assert next(messages)['error'] == 'Stream not available.'
+
+    client.send({'type': 'what'})
+    assert next(messages)['error'] == 'Invalid message type.'
+
+    client.subscribe('ohlcv_hitbtc2_BTC/USDT_1m')
+    assert next(messages)['type'] == 'subscribed'
+    server.publish('ohlcv_hitbtc2_BTC/USDT_1m', OHLCV_DATA)
+    assert next(messages)['data'] == OHLCV_DATA
+    assert server.status()['connections'] == 1
+
+
+def test_corrupt_stream_closes_the_connection():
+    server, port = started_server()
+    client, messages = connected(port)
+
+    client.socket.sendall(FRAME_HEADER.pack(SUBSCRIPTION_FRAME_MAX + 1, FRAME_JSON))
+    assert list(messages) == []
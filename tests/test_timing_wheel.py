@@ -0,0 +1,51 @@
+import random
+
+from   orbbit.DataManager.timing_wheel.timing_wheel import *
+
+
+
+def test_expires_at_deadline():
+    wheel = timing_wheel(100)
+    wheel.schedule(250, 'a')
+    assert wheel.advance(200) == []
+    assert wheel.advance(300) == ['a']
+    assert wheel.pending == 0
+
+
+def test_past_deadline_expires_on_next_tick():
+    wheel = timing_wheel(100, start_millis=1000)
+    wheel.schedule(0, 'late')
+    assert wheel.advance(1100) == ['late']
+
+
+def test_deadline_order_across_wheels_and_overflow():
+    wheel = timing_wheel(1, wheel_size=4, levels=2)
+    random.seed(7)
+    deadlines = random.sample(range(1, 200), 60) # many beyond 4 ** 2 ticks, in the heap
+
+    for deadline in deadlines:
+        wheel.schedule(deadline, deadline)
+    assert wheel.pending == len(deadlines)
+
+    expired = []
+    previous = 0
+    for now in range(3, 201, 3):
+        items = wheel.advance(now)
+        assert all(previous < item <= now for item in items)
+        expired += items
+        previous = now
+
+    assert sorted(expired) == sorted(deadlines)
+    assert wheel.pending == 0
+
+
+def test_each_item_expires_in_its_tick():
+    wheel = timing_wheel(10, wheel_size=8, levels=3)
+    random.seed(11)
+    deadlines = [random.randint(1, 20000) for i in range(500)]
+    for deadline in deadlines:
+        wheel.schedule(deadline, deadline)
+
+    for now in range(10, 20010, 10):
+        expired = wheel.advance(now)
+        assert all(now - 10 < deadline <= now for deadline in expired)
@@ -0,0 +1,126 @@
+import numpy as np
+
+from   orbbit.DataManager.data_transform.data_transform import *
+from   orbbit.DataManager.transform_graph.transform_graph import *
+
+
+M = 60000
+SOURCE = 'ohlcv_hitbtc2_BTC/USDT_1m'
+
+
+
+def candles(count, seed=6):
+    close = 100 + np.cumsum(np.random.RandomState(seed).normal(0, 1, count))
+    return [{'date8061': i * M, 'ohlcv': {'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': float(value), 'volume': 1.0}}
+            for i, value in enumerate(close)]
+
+
+def ema_make_update(n_periods, checkpoint, history):
+    def make_update():
+        ema = EMA_stream(n_periods)
+        return catch_up(ema, lambda candle: float(ema.update(candle['ohlcv']['close'])), checkpoint, history)
+    return make_update
+
+
+def build(graph, checkpoints, history):
+    """ Two EMAs and their difference, as the nodes of a MACD stream.
+    """
+    emas = [graph.node('ema_' + str(n_periods) + '_' + SOURCE, [SOURCE], ema_make_update(n_periods, checkpoints.get('ema_' + str(n_periods) + '_' + SOURCE), history))
+            for n_periods in (12, 26)]
+
+    def make_update():
+        # as macd_node, from where the EMAs are
+        dates = [ema.date8061 for ema in emas]
+        return (lambda candle, fast, slow: fast - slow), None, (None if None in dates else min(dates)), None
+    return graph.node('macd_12_26_' + SOURCE, [SOURCE, 'ema_12_' + SOURCE, 'ema_26_' + SOURCE], make_update)
+
+
+def run(graph, node, ticks):
+    values = {}
+    for candle in ticks:
+        graph.tick(SOURCE, candle)
+        values[candle['date8061']] = node.value
+    return values
+
+
+
+def test_nodes_are_shared_and_updated_in_order():
+    graph = transform_graph()
+    macd = build(graph, checkpoint_store('/nonexistent/checkpoints.json'), [])
+    build(graph, checkpoint_store('/nonexistent/checkpoints.json'), [])
+    assert len(graph.nodes) == 3
+
+    ohlcv = candles(3)
+    updated = graph.tick(SOURCE, ohlcv[0])
+    assert sorted(updated) == sorted(graph.nodes) and updated[-1] == 'macd_12_26_' + SOURCE
+    assert graph.tick(SOURCE, ohlcv[0]) == [] # not newer than the last one
+    assert graph.nodes['macd_12_26_' + SOURCE].value == macd.value == 0.0
+    assert graph.sources(macd.node_id) == {SOURCE}
+
+
+def test_warm_up_matches_ticking_from_the_start():
+    ohlcv = candles(300)
+
+    ticked = transform_graph()
+    ticked_values = run(ticked, build(ticked, checkpoint_store('/nonexistent/checkpoints.json'), []), ohlcv)
+
+    warmed = transform_graph()
+    macd = build(warmed, checkpoint_store('/nonexistent/checkpoints.json'), ohlcv[:200])
+    assert macd.value is None and warmed.nodes['ema_12_' + SOURCE].date8061 == 199 * M
+
+    warmed_values = run(warmed, macd, ohlcv[:250]) # the warm-up candles again, skipped
+    assert set(list(warmed_values.values())[:200]) == {None}
+    warmed_values.update(run(warmed, macd, ohlcv[250:]))
+    for date8061 in range(201 * M, 300 * M, M):
+        assert warmed_values[date8061] == ticked_values[date8061]
+
+
+def test_restart_from_checkpoints_matches_an_uninterrupted_run(tmp_path):
+    ohlcv = candles(500)
+    route = str(tmp_path / 'transform_checkpoints.json')
+
+    uninterrupted = transform_graph()
+    expected = run(uninterrupted, build(uninterrupted, checkpoint_store(route + '.unused'), []), ohlcv)
+
+    # runs until candle 300, checkpoints at 280
+    before = transform_graph()
+    macd = build(before, checkpoint_store(route), [])
+    run(before, macd, ohlcv[:281])
+    checkpoint_store(route).save(before.checkpoints())
+    run(before, macd, ohlcv[281:300])
+    assert set(before.checkpoints()) == {'ema_12_' + SOURCE, 'ema_26_' + SOURCE}
+
+    # restarted at candle 400, the candles after the checkpoint are read from storage
+    after = transform_graph()
+    checkpoints = checkpoint_store(route)
+    assert checkpoints.get('ema_12_' + SOURCE)['date8061'] == 280 * M
+    macd = build(after, checkpoints, ohlcv[280:400])
+    for node_id in ('ema_12_' + SOURCE, 'ema_26_' + SOURCE):
+        assert after.nodes[node_id].date8061 == 399 * M
+        assert after.nodes[node_id].value == expected_ema(ohlcv[:400], node_id)
+
+    values = run(after, macd, ohlcv[400:])
+    for date8061 in range(401 * M, 500 * M, M):
+        assert values[date8061] == expected[date8061]
+    for node_id in ('ema_12_' + SOURCE, 'ema_26_' + SOURCE):
+        assert after.nodes[node_id].value == uninterrupted.nodes[node_id].value
+
+
+def expected_ema(ohlcv, node_id):
+    n_periods = int(node_id.split('_')[1])
+    return float(EMA_history(n_periods, [candle['ohlcv']['close'] for candle in ohlcv])[-1])
+
+
+def test_checkpoint_store_keeps_other_nodes(tmp_path):
+    route = str(tmp_path / 'checkpoints' / 'transform_checkpoints.json')
+    checkpoint_store(route).save({'a': {'date8061': 0, 'value': 1.0, 'state': {}}})
+    checkpoint_store(route).save({'b': {'date8061': M, 'value': 2.0, 'state': {}}})
+
+    checkpoints = checkpoint_store(route)
+    assert checkpoints.get('a')['value'] == 1.0
+    assert checkpoints.get('b')['date8061'] == M
+    assert checkpoints.get('c') is None
+
+    with open(route, 'w') as f:
+        f.write('{"a": ')
+    assert checkpoint_store(route).get('a') is None
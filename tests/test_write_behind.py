@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import sqlite3
+
+import pytest
+
+import orbbit.DataManager.write_behind.write_behind as write_behind_module
+from   orbbit.DataManager.write_behind.write_behind import *
+
+
+M = 60000
+
+
+
+class flaky_storage():
+    """ write_ohlcv that raises 'failure' while it is set, for the groups of 'failing_symbols'.
+    """
+
+    def __init__(self):
+        self.stored = {} # dict {(exchange_id, symbol, timeframe_millis, date8061): document, ... }
+        self.failure = None
+        self.failing_symbols = None
+        self.calls = 0
+
+    def write(self, exchange_id, symbol, timeframe_millis, new_documents):
+        self.calls += 1
+        if self.failure is not None and (self.failing_symbols is None or symbol in self.failing_symbols):
+            raise self.failure
+        for document in new_documents:
+            self.stored[(exchange_id, symbol, timeframe_millis, document['date8061'])] = document
+        return len(new_documents)
+
+    def closes(self, symbol):
+        return {key[3]: document['ohlcv']['close'] for key, document in self.stored.items() if key[1] == symbol}
+
+
+
+def documents(*closes, start=0):
+    return [{'date8061': start + i * M, 'ohlcv': {'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': close, 'volume': 1.0}}
+            for i, close in enumerate(closes)]
+
+
+def dead_lines(writer):
+    with open(writer.dead_letter_route) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def writer_of(tmp_path, monkeypatch):
+    monkeypatch.setattr(write_behind_module, 'WRITE_BEHIND_RETRY_INTERVAL', 0.05)
+    monkeypatch.setattr(write_behind_module, 'WRITE_BEHIND_GROUP_WINDOW', 0.01)
+
+    def writer_of(storage, start=True, spill_route=str(tmp_path / 'write_behind.spill'), **kwargs):
+        writer = write_behind(storage.write, (sqlite3.OperationalError,), spill_route=spill_route,
+                              dead_letter_route=str(tmp_path / 'write_behind.dead'), **kwargs)
+        if start:
+            writer.start()
+        return writer
+    return writer_of
+
+
+
+def test_newest_version_of_each_candle_is_written(writer_of):
+    storage = flaky_storage()
+    writer = writer_of(storage, start=False)
+
+    writer.put('hitbtc2', 'BTC/USDT', M, documents(1.0, 2.0))
+    writer.put('hitbtc2', 'BTC/USDT', M, documents(3.0, start=M))
+    writer.put('hitbtc2', 'ETH/USDT', M, documents(5.0))
+    writer.start()
+
+    assert writer.flush(timeout=5)
+    assert storage.closes('BTC/USDT') == {0: 1.0, M: 3.0}
+    assert storage.closes('ETH/USDT') == {0: 5.0}
+
+
+def test_spilled_while_unavailable_then_replayed(writer_of):
+    storage = flaky_storage()
+    storage.failure = sqlite3.OperationalError('database is locked')
+    writer = writer_of(storage)
+
+    first = writer.put('hitbtc2', 'BTC/USDT', M, documents(1.0, 2.0))
+    assert not writer.flush(first, timeout=5) # done, but in the spill file
+    assert writer.spilled == 2
+    assert storage.stored == {}
+
+    writer.put('hitbtc2', 'BTC/USDT', M, documents(9.0, start=M))
+    time.sleep(0.2)
+    storage.failure = None
+
+    deadline = time.time() + 5
+    while not writer.flush(timeout=0.1) and time.time() < deadline:
+        pass
+    assert writer.spilled == 0
+    assert storage.closes('BTC/USDT') == {0: 1.0, M: 9.0}
+    assert not os.path.exists(writer.spill_route)
+
+
+def test_spill_file_replayed_after_restart(writer_of, tmp_path):
+    storage = flaky_storage()
+    storage.failure = sqlite3.OperationalError('unable to open database file')
+    writer = writer_of(storage)
+    writer.put('hitbtc2', 'BTC/USDT', M, documents(1.0, 2.0))
+    writer.flush(timeout=5)
+
+    # the file as the process left it, the old writer thread still retries its own
+    with open(writer.spill_route) as f:
+        spilled = f.read()
+    with open(str(tmp_path / 'restarted.spill'), 'w') as f:
+        f.write(spilled)
+
+    restarted_storage = flaky_storage()
+    restarted = writer_of(restarted_storage, start=False, spill_route=str(tmp_path / 'restarted.spill'))
+    assert not restarted.flush(timeout=0)
+    restarted.start()
+    deadline = time.time() + 5
+    while not restarted.flush(timeout=0.1) and time.time() < deadline:
+        pass
+    assert restarted_storage.closes('BTC/USDT') == {0: 1.0, M: 2.0}
+
+
+def test_failing_batch_is_dead_lettered(writer_of):
+    storage = flaky_storage()
+    storage.failure = ValueError('document rejected')
+    writer = writer_of(storage, max_attempts=3)
+
+    writer.put('hitbtc2', 'BTC/USDT', M, documents(1.0))
+
+    deadline = time.time() + 5
+    while writer.dead == 0 and time.time() < deadline:
+        time.sleep(0.05)
+    assert writer.dead == 1
+    assert writer.spilled == 0
+    assert storage.calls == 3
+
+    line, = dead_lines(writer)
+    assert line['batch']['documents'] == documents(1.0)
+    assert 'document rejected' in line['reason']
+
+
+def test_unavailable_database_is_never_dead_lettered(writer_of):
+    storage = flaky_storage()
+    storage.failure = sqlite3.OperationalError('database is locked')
+    writer = writer_of(storage, max_attempts=2)
+
+    writer.put('hitbtc2', 'BTC/USDT', M, documents(1.0))
+    deadline = time.time() + 5
+    while storage.calls < 5 and time.time() < deadline:
+        time.sleep(0.05)
+    assert writer.dead == 0
+    assert writer.spilled == 1
+
+
+def test_invalid_spill_lines_are_dead_lettered(writer_of, tmp_path):
+    spilled = {'sequence': 1, 'exchange_id': 'hitbtc2', 'symbol': 'BTC/USDT', 'timeframe_millis': M,
+               'documents': documents(1.0), 'attempts': 0}
+    with open(str(tmp_path / 'write_behind.spill'), 'w') as f:
+        f.write(json.dumps(spilled) + '\n')
+        f.write('{"sequence": 2, "exchange_id": "hitb\n')
+
+    storage = flaky_storage()
+    writer = writer_of(storage)
+    deadline = time.time() + 5
+    while not writer.flush(timeout=0.1) and time.time() < deadline:
+        pass
+
+    assert storage.closes('BTC/USDT') == {0: 1.0}
+    line, = dead_lines(writer)
+    assert line['reason'] == 'invalid spill line'
+
+
+def test_written_groups_are_reported_when_another_fails(writer_of):
+    storage = flaky_storage()
+    storage.failure = sqlite3.OperationalError('database is locked')
+    storage.failing_symbols = {'ETH/USDT'}
+    writer = writer_of(storage, start=False)
+
+    reported = []
+    writer.put('hitbtc2', 'BTC/USDT', M, documents(1.0), on_written=lambda: reported.append('BTC/USDT'))
+    writer.put('hitbtc2', 'ETH/USDT', M, documents(2.0), on_written=lambda: reported.append('ETH/USDT'))
+    writer.start()
+    writer.flush(timeout=5)
+
+    assert reported == ['BTC/USDT']
+    assert writer.flush_latency.status()['count'] == 1
+    assert writer.spilled == 1